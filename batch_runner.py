@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, Iterator, List, Sequence
+
+# autogen-agentchat
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage
+
+# autogen_core
+from autogen_core.models import ChatCompletionClient
+
+# local
+import clients
+from client_pool import ClientPool
+from response_cache import cached_client
+from scheduler import Priority, RequestScheduler
+from semantic_cache import SemanticTaskCache
+from team1 import create_team
+
+
+def read_tasks(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the essay tasks from a JSONL file, one {"id": ..., "task": ...} object per line.
+    A missing id defaults to the line number.
+    """
+    with open(path, encoding="utf-8") as tasks_file:
+        for line_number, line in enumerate(tasks_file, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entry.setdefault("id", str(line_number))
+            yield entry
+
+
+def summarize_result(task_id: str, task: str, result: TaskResult, duration: float) -> Dict[str, Any]:
+    """
+    Turn a team result into one JSON-serializable output record with its usage stats.
+    """
+    messages: Sequence[BaseAgentEvent | BaseChatMessage] = result.messages
+    drafts = [m for m in messages if isinstance(m, BaseChatMessage) and m.source == "primary"]
+    prompt_tokens = sum(m.models_usage.prompt_tokens for m in messages if m.models_usage)
+    completion_tokens = sum(m.models_usage.completion_tokens for m in messages if m.models_usage)
+    return {
+        "id": task_id,
+        "task": task,
+        "essay": drafts[-1].to_text() if drafts else None,
+        "stop_reason": result.stop_reason,
+        "turns": sum(1 for m in messages if isinstance(m, BaseChatMessage) and m.source != "user"),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "duration_s": round(duration, 3),
+    }
+
+
+async def run_task(
+    entry: Dict[str, Any],
+    model_client: ChatCompletionClient,
+    semaphore: asyncio.Semaphore,
+    max_turns: int | None,
+    cache: SemanticTaskCache | None = None,
+) -> Dict[str, Any]:
+    """
+    Run one task on its own primary/critic team, once a slot is free.
+    With a semantic cache, a task similar to one already written is answered or warm-started from it.
+    """
+    async with semaphore:
+        # every task gets an isolated team, only the model client is shared
+        team = create_team(model_client, max_turns=max_turns)
+        start = time.perf_counter()
+        try:
+            result = await (cache.run(team, entry["task"]) if cache is not None else team.run(task=entry["task"]))
+        except Exception as e:
+            return {"id": entry["id"], "task": entry["task"], "error": f"{type(e).__name__}: {e}"}
+        return summarize_result(entry["id"], entry["task"], result, time.perf_counter() - start)
+
+
+async def run_batch(
+    entries: List[Dict[str, Any]],
+    output_path: str,
+    model_client: ChatCompletionClient,
+    concurrency: int = 8,
+    max_turns: int | None = None,
+    cache: SemanticTaskCache | None = None,
+) -> int:
+    """
+    Run all tasks concurrently, at most `concurrency` at a time, and append each result to the
+    JSONL output as soon as it finishes. Returns the number of failed tasks.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+    pending = [asyncio.create_task(run_task(entry, model_client, semaphore, max_turns, cache)) for entry in entries]
+    with open(output_path, "a", encoding="utf-8") as output_file:
+        for finished in asyncio.as_completed(pending):
+            record = await finished
+            failures += "error" in record
+            output_file.write(json.dumps(record) + "\n")
+            output_file.flush()
+    return failures
+
+
+def create_model_client(
+    model: str,
+    requests_per_minute: float | None = None,
+    tokens_per_minute: float | None = None,
+    pool: ClientPool | None = None,
+) -> ChatCompletionClient:
+    """
+    Create the model client shared by all teams, so they share one cache and one rate limit.
+    Cache hits are answered before the scheduler and do not use the quota.
+    With a `pool`, the requests go over the pool's bounded connections and the pool closes the client.
+    """
+    scheduler = RequestScheduler(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    if pool is None:
+        return clients.create_model_client(model, scheduler=scheduler, priority=Priority.BATCH)
+    return cached_client(scheduler.wrap(pool.client(model), priority=Priority.BATCH))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of essay tasks on concurrent primary/critic teams.")
+    parser.add_argument("tasks", help="JSONL file with one {\"id\": ..., \"task\": ...} object per line")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file the results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum number of teams running at once")
+    parser.add_argument("--max-turns", type=int, default=None, help="stop each team after this many turns")
+    parser.add_argument("--model", default=clients.DEFAULT_MODEL)
+    parser.add_argument("--rpm", type=float, default=None, help="requests per minute allowed by the endpoint")
+    parser.add_argument("--tpm", type=float, default=None, help="tokens per minute allowed by the endpoint")
+    parser.add_argument("--max-connections", type=int, default=20, help="maximum number of open HTTP connections")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="maximum number of concurrent model requests")
+    parser.add_argument(
+        "--semantic-cache",
+        type=float,
+        default=None,
+        metavar="THRESHOLD",
+        help="reuse the essay of a task at least this similar (0-1) to one already written",
+    )
+    args = parser.parse_args()
+
+    # all teams share the pool's connections, the pool closes them when the batch ends or fails
+    async with ClientPool(max_connections=args.max_connections, max_in_flight=args.max_in_flight, cache=False) as pool:
+        model_client = create_model_client(args.model, args.rpm, args.tpm, pool=pool)
+        cache = (
+            SemanticTaskCache(threshold=args.semantic_cache, warm_start_threshold=min(0.7, args.semantic_cache))
+            if args.semantic_cache is not None
+            else None
+        )
+        failures = await run_batch(
+            list(read_tasks(args.tasks)),
+            args.output,
+            model_client,
+            concurrency=args.concurrency,
+            max_turns=args.max_turns,
+            cache=cache,
+        )
+        usage = model_client.total_usage()
+        print(f"failed tasks: {failures}, prompt tokens: {usage.prompt_tokens}, completion tokens: {usage.completion_tokens}")
+        if cache is not None:
+            print(f"semantic cache: {cache.stats()}, hit rate: {cache.stats().hit_rate:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Literal
+
+from pydantic import BaseModel
+
+# autogen-agentchat
+from autogen_agentchat.agents import AssistantAgent, BaseChatAgent
+from autogen_agentchat.messages import BaseChatMessage, TextMessage
+from autogen_agentchat.conditions import TextMentionTermination
+from autogen_agentchat.teams import BaseGroupChat, RoundRobinGroupChat
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient
+
+# local
+import custom_agent
+import team1
+from fake_client import FakeChatCompletionClient
+
+# Offline benchmarks of the agent and team code, driven by FakeChatCompletionClient.
+# No API key or network is needed. Every scenario reports:
+#   - turns_per_s: agent turns per second of wall-clock time
+#   - overhead_ms_per_turn: wall-clock time not spent in the (simulated) model, per turn
+#   - memory_kb_per_round: memory retained per round, measured in a separate tracemalloc pass
+#   - state_ms / state_kb: cost of save_state() plus JSON serialization at the end of the run
+# Use --save to record a baseline and --compare to fail on regressions against it.
+
+TASK = "Write a short poem about the sea."
+
+# a scenario runs `rounds` rounds on the client and returns the object whose state is saved and its turn count
+Scenario = Callable[[ChatCompletionClient, int], Awaitable[tuple[BaseChatAgent | BaseGroupChat, int]]]
+
+
+async def _agent_rounds(agent: BaseChatAgent, rounds: int) -> tuple[BaseChatAgent, int]:
+    for round_number in range(rounds):
+        await agent.on_messages(
+            [TextMessage(content=f"{TASK} Revision {round_number}.", source="user")], CancellationToken()
+        )
+    return agent, rounds
+
+
+async def custom_agent_scenario(client: ChatCompletionClient, rounds: int) -> tuple[BaseChatAgent | BaseGroupChat, int]:
+    return await _agent_rounds(custom_agent.CustomAgent("writer", client, model_client_stream=True), rounds)
+
+
+async def assistant_agent_scenario(client: ChatCompletionClient, rounds: int) -> tuple[BaseChatAgent | BaseGroupChat, int]:
+    return await _agent_rounds(AssistantAgent("writer", client), rounds)
+
+
+async def _team_rounds(team: BaseGroupChat) -> tuple[BaseGroupChat, int]:
+    result = await team.run(task=TASK)
+    turns = sum(1 for message in result.messages if isinstance(message, BaseChatMessage) and message.source != "user")
+    return team, turns
+
+
+async def team1_scenario(client: ChatCompletionClient, rounds: int) -> tuple[BaseChatAgent | BaseGroupChat, int]:
+    return await _team_rounds(team1.create_team(client))
+
+
+async def custom_agent_team_scenario(client: ChatCompletionClient, rounds: int) -> tuple[BaseChatAgent | BaseGroupChat, int]:
+    return await _team_rounds(custom_agent.create_team(client))
+
+
+class Poem(BaseModel):
+    form: Literal["free verse", "sonnet", "haiku"]
+    text: str
+
+
+async def structured_team_scenario(client: ChatCompletionClient, rounds: int) -> tuple[BaseChatAgent | BaseGroupChat, int]:
+    # a streaming writer with structured output in a team, its StructuredMessage and PartialStructuredEvent
+    # types have to be known to the team's message factory
+    writer = custom_agent.CustomAgent(
+        "primary",
+        client,
+        system_message="Write the poem in the JSON format.",
+        model_client_stream=True,
+        output_content_type=Poem,
+    )
+    critic = custom_agent.CustomAgent(
+        "critic", client, system_message="Provide constructive feedback. Respond with 'APPROVE' when it is good."
+    )
+    team = RoundRobinGroupChat(
+        [writer, critic],
+        termination_condition=TextMentionTermination("APPROVE"),
+        custom_message_types=custom_agent.CUSTOM_MESSAGE_TYPES,
+    )
+    return await _team_rounds(team)
+
+
+async def speculative_team_scenario(client: ChatCompletionClient, rounds: int) -> tuple[BaseChatAgent | BaseGroupChat, int]:
+    return await _team_rounds(custom_agent.create_team(client, drafts=3))
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "custom_agent": custom_agent_scenario,
+    "assistant_agent": assistant_agent_scenario,
+    "team1": team1_scenario,
+    "custom_agent_team": custom_agent_team_scenario,
+    "speculative_team": speculative_team_scenario,
+    "structured_team": structured_team_scenario,
+}
+
+
+async def run_scenario(
+    scenario: Scenario,
+    rounds: int,
+    latency: float,
+    tokens_per_second: float | None,
+    response_tokens: int,
+) -> Dict[str, float]:
+    """
+    Run a scenario twice, once for timing and once under tracemalloc for memory.
+    In the team scenarios the critic approves on round `rounds`.
+    """
+
+    def new_client() -> FakeChatCompletionClient:
+        return FakeChatCompletionClient(
+            latency=latency,
+            tokens_per_second=tokens_per_second,
+            response_tokens=response_tokens,
+            approve_after=rounds,
+        )
+
+    client = new_client()
+    start = time.perf_counter()
+    subject, turns = await scenario(client, rounds)
+    wall = time.perf_counter() - start
+
+    start = time.perf_counter()
+    state = await subject.save_state()
+    serialized = json.dumps(state, default=str)
+    state_seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    retained, _ = await scenario(new_client(), rounds)
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    return {
+        "turns": turns,
+        "wall_s": wall,
+        "turns_per_s": turns / wall,
+        "overhead_ms_per_turn": (wall - client.simulated_seconds) / turns * 1000,
+        "memory_kb_per_round": (after - before) / rounds / 1024,
+        "state_ms": state_seconds * 1000,
+        "state_kb": len(serialized) / 1024,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    The regressions of `results` against `baseline`: overhead, memory or state cost grown by more than `tolerance`.
+    """
+    regressions: List[str] = []
+    for name, metrics in results.items():
+        for metric in ("overhead_ms_per_turn", "memory_kb_per_round", "state_ms", "state_kb"):
+            reference = baseline.get(name, {}).get(metric)
+            if reference and metrics[metric] > reference * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {metrics[metric]:.3f} > {reference:.3f} (+{tolerance:.0%})")
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the agents and teams with a fake model client.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--rounds", type=int, default=5, help="writer/critic rounds per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the fastest is reported")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds before the first token")
+    parser.add_argument("--tps", type=float, default=None, help="simulated tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=120, help="length of a simulated draft")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative growth against the baseline")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name in args.scenario or SCENARIOS:
+        runs = [
+            await run_scenario(SCENARIOS[name], args.rounds, args.latency, args.tps, args.response_tokens)
+            for _ in range(args.repeat)
+        ]
+        results[name] = min(runs, key=lambda run: run["wall_s"])
+
+    print(f"{'scenario':<20}{'turns':>6}{'turns/s':>10}{'overhead ms':>13}{'mem KB/round':>14}{'state ms':>10}{'state KB':>10}")
+    for name, metrics in results.items():
+        print(
+            f"{name:<20}{metrics['turns']:>6.0f}{metrics['turns_per_s']:>10.1f}{metrics['overhead_ms_per_turn']:>13.3f}"
+            f"{metrics['memory_kb_per_round']:>14.1f}{metrics['state_ms']:>10.3f}{metrics['state_kb']:>10.1f}"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as results_file:
+            json.dump(results, results_file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Mapping, Tuple
+
+# autogen_agentchat
+from autogen_agentchat.teams import BaseGroupChat
+
+# Incremental, compressed checkpoints of team state.
+#
+# A checkpoint file is an append-only sequence of zlib-compressed records, each prefixed
+# with its kind and length. There are two kinds of records:
+#   - blobs: a message body (any long string), stored once under its digest, however many
+#     agent contexts and message threads repeat it.
+#   - snapshots: JSON of the state tree with the long strings replaced by {"$b": digest}, and every list
+#     replaced by {"$l": [...]} or, when the list only grew since the previous snapshot,
+#     {"$x": previous length, "$l": [appended items]}.
+# A checkpoint after each turn therefore writes the new turn, not the whole history again.
+
+# strings at least this long are stored as shared blobs
+BLOB_MIN_LENGTH = 64
+
+# record kind and payload length
+_HEADER = struct.Struct(">cI")
+_BLOB = b"b"
+_SNAPSHOT = b"s"
+# digests are hex strings of this length, stored in front of the blob body
+_DIGEST_LENGTH = 24
+
+
+def _digest(data: str) -> str:
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class CheckpointStore:
+    """
+    Writes incremental checkpoints of a team's state to `path` and loads them back.
+
+    Example:
+
+        store = CheckpointStore("essay.ckpt")
+        await store.checkpoint(team)            # after every turn
+        await store.restore(team)               # resume from the latest checkpoint
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.bytes_written = 0
+        # digest -> (offset, length) of the blob record
+        self._blobs: Dict[str, Tuple[int, int]] = {}
+        # (offset, length) of every snapshot record, in order
+        self._snapshots: List[Tuple[int, int]] = []
+        # list path -> item digests of the last snapshot, the base for the next incremental snapshot
+        self._last_lists: Dict[str, List[str]] | None = {}
+        self._decoded_blobs: Dict[str, str] = {}
+        self._decoded_snapshots: Dict[int, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            self._scan()
+
+    # writing
+
+    async def checkpoint(self, team: BaseGroupChat, **metadata: Any) -> int:
+        """
+        Append a snapshot of the team state and return its index.
+        """
+        return self.write(await team.save_state(), **metadata)
+
+    def write(self, state: Mapping[str, Any], **metadata: Any) -> int:
+        """
+        Append a snapshot of `state`, written incrementally against the previous snapshot.
+        """
+        if self._last_lists is None:
+            self._last_lists = self._list_digests(len(self._snapshots) - 1)
+        previous_lists = self._last_lists
+        current_lists: Dict[str, List[str]] = {}
+        new_blobs: Dict[str, str] = {}
+        tree = self._encode_tree(state, "", previous_lists, current_lists, new_blobs)
+        with open(self.path, "ab") as checkpoint_file:
+            for digest, body in new_blobs.items():
+                self._blobs[digest] = self._append(checkpoint_file, _BLOB, body, digest)
+            snapshot = _canonical({"tree": tree, "meta": metadata})
+            self._snapshots.append(self._append(checkpoint_file, _SNAPSHOT, snapshot))
+        self._last_lists = current_lists
+        return len(self._snapshots) - 1
+
+    def _append(self, checkpoint_file: BinaryIO, kind: bytes, body: str, digest: str = "") -> Tuple[int, int]:
+        """Append one record and return the (offset, length) of its compressed body."""
+        payload = digest.encode("ascii") + zlib.compress(body.encode("utf-8"))
+        offset = checkpoint_file.seek(0, os.SEEK_END)
+        checkpoint_file.write(_HEADER.pack(kind, len(payload)) + payload)
+        self.bytes_written += _HEADER.size + len(payload)
+        start = offset + _HEADER.size + len(digest)
+        return start, len(payload) - len(digest)
+
+    def _encode_tree(
+        self,
+        node: Any,
+        path: str,
+        previous_lists: Dict[str, List[str]],
+        current_lists: Dict[str, List[str]],
+        new_blobs: Dict[str, str],
+    ) -> Any:
+        if isinstance(node, Mapping):
+            return {
+                key: self._encode_tree(value, f"{path}/{key}", previous_lists, current_lists, new_blobs)
+                for key, value in node.items()
+            }
+        if isinstance(node, (list, tuple)):
+            items = [self._encode_value(item, new_blobs) for item in node]
+            digests = [_digest(_canonical(item)) for item in items]
+            current_lists[path] = digests
+            previous = previous_lists.get(path)
+            if previous is not None and digests[: len(previous)] == previous:
+                return {"$x": len(previous), "$l": items[len(previous) :]}
+            return {"$l": items}
+        return self._encode_value(node, new_blobs)
+
+    def _encode_value(self, value: Any, new_blobs: Dict[str, str]) -> Any:
+        if isinstance(value, str) and len(value) >= BLOB_MIN_LENGTH:
+            digest = _digest(value)
+            if digest not in self._blobs:
+                new_blobs[digest] = value
+            return {"$b": digest}
+        if isinstance(value, Mapping):
+            return {key: self._encode_value(item, new_blobs) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._encode_value(item, new_blobs) for item in value]
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    # reading
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def _scan(self) -> None:
+        """Index the records of an existing file from their headers, without decompressing anything."""
+        size = os.path.getsize(self.path)
+        offset = 0
+        with open(self.path, "rb") as checkpoint_file:
+            while offset + _HEADER.size <= size:
+                checkpoint_file.seek(offset)
+                kind, length = _HEADER.unpack(checkpoint_file.read(_HEADER.size))
+                start = offset + _HEADER.size
+                if start + length > size:
+                    # a record cut short by a crash, everything before it is intact
+                    break
+                if kind == _BLOB:
+                    digest = checkpoint_file.read(_DIGEST_LENGTH).decode("ascii")
+                    self._blobs[digest] = (start + _DIGEST_LENGTH, length - _DIGEST_LENGTH)
+                else:
+                    self._snapshots.append((start, length))
+                offset = start + length
+        if offset != size:
+            with open(self.path, "r+b") as checkpoint_file:
+                checkpoint_file.truncate(offset)
+        # the list digests of the last snapshot are only rebuilt if another snapshot is written
+        self._last_lists = None
+
+    def _read_body(self, location: Tuple[int, int]) -> str:
+        offset, length = location
+        with open(self.path, "rb") as checkpoint_file:
+            checkpoint_file.seek(offset)
+            return zlib.decompress(checkpoint_file.read(length)).decode("utf-8")
+
+    def _snapshot(self, index: int) -> Dict[str, Any]:
+        if index not in self._decoded_snapshots:
+            self._decoded_snapshots[index] = json.loads(self._read_body(self._snapshots[index]))
+        return self._decoded_snapshots[index]
+
+    def _blob(self, digest: str) -> str:
+        if digest not in self._decoded_blobs:
+            self._decoded_blobs[digest] = self._read_body(self._blobs[digest])
+        return self._decoded_blobs[digest]
+
+    def metadata(self, index: int = -1) -> Dict[str, Any]:
+        """The metadata recorded with a snapshot."""
+        return self._snapshot(self._index(index))["meta"]
+
+    def load(self, index: int = -1) -> "LazyState":
+        """
+        The state of a snapshot. Sub-trees, lists and message bodies are only decoded when accessed.
+        """
+        index = self._index(index)
+        return LazyState(self, index, self._snapshot(index)["tree"], "")
+
+    async def restore(self, team: BaseGroupChat, index: int = -1) -> None:
+        """Load a snapshot into the team."""
+        await team.load_state(self.load(index).materialize())
+
+    def _index(self, index: int) -> int:
+        if not self._snapshots:
+            raise ValueError(f"No checkpoint in {self.path}.")
+        return index % len(self._snapshots)
+
+    def _node_at(self, index: int, path: str) -> Any:
+        node: Any = self._snapshot(index)["tree"]
+        for key in path.split("/")[1:]:
+            node = node[key]
+        return node
+
+    def _resolve_list(self, index: int, path: str) -> List[Any]:
+        """The encoded items of the list at `path`, following the chain of appended segments."""
+        # (length of the previous list, appended items), newest first
+        chain: List[Tuple[int, List[Any]]] = []
+        while True:
+            node = self._node_at(index, path)
+            if "$x" not in node:
+                items: List[Any] = list(node["$l"])
+                break
+            chain.append((node["$x"], node["$l"]))
+            index -= 1
+        for previous_length, appended in reversed(chain):
+            items = items[:previous_length] + appended
+        return items
+
+    def _list_digests(self, index: int) -> Dict[str, List[str]]:
+        digests: Dict[str, List[str]] = {}
+        if index < 0:
+            return digests
+        for path in self._list_paths(self._snapshot(index)["tree"], ""):
+            digests[path] = [_digest(_canonical(item)) for item in self._resolve_list(index, path)]
+        return digests
+
+    def _list_paths(self, node: Any, path: str) -> Iterator[str]:
+        if isinstance(node, dict):
+            if "$l" in node:
+                yield path
+                return
+            for key, value in node.items():
+                yield from self._list_paths(value, f"{path}/{key}")
+
+    def _decode_value(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if "$b" in value and len(value) == 1:
+                return self._blob(value["$b"])
+            return {key: self._decode_value(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._decode_value(item) for item in value]
+        return value
+
+
+class LazyState(Mapping[str, Any]):
+    """
+    A read-only view of one snapshot that decodes its children on first access.
+    """
+
+    def __init__(self, store: CheckpointStore, index: int, node: Dict[str, Any], path: str) -> None:
+        self._store = store
+        self._index = index
+        self._node = node
+        self._path = path
+        self._cache: Dict[str, Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._cache:
+            self._cache[key] = self._decode(self._node[key], f"{self._path}/{key}")
+        return self._cache[key]
+
+    def _decode(self, node: Any, path: str) -> Any:
+        if isinstance(node, dict) and "$l" in node:
+            return [self._store._decode_value(item) for item in self._store._resolve_list(self._index, path)]
+        if isinstance(node, dict) and not ("$b" in node and len(node) == 1):
+            return LazyState(self._store, self._index, node, path)
+        return self._store._decode_value(node)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._node)
+
+    def __len__(self) -> int:
+        return len(self._node)
+
+    def materialize(self) -> Dict[str, Any]:
+        """Decode the whole sub-tree into plain dicts and lists."""
+        return {key: value.materialize() if isinstance(value, LazyState) else value for key, value in self.items()}
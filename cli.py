@@ -0,0 +1,127 @@
+import argparse
+import importlib
+import inspect
+import os
+import subprocess
+import sys
+from typing import Dict, List, Sequence
+
+# The single entry point of the essay writer: `python cli.py <command> [args]`.
+#
+# A command's module is imported only when the command runs, so `--help` and a command that does
+# not need the agent stack start without paying for it. The remaining arguments go to the module's
+# own `main`, e.g. `python cli.py batch tasks.jsonl --concurrency 4` runs `batch_runner.main`.
+#
+# `python cli.py import-time` measures the import time of each module in fresh interpreters and
+# fails when a module is over its budget, so a slow top-level import does not creep back in.
+
+# command -> (module, help)
+COMMANDS: Dict[str, tuple[str, str]] = {
+    "quickstart": ("quickstart", "run the single agent with tools"),
+    "structout": ("structout", "run the structured output agents"),
+    "team": ("team1", "run the primary/critic team"),
+    "custom-team": ("custom_agent", "run the custom agent team with tracing"),
+    "state": ("team_state", "save, checkpoint and restore team state"),
+    "userproxy": ("team_userproxy", "run the poet team with a human reviewer"),
+    "maxturn": ("team_maxturn", "step the team one turn at a time"),
+    "durable": ("durable_run", "run or resume a checkpointed team"),
+    "batch": ("batch_runner", "run a JSONL file of tasks on concurrent teams"),
+    "pool": ("worker_pool", "run tasks on a multi-process worker pool"),
+    "pipeline": ("pipeline", "run the incremental essay pipeline"),
+    "benchmark": ("benchmark", "benchmark the teams on the fake model client"),
+}
+
+# module -> import time budget in milliseconds, with headroom over the measured time;
+# the agent modules import autogen_agentchat (~550 ms) but no model client package
+IMPORT_BUDGETS_MS: Dict[str, float] = {
+    "cli": 100,
+    "clients": 100,
+    "client_pool": 600,
+    "model_router": 600,
+    "research": 1000,
+    "document_store": 1000,
+    "team1": 1000,
+    "custom_agent": 1000,
+    "essay_memory": 1000,
+    "batch_runner": 1000,
+    "semantic_cache": 1000,
+    "worker_pool": 1000,
+    "pipeline": 1000,
+    "benchmark": 1000,
+}
+
+
+def import_time_ms(module: str, repeat: int = 3) -> float:
+    """
+    The best of `repeat` import times of `module`, each in a fresh interpreter, in milliseconds.
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    times: List[float] = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        times.append(float(output.strip().splitlines()[-1]) * 1000)
+    return min(times)
+
+
+def check_import_times(modules: Sequence[str], repeat: int = 3) -> int:
+    """
+    Print the import time of each module against its budget and return the number over budget.
+    """
+    over = 0
+    for module in modules:
+        elapsed = import_time_ms(module, repeat)
+        budget = IMPORT_BUDGETS_MS.get(module)
+        status = "ok" if budget is None or elapsed <= budget else "OVER"
+        over += status == "OVER"
+        print(f"{module:<16} {elapsed:8.0f} ms  budget {budget if budget is not None else '-':>6} ms  {status}")
+    return over
+
+
+def run_command(command: str, args: Sequence[str]) -> int:
+    """
+    Import the module of `command` and run its `main` with `args` as the command line.
+    """
+    module_name, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+    sys.argv = [f"{os.path.basename(sys.argv[0])} {command}", *args]
+    if inspect.iscoroutinefunction(module.main):
+        import asyncio
+
+        result = asyncio.run(module.main())
+    else:
+        result = module.main()
+    return result if isinstance(result, int) else 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Essay writer: teams of agents that plan, research, write and critique.")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model client")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="latency of the fake model client in seconds")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for command, (_, help) in COMMANDS.items():
+        commands.add_parser(command, help=help, add_help=False)
+    timing = commands.add_parser("import-time", help="check the import time of the modules against their budgets")
+    timing.add_argument("modules", nargs="*", help="modules to measure, all budgeted modules by default")
+    timing.add_argument("--repeat", type=int, default=3, help="imports per module, the fastest counts")
+    # the arguments after a module's command are parsed by the module
+    argv = list(sys.argv[1:] if argv is None else argv)
+    split = next((index + 1 for index, arg in enumerate(argv) if arg in COMMANDS), len(argv))
+    args = parser.parse_args(argv[:split])
+
+    if args.fake:
+        # read by clients.create_model_client, also in worker processes started by the command
+        os.environ["MODEL_CLIENT"] = "fake"
+        os.environ["FAKE_MODEL_LATENCY"] = str(args.fake_latency)
+    if args.command == "import-time":
+        return 1 if check_import_times(args.modules or list(IMPORT_BUDGETS_MS), args.repeat) else 0
+    return run_command(args.command, argv[split:])
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
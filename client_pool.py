@@ -0,0 +1,238 @@
+import asyncio
+import json
+import time
+import warnings
+from types import TracebackType
+from typing import Any, AsyncGenerator, Dict, Literal, Mapping, Optional, Sequence, Union
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+# local
+from clients import DEFAULT_MODEL, OPENAI_PROVIDERS, load_model_client, model_config
+
+# A process-wide registry of model clients, keyed by their component config.
+#
+# Teams that ask for the same model get the same client, and all OpenAI-compatible clients of the
+# pool send their requests over one HTTP connection pool with a bounded number of connections,
+# so dozens of teams reuse warm keep-alive connections instead of opening (and TLS-handshaking)
+# their own. Each client caps its in-flight requests, and the pool closes every client when its
+# `async with` block exits, also on errors:
+#
+#   async with ClientPool(max_connections=20, max_in_flight=8) as pool:
+#       team = create_team(pool.client("gemini-1.5-flash-8b"))
+#       await team.run(task="Write a short poem about the sea.")
+
+
+class BoundedClientStats(BaseModel):
+    """The requests of a pooled client, and how long they waited for an in-flight slot."""
+
+    requests: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    queue_wait: float = 0.0
+
+
+class BoundedChatCompletionClient(ChatCompletionClient):
+    """
+    A ChatCompletionClient that allows at most `max_in_flight` concurrent requests to `client`;
+    the others wait for a slot. A stream holds its slot until it is complete.
+
+    Its `close` does nothing, the :class:`ClientPool` that created it closes `client`.
+    """
+
+    def __init__(self, client: ChatCompletionClient, max_in_flight: int) -> None:
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.stats = BoundedClientStats()
+
+    async def _acquire(self) -> None:
+        started_at = time.perf_counter()
+        await self._slots.acquire()
+        self.stats.queue_wait += time.perf_counter() - started_at
+        self.stats.requests += 1
+        self.stats.in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+
+    def _release(self) -> None:
+        self.stats.in_flight -= 1
+        self._slots.release()
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        await self._acquire()
+        try:
+            return await self.client.create(
+                messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+        finally:
+            self._release()
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            await self._acquire()
+            try:
+                async for chunk in self.client.create_stream(
+                    messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                ):
+                    yield chunk
+            finally:
+                self._release()
+
+        return _generator()
+
+    async def close(self) -> None:
+        # shared, closed by the pool
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self.client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return self.client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.client.model_info
+
+
+class ClientPool:
+    """
+    Hands out shared model clients by component config and closes them all on exit.
+
+    Args:
+        max_connections (int): The maximum number of open HTTP connections of the OpenAI-compatible clients.
+        max_keepalive_connections (int): The maximum number of idle connections kept open for reuse.
+        keepalive_expiry (float): Seconds an idle connection is kept open.
+        max_in_flight (int): The maximum number of concurrent requests per client.
+        cache (bool): Wrap each client with the response cache; cache hits do not take an in-flight slot.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        max_in_flight: int = 8,
+        cache: bool = True,
+    ) -> None:
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.max_in_flight = max_in_flight
+        self._cache = cache
+        self._http_client: Any = None
+        self._bounded: Dict[str, BoundedChatCompletionClient] = {}
+        self._clients: Dict[str, ChatCompletionClient] = {}
+
+    def _shared_http_client(self) -> Any:
+        if self._http_client is None:
+            from openai import DefaultAsyncHttpxClient
+            from openai._constants import DEFAULT_CONNECTION_LIMITS
+
+            # the Limits class of the HTTP library the openai SDK is built on
+            limits = type(DEFAULT_CONNECTION_LIMITS)(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            self._http_client = DefaultAsyncHttpxClient(limits=limits)
+        return self._http_client
+
+    def get(self, config: Mapping[str, Any]) -> ChatCompletionClient:
+        """
+        The shared client of a component config with a `provider` and a `config`, created on first use.
+        Closing it does nothing, the pool closes it.
+        """
+        key = json.dumps(config, sort_keys=True, default=str)
+        if key not in self._clients:
+            http_client = self._shared_http_client() if config["provider"] in OPENAI_PROVIDERS else None
+            bounded = BoundedChatCompletionClient(load_model_client(config, http_client), self.max_in_flight)
+            client: ChatCompletionClient = bounded
+            if self._cache:
+                from response_cache import cached_client
+
+                client = cached_client(bounded)
+            self._bounded[key] = bounded
+            self._clients[key] = client
+        return self._clients[key]
+
+    def client(self, model: str = DEFAULT_MODEL) -> ChatCompletionClient:
+        """The shared client of a Gemini model, see :func:`clients.model_config`."""
+        return self.get(model_config(model))
+
+    def stats(self) -> Dict[str, BoundedClientStats]:
+        """The in-flight statistics of each client, by model."""
+        return {
+            json.loads(key).get("config", {}).get("model", key): bounded.stats for key, bounded in self._bounded.items()
+        }
+
+    async def aclose(self) -> None:
+        """Close every client and the shared HTTP connections."""
+        bounded, self._bounded, self._clients = list(self._bounded.values()), {}, {}
+        for client in bounded:
+            await client.client.close()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def __aenter__(self) -> "ClientPool":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.aclose()
@@ -0,0 +1,97 @@
+from dotenv import load_dotenv
+import importlib
+import os
+
+from typing import TYPE_CHECKING, Any, Dict, Mapping
+
+if TYPE_CHECKING:
+    from autogen_core.models import ChatCompletionClient
+
+    from scheduler import Priority, RequestScheduler
+
+# load environment variables from .env file
+load_dotenv()
+
+# The model client factory of the scripts. The model client packages are only imported when a
+# client is created: autogen_ext.models.openai and the openai SDK take about a second to import,
+# which `--help`, the benchmarks and runs on the fake client should not pay for.
+#
+# MODEL_CLIENT=fake selects the offline FakeChatCompletionClient, FAKE_MODEL_LATENCY its latency.
+
+DEFAULT_MODEL = "gemini-1.5-flash-8b"
+
+# providers that take an `http_client`, so clients can share a bounded connection pool
+OPENAI_PROVIDERS = {
+    "autogen_ext.models.openai.OpenAIChatCompletionClient",
+    "autogen_ext.models.openai.AzureOpenAIChatCompletionClient",
+    "openai_usage.OpenAIUsageChatCompletionClient",
+    "openai_usage.AzureOpenAIUsageChatCompletionClient",
+}
+
+# the OpenAI providers are created as the subclasses that report the provider's cached prompt tokens
+USAGE_PROVIDERS = {
+    "autogen_ext.models.openai.OpenAIChatCompletionClient": "openai_usage.OpenAIUsageChatCompletionClient",
+    "autogen_ext.models.openai.AzureOpenAIChatCompletionClient": "openai_usage.AzureOpenAIUsageChatCompletionClient",
+}
+
+
+def model_config(model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+    """The component config of a Gemini model through the OpenAI-compatible API."""
+    return {
+        "provider": "autogen_ext.models.openai.OpenAIChatCompletionClient",
+        "config": {"model": model, "api_key": os.getenv("GEMINI_API_KEY")},
+    }
+
+
+def load_model_client(config: Mapping[str, Any], http_client: Any = None) -> "ChatCompletionClient":
+    """
+    Create a model client from a component config with a `provider` and a `config`.
+
+    Args:
+        config (Mapping[str, Any]): The component config, e.g. from :func:`model_config` or model_config.yaml.
+        http_client (Any): The HTTP client of the openai SDK, for the OpenAI providers; None for the SDK's own.
+    """
+    if os.getenv("MODEL_CLIENT") == "fake":
+        from fake_client import FakeChatCompletionClient
+
+        return FakeChatCompletionClient(latency=float(os.getenv("FAKE_MODEL_LATENCY", "0")))
+    provider = USAGE_PROVIDERS.get(config["provider"], config["provider"])
+    client_config = dict(config.get("config") or {})
+    # nested components, e.g. an Azure token provider, need the component loader
+    nested = any(isinstance(value, Mapping) and "provider" in value for value in client_config.values())
+    if provider in OPENAI_PROVIDERS and http_client is not None and not nested:
+        module_name, _, class_name = provider.rpartition(".")
+        client_class = getattr(importlib.import_module(module_name), class_name)
+        return client_class(**client_config, http_client=http_client)
+    from autogen_core.models import ChatCompletionClient
+
+    return ChatCompletionClient.load_component({"provider": provider, "config": client_config})
+
+
+def create_model_client(
+    model: str = DEFAULT_MODEL,
+    cache: bool = True,
+    scheduler: "RequestScheduler | None" = None,
+    priority: "Priority | None" = None,
+) -> "ChatCompletionClient":
+    """
+    Create a model client, on first use. The caller closes it; a :class:`client_pool.ClientPool`
+    shares clients and closes them instead.
+
+    Args:
+        model (str): The Gemini model, through the OpenAI-compatible API.
+        cache (bool): Wrap the client with the response cache, see :func:`response_cache.cached_client`.
+        scheduler (RequestScheduler | None): Send the requests through this rate-limit scheduler.
+        priority (Priority | None): The scheduler lane of the requests, batch by default.
+    """
+    client = load_model_client(model_config(model))
+    if scheduler is not None:
+        from scheduler import Priority
+
+        client = scheduler.wrap(client, priority=priority if priority is not None else Priority.BATCH)
+    if cache:
+        from response_cache import cached_client
+
+        # identical requests are not re-billed on re-runs
+        client = cached_client(client)
+    return client
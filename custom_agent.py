@@ -1,49 +1,87 @@
 import asyncio
-from dotenv import load_dotenv
-import os
-
-from typing import AsyncGenerator, Sequence, List
+import re
+import time
+import uuid
+from typing import Any, AsyncGenerator, Mapping, Sequence, List
 from pydantic import BaseModel
 
 # autogen_agentchat
 from autogen_agentchat.agents import BaseChatAgent, AssistantAgent
 from autogen_agentchat.base import Response, TaskResult
 from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, TextMessage
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, MemoryQueryEvent, ModelClientStreamingChunkEvent, StructuredMessage, TextMessage
+from autogen_agentchat.state import BaseState
 from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.ui import Console
 
 # autogen_core
 from autogen_core import CancellationToken
+from autogen_core.memory import Memory
 from autogen_core.models import ChatCompletionClient
 from autogen_core.model_context import UnboundedChatCompletionContext, ChatCompletionContext
 from autogen_core.models import AssistantMessage, RequestUsage, UserMessage, SystemMessage, CreateResult
 
-# autogen_ext
-from autogen_ext.models.openai import OpenAIChatCompletionClient
+# local
+from essay_memory import EssayMemory
+from instrumentation import Tracer
+from model_contexts import DraftBufferedChatCompletionContext, DraftDiffChatCompletionContext
+from model_router import ModelRouter
+from prompt_prefix import CachedTokensUsage, PrefixCacheStats, PrefixCacheTracker, PromptPrefix
+from structured_stream import PartialStructuredEvent, StructuredStreamParser, parse_structured
+from termination import DraftConvergenceTermination
+
+# the events of CustomAgent that a team's message factory does not know,
+# pass them as `custom_message_types` to the team
+CUSTOM_MESSAGE_TYPES: List[type[BaseAgentEvent | BaseChatMessage]] = [PartialStructuredEvent]
+
+
+class CustomAgentState(BaseState):
+    """The state of a CustomAgent, its model context."""
+    llm_context: Mapping[str, Any] = {}
+    type: str = "CustomAgentState"
 
-# load environment variables from .env file
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 class CustomAgent(BaseChatAgent):
     def __init__(self, 
                 name:str, 
                 model_client: ChatCompletionClient,
                 description:str = "A custom agent that can perform various tasks.",                
-                system_message: (str|None) = "You are a helpful assistant that can respond to messages. Reply with TERMINATE when the task has been completed."
+                system_message: (str|None) = "You are a helpful assistant that can respond to messages. Reply with TERMINATE when the task has been completed.",
+                model_client_stream: bool = False,
+                model_context: ChatCompletionContext | None = None,
+                tracer: Tracer | None = None,
+                prompt_prefix: PromptPrefix | None = None,
+                output_content_type: type[BaseModel] | None = None,
+                memory: Sequence[Memory] | None = None,
             ):
             super().__init__(name, description)
-            self._model_context = UnboundedChatCompletionContext()
+            # the context strategy decides how much of the history is re-sent on every round
+            if model_context is None:
+                self._model_context = UnboundedChatCompletionContext()
+            else:
+                self._model_context = model_context
             self._model_client = model_client
-            self._system_messages: List[SystemMessage] = []
-            if system_message is None:
-                self._system_messages = []
+            self._model_client_stream = model_client_stream
+            self._tracer = tracer
+            # the system message, plan and research go first in a byte-stable prefix,
+            # so providers with prompt prefix caching can reuse it across rounds
+            if prompt_prefix is None:
+                self._prompt_prefix = PromptPrefix(system_message)
             else:
-                self._system_messages = [SystemMessage(content=system_message)]
+                self._prompt_prefix = prompt_prefix
+            self._prefix_cache = PrefixCacheTracker()
+            # with an output content type the agent replies with a StructuredMessage, and when streaming
+            # it reports each field as soon as it is complete in a PartialStructuredEvent; a team of
+            # such agents needs `custom_message_types=CUSTOM_MESSAGE_TYPES`
+            self._output_content_type = output_content_type
+            # long-term memories, e.g. EssayMemory, that add what is relevant to the turn to the model context
+            self._memory = list(memory) if memory is not None else []
 
     @property
     def produced_message_types(self) -> Sequence[type[BaseChatMessage]]:
+        if self._output_content_type is not None:
+            # the concrete type, so a team registers it with its message factory
+            return (TextMessage, StructuredMessage[self._output_content_type])  # type: ignore[valid-type]
         return (TextMessage,)
     
     @property
@@ -53,11 +91,29 @@ class CustomAgent(BaseChatAgent):
         """
         return self._model_context
 
+    @property
+    def prompt_prefix(self) -> PromptPrefix:
+        """
+        The stable head of the prompt, update its plan and research with `prompt_prefix.update(...)`.
+        """
+        return self._prompt_prefix
+
+    @property
+    def prefix_cache_stats(self) -> PrefixCacheStats:
+        """
+        How often the agent re-sent the same prompt prefix and the prompt tokens a prefix cache could serve.
+        """
+        return self._prefix_cache.stats
+
+    @property
+    def _system_messages(self) -> List[SystemMessage]:
+        return self._prompt_prefix.messages
+
     async def on_messages(self, messages: Sequence[BaseChatMessage], cancellation_token: CancellationToken) -> Response:
         async for message in self.on_messages_stream(messages, cancellation_token):
             if isinstance(message, Response):
                 return message
-            raise AssertionError("The stream should have returned the final result.")
+        raise AssertionError("The stream should have returned the final result.")
 
 
     async def on_messages_stream(
@@ -65,30 +121,60 @@ class CustomAgent(BaseChatAgent):
             messages: Sequence[BaseChatMessage], 
             cancellation_token: CancellationToken
             )-> AsyncGenerator[BaseAgentEvent | BaseChatMessage | Response, None]:
+        # record the latency and token usage of this turn
+        turn = self._tracer.start_turn(self.name) if self._tracer is not None else None
+
         # A>> add messages to the model context
         for message in messages:
             await self.model_context.add_message(message.to_model_message())
        
-        ##########################################
-        # B>> update model context with any relevant memory 
-        # TBD
-        ###########################################
+        # B>> update model context with any relevant memory
+        for memory in self._memory:
+            update_result = await memory.update_context(self.model_context)
+            if update_result.memories.results:
+                yield MemoryQueryEvent(content=update_result.memories.results, source=self.name)
 
         # C>> generate a response using model_client
+        # the message id correlates the streaming chunks with the final message
+        message_id = str(uuid.uuid4())
         model_result = None
-        async for inference_output in self._call_llm(
-            model_client=self._model_client,
-            system_messages=self._system_messages,
-            model_context=self.model_context,
-            agent_name=self.name,
-            cancellation_token=cancellation_token):
+        parser = StructuredStreamParser(self._output_content_type) if self._output_content_type is not None else None
+        llm_start = time.perf_counter()
+        async for inference_output in self._generate(cancellation_token, message_id):
             if isinstance(inference_output, CreateResult):
                 model_result = inference_output
                 break     
             else:
+                # streaming chunk event
+                if turn is not None and turn.time_to_first_token is None:
+                    turn.time_to_first_token = time.perf_counter() - llm_start
                 yield inference_output
+                if parser is not None:
+                    new_fields = parser.feed(inference_output.content)
+                    if new_fields:
+                        yield PartialStructuredEvent(
+                            fields=dict(parser.fields),
+                            new_fields=new_fields,
+                            source=self.name,
+                            full_message_id=message_id,
+                        )
         
         assert model_result is not None, "No model result was produced."
+        expected_cached_tokens, reported_cached_tokens = self._prefix_cache.record(
+            self._prompt_prefix, self._model_client, model_result.usage
+        )
+
+        if turn is not None:
+            # without streaming the first token arrives with the whole completion
+            if turn.time_to_first_token is None:
+                turn.time_to_first_token = time.perf_counter() - llm_start
+            turn.message_id = message_id
+            turn.prompt_tokens = model_result.usage.prompt_tokens
+            turn.completion_tokens = model_result.usage.completion_tokens
+            # the provider's count, and apart from it the upper-bound prefix estimate
+            turn.cached_tokens = reported_cached_tokens
+            turn.estimated_cached_tokens = expected_cached_tokens
+            self._tracer.end_turn(turn)
 
         # Add the assistant message to the model context (including thought if present)
         await self.model_context.add_message(
@@ -107,7 +193,9 @@ class CustomAgent(BaseChatAgent):
             agent_name=self.name,
             system_messages=self._system_messages,
             model_context=self.model_context,
-            model_client=self._model_client
+            model_client=self._model_client,
+            message_id=message_id,
+            output_content_type=self._output_content_type,
         ):
             yield output
   
@@ -115,29 +203,76 @@ class CustomAgent(BaseChatAgent):
         """Reset the assistant by clearing the model context."""
         await self.model_context.clear()
 
-    
+    async def save_state(self) -> Mapping[str, Any]:
+        """Save the model context, so the agent can be checkpointed with its team."""
+        model_context_state = await self.model_context.save_state()
+        return CustomAgentState(llm_context=model_context_state).model_dump()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        """Load the model context saved by save_state."""
+        custom_agent_state = CustomAgentState.model_validate(state)
+        await self.model_context.load_state(custom_agent_state.llm_context)
+
+
+    async def _generate(
+        self, cancellation_token: CancellationToken, message_id: str
+    ) -> AsyncGenerator[CreateResult | ModelClientStreamingChunkEvent, None]:
+        """
+        Produce the reply of this turn from the model context, the final CreateResult comes last.
+        """
+        async for inference_output in self._call_llm(
+            model_client=self._model_client,
+            model_client_stream=self._model_client_stream,
+            system_messages=self._system_messages,
+            model_context=self.model_context,
+            agent_name=self.name,
+            cancellation_token=cancellation_token,
+            message_id=message_id,
+            output_content_type=self._output_content_type):
+            yield inference_output
+
     @classmethod
     async def _call_llm(
         cls,
         model_client: ChatCompletionClient,
+        model_client_stream: bool,
         system_messages: List[SystemMessage],
         model_context: ChatCompletionContext,
         agent_name:str,
         cancellation_token: CancellationToken,
+        message_id: str,
         output_content_type: type[BaseModel] | None = None
-    ) -> AsyncGenerator[CreateResult, None]:
+    ) -> AsyncGenerator[CreateResult | ModelClientStreamingChunkEvent, None]:
         """
         Perform a model inference and yield either streaming chunk events or the final CreateResult.
         """
         all_messages = await model_context.get_messages()
         llm_messages = system_messages + all_messages
 
-        model_result = await model_client.create(
-            llm_messages,
-            cancellation_token=cancellation_token,
-            json_output=output_content_type
-        )
-        yield model_result
+        if model_client_stream:
+            # forward each text chunk as it arrives, the final CreateResult comes last
+            model_result: CreateResult | None = None
+            async for chunk in model_client.create_stream(
+                llm_messages,
+                cancellation_token=cancellation_token,
+                json_output=output_content_type
+            ):
+                if isinstance(chunk, CreateResult):
+                    model_result = chunk
+                elif isinstance(chunk, str):
+                    yield ModelClientStreamingChunkEvent(content=chunk, source=agent_name, full_message_id=message_id)
+                else:
+                    raise RuntimeError(f"Invalid chunk type: {type(chunk)}")
+            if model_result is None:
+                raise RuntimeError("No final model result in streaming mode.")
+            yield model_result
+        else:
+            model_result = await model_client.create(
+                llm_messages,
+                cancellation_token=cancellation_token,
+                json_output=output_content_type
+            )
+            yield model_result
 
     @classmethod
     async def _process_model_result(
@@ -148,11 +283,32 @@ class CustomAgent(BaseChatAgent):
         agent_name: str,
         system_messages: List[SystemMessage],
         model_context: ChatCompletionContext,
-        model_client: ChatCompletionClient
+        model_client: ChatCompletionClient,
+        message_id: str,
+        output_content_type: type[BaseModel] | None = None,
     ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | Response, None]:
         """
         handle the final or partial model result 
         """
+        # structured response, validated against the output content type; the object may be wrapped
+        # in a ```json fence or followed by text, as the stream parser accepts. A reply without a
+        # valid object falls back to a TextMessage below, so the turn does not fail
+        content = (
+            parse_structured(model_result.content, output_content_type)
+            if output_content_type is not None and isinstance(model_result.content, str)
+            else None
+        )
+        if content is not None:
+            yield Response(
+                chat_message=StructuredMessage[output_content_type](  # type: ignore[valid-type]
+                    content=content,
+                    source=agent_name,
+                    models_usage=model_result.usage,
+                    id=message_id,
+                ),
+                inner_messages=inner_messages,
+            )
+            return
         # if direct rext response (string)
         if isinstance(model_result.content, str):
             yield Response(
@@ -160,59 +316,228 @@ class CustomAgent(BaseChatAgent):
                     content=model_result.content,
                     source=agent_name,
                     models_usage=model_result.usage,
+                    id=message_id,
                 ),
                 inner_messages=inner_messages,
             )
             return
         else:
             raise AssertionError("The model result should have returned the text result.")
-        
-# create Gemini model client - OpenAIChatCompletionClient API
-model_client = OpenAIChatCompletionClient(
-    model = "gemini-1.5-flash-8b",
-    api_key = GEMINI_API_KEY
-)
-
-# create the primary agent
-primary_agent = AssistantAgent(
-    name="primary",
-    model_client=model_client,
-    system_message="You are a helpful assistant. Please assist the user.",
-    #model_client_stream=True,
-)
-
-# create the critic agent
-critic_agent = CustomAgent(
-    name="critic",
-    model_client=model_client,
-    description="A critic agent that provides feedback.",
-    system_message="Provide constructive feedback to improve. Respond with 'APPROVE' to only when your feedbacks are addressed.",
-    #model_client_stream=True,
-)
-
-# define a termination condition that stops the task if the critic approves. 
-text_termination = TextMentionTermination("APPROVE")
-
-# create a team with the primary and critic agents
-team = RoundRobinGroupChat(
-    participants=[primary_agent, critic_agent],
-    termination_condition=text_termination,
-)
+
+
+class DraftScores(BaseModel):
+    """The critic's scores of the candidate drafts, one per draft, higher is better."""
+    scores: List[float]
+
+
+class SpeculativeWriterAgent(CustomAgent):
+    """
+    A writer that drafts speculatively: every turn it requests one draft per temperature
+    concurrently, has the critic score all of them in a single batched call, and replies with
+    the best one. Only the best draft enters the model context. This spends parallel tokens
+    to save serial critique rounds.
+
+    Args:
+        temperatures (Sequence[float]): The temperature of each draft, one draft per entry.
+        scorer_client (ChatCompletionClient | None): The model client of the scoring call,
+            the writer's client by default.
+        scorer_system_message (str): The critic's instructions for the scoring call.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model_client: ChatCompletionClient,
+        description: str = "A writer agent that drafts several candidates and keeps the best.",
+        system_message: str | None = "You are a helpful assistant. Please assist the user.",
+        model_context: ChatCompletionContext | None = None,
+        tracer: Tracer | None = None,
+        prompt_prefix: PromptPrefix | None = None,
+        temperatures: Sequence[float] = (0.3, 0.7, 1.0),
+        scorer_client: ChatCompletionClient | None = None,
+        scorer_system_message: str = "You are a critic. Score every draft from 0 to 10 on how well it fulfils the task.",
+        memory: Sequence[Memory] | None = None,
+    ):
+        super().__init__(
+            name,
+            model_client,
+            description,
+            system_message,
+            model_context=model_context,
+            tracer=tracer,
+            prompt_prefix=prompt_prefix,
+            memory=memory,
+        )
+        if not temperatures:
+            raise ValueError("At least one temperature is required.")
+        self._temperatures = list(temperatures)
+        self._scorer_client = scorer_client or model_client
+        self._scorer_system_message = scorer_system_message
+        # the scores of the last turn, for inspection
+        self.last_scores: List[float] = []
+
+    async def _generate(
+        self, cancellation_token: CancellationToken, message_id: str
+    ) -> AsyncGenerator[CreateResult | ModelClientStreamingChunkEvent, None]:
+        llm_messages = self._system_messages + await self.model_context.get_messages()
+        drafts: List[CreateResult] = list(
+            await asyncio.gather(
+                *(
+                    self._model_client.create(
+                        llm_messages,
+                        extra_create_args={"temperature": temperature},
+                        cancellation_token=cancellation_token,
+                    )
+                    for temperature in self._temperatures
+                )
+            )
+        )
+        usage = CachedTokensUsage(
+            prompt_tokens=sum(draft.usage.prompt_tokens for draft in drafts),
+            completion_tokens=sum(draft.usage.completion_tokens for draft in drafts),
+            cached_tokens=sum(int(getattr(draft.usage, "cached_tokens", 0) or 0) for draft in drafts),
+        )
+        best = 0
+        if len(drafts) > 1:
+            scores, scoring_usage = await self._score(llm_messages, drafts, cancellation_token)
+            usage = CachedTokensUsage(
+                prompt_tokens=usage.prompt_tokens + scoring_usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens + scoring_usage.completion_tokens,
+                cached_tokens=usage.cached_tokens + int(getattr(scoring_usage, "cached_tokens", 0) or 0),
+            )
+            self.last_scores = scores
+            best = max(range(len(drafts)), key=lambda index: scores[index])
+        yield drafts[best].model_copy(update={"usage": usage})
+
+    async def _score(
+        self, llm_messages: List[Any], drafts: List[CreateResult], cancellation_token: CancellationToken
+    ) -> tuple[List[float], RequestUsage]:
+        """Score all drafts in one call. Drafts the critic's reply does not score get 0."""
+        task = next((str(message.content) for message in llm_messages if isinstance(message, UserMessage)), "")
+        candidates = "\n\n".join(f"Draft {index}:\n{draft.content}" for index, draft in enumerate(drafts, 1))
+        prompt = (
+            f"Task: {task}\n\n{candidates}\n\n"
+            f'Reply with JSON only: {{"scores": [one score per draft, in order]}}, {len(drafts)} scores.'
+        )
+        structured = self._scorer_client.model_info.get("structured_output", False)
+        result = await self._scorer_client.create(
+            [SystemMessage(content=self._scorer_system_message), UserMessage(content=prompt, source=self.name)],
+            json_output=DraftScores if structured else None,
+            cancellation_token=cancellation_token,
+        )
+        scores: List[float] = []
+        content = result.content if isinstance(result.content, str) else ""
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        if match:
+            try:
+                scores = DraftScores.model_validate_json(match.group(0)).scores
+            except ValueError:
+                scores = []
+        scores = (scores + [0.0] * len(drafts))[: len(drafts)]
+        return scores, result.usage
+
+
+# create the primary/critic team on the given model client
+# with `drafts` > 1 the primary agent drafts speculatively, see SpeculativeWriterAgent
+# with a long-term memory, e.g. EssayMemory, both agents start from the lessons of earlier essays
+def create_team(
+    model_client: ChatCompletionClient,
+    tracer: Tracer | None = None,
+    drafts: int = 1,
+    critic_client: ChatCompletionClient | None = None,
+    draft_diff: bool = False,
+    memory: Sequence[Memory] | None = None,
+    plan: str | None = None,
+    research: str | None = None,
+) -> RoundRobinGroupChat:
+    # the plan and research digest, e.g. from prompt_prefix.research_digest, go into the stable prompt
+    # prefix of both agents, so every round re-sends the same shared head ahead of the drafts
+    writer_system_message = "You are a helpful assistant. Please assist the user."
+    critic_system_message = "Provide constructive feedback to improve. Respond with 'APPROVE' to only when your feedbacks are addressed."
+    # create the primary agent
+    # in diff mode, the writer sees its earlier drafts as diffs against the draft before them
+    primary_context = DraftDiffChatCompletionContext(draft_source="primary") if draft_diff else None
+    primary_agent: BaseChatAgent
+    if drafts > 1:
+        primary_agent = SpeculativeWriterAgent(
+            name="primary",
+            model_client=model_client,
+            model_context=primary_context,
+            tracer=tracer,
+            # spread the temperatures of the drafts between 0.3 and 1.0
+            temperatures=[0.3 + 0.7 * index / (drafts - 1) for index in range(drafts)],
+            prompt_prefix=PromptPrefix(writer_system_message, plan=plan, research=research),
+            memory=memory,
+        )
+    else:
+        primary_agent = AssistantAgent(
+            name="primary",
+            model_client=model_client,
+            # the rendered prefix, AssistantAgent sends its system message first as well
+            system_message=PromptPrefix(writer_system_message, plan=plan, research=research).messages[0].content,
+            model_context=primary_context,
+            memory=memory,
+            #model_client_stream=True,
+        )
+
+    # create the critic agent
+    # the critique and APPROVE turns can run on a faster model than the drafts
+    critic_agent = CustomAgent(
+        name="critic",
+        model_client=critic_client or model_client,
+        description="A critic agent that provides feedback.",
+        system_message=critic_system_message,
+        model_client_stream=True,
+        # keep the task, the latest draft and the last few critique rounds
+        model_context=(
+            DraftDiffChatCompletionContext(draft_source="primary", buffer_size=4)
+            if draft_diff
+            else DraftBufferedChatCompletionContext(buffer_size=4, draft_source="primary")
+        ),
+        tracer=tracer,
+        prompt_prefix=PromptPrefix(critic_system_message, plan=plan, research=research),
+        memory=memory,
+    )
+
+    # define a termination condition that stops the task if the critic approves. 
+    text_termination = TextMentionTermination("APPROVE")
+
+    # stop when the drafts of the primary agent barely change between critique rounds
+    convergence_termination = DraftConvergenceTermination("primary", threshold=0.95)
+
+    # create a team with the primary and critic agents
+    return RoundRobinGroupChat(
+        participants=[primary_agent, critic_agent],
+        termination_condition=text_termination | convergence_termination,
+        custom_message_types=CUSTOM_MESSAGE_TYPES,
+    )
 
 # Run the agent and stream the meessages to the console
 async def main() -> None:    
-    await team.reset()
-    #  run the groupchat team with the task of writing a poem about the sea
-    await Console(
-        team.run_stream(task="Write a short poem about the sea."),
-        output_stats=True)
+    # the writer and critic models come from model_config.yaml,
+    # each wrapped with the response cache, so identical requests are not re-billed on re-runs
+    async with ModelRouter.from_yaml("model_config.yaml") as router:
+        # per-agent, per-turn latency and token records of the run
+        tracer = Tracer()
+        # the critiques and approved essays of earlier runs, kept across runs in essay_memory.jsonl
+        memory = EssayMemory("essay_memory.jsonl", model_client=router.client("writer"))
+        team = create_team(router.client("writer"), tracer, critic_client=router.client("critic"), memory=[memory])
 
-  
-    # close the connection to the model client
-    await model_client.close()
+        await team.reset()
+        #  run the groupchat team with the task of writing a poem about the sea
+        task = "Write a short poem about the sea."
+        result = await Console(
+            tracer.trace_stream(team.run_stream(task=task)),
+            output_stats=True)
+        # remember this run's feedback, so the next run on a similar task needs fewer critique rounds
+        memory.remember_run(task, result)
+
+        # export the turn spans and print the per-agent latency summary
+        tracer.export_jsonl("traces.jsonl")
+        tracer.print_summary()
 
 
 # Note: If running inside a python script, use asyncio.run(main())
 # await main()
-asyncio.run(main())
-
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,285 @@
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Any, Callable, Collection, Dict, List, Sequence
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.memory import Memory, MemoryContent, MemoryMimeType, MemoryQueryResult, UpdateContextResult
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import LLMMessage, SystemMessage
+
+# local
+from model_contexts import replace_messages
+from research import Document
+
+# A local store for the research documents. Documents are split into passages and indexed
+# once, with a BM25 inverted index and optionally a NumPy vector index. The writer and the critic
+# get the top-k passages for the current round, so the prompt stays the same size however
+# many documents the research adds.
+
+
+def _terms(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def hashed_embedding(
+    texts: Sequence[str],
+    dim: int = 256,
+    terms: Callable[[str], List[str]] | None = None,
+    char_ngrams: int = 0,
+    char_weight: float = 0.3,
+) -> Any:
+    """
+    L2-normalized bag-of-words vectors of the texts, with the words hashed into `dim` buckets.
+    Needs NumPy.
+
+    Args:
+        terms (Callable | None): Splits a text into its words, lower-cased words by default.
+        char_ngrams (int): Also add the character n-grams of this length of each word, weighted
+            by `char_weight`, so typos and inflections still match; 0 for words only.
+    """
+    import numpy as np
+
+    split = terms or _terms
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features: Counter[str] = Counter()
+        for term in split(text):
+            features[term] += 1
+            if char_ngrams:
+                padded = f" {term} "
+                for start in range(max(len(padded) - char_ngrams + 1, 1)):
+                    # "#" never occurs in a word, so an n-gram does not share the bucket of a word
+                    features[f"#{padded[start:start + char_ngrams]}"] += char_weight
+        for feature, weight in features.items():
+            bucket = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "big")
+            # the sign bit spreads colliding terms around zero instead of adding them up
+            vectors[row, bucket % dim] += weight if bucket & 0x80000000 else -weight
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Passage(BaseModel):
+    """A passage of a stored document."""
+
+    document_id: str
+    title: str
+    text: str
+    score: float = 0.0
+
+
+class DocumentStore:
+    """
+    Passages of the research documents with a BM25 inverted index and an optional vector index.
+
+    A document is ingested once, adding a document with an id or content already in the store is a no-op.
+
+    Args:
+        passage_words (int): The length of a passage in words.
+        overlap_words (int): The number of words shared by consecutive passages.
+        k1 (float): The BM25 term frequency saturation.
+        b (float): The BM25 length normalization.
+        embed (Callable | None): A function from a list of texts to a NumPy array of
+            L2-normalized row vectors, e.g. :func:`hashed_embedding`. Enables the vector index,
+            whose ranking is fused with the BM25 ranking. None for BM25 only.
+    """
+
+    def __init__(
+        self,
+        passage_words: int = 120,
+        overlap_words: int = 20,
+        k1: float = 1.5,
+        b: float = 0.75,
+        embed: Callable[[Sequence[str]], Any] | None = None,
+    ) -> None:
+        if not 0 <= overlap_words < passage_words:
+            raise ValueError("overlap_words must be smaller than passage_words")
+        self._passage_words = passage_words
+        self._overlap_words = overlap_words
+        self._k1 = k1
+        self._b = b
+        self._embed = embed
+        self._passages: List[Passage] = []
+        self._lengths: List[int] = []
+        # term -> {passage index: term frequency}
+        self._index: Dict[str, Dict[int, int]] = {}
+        self._document_ids: set[str] = set()
+        self._digests: set[str] = set()
+        self._vectors: Any = None
+
+    def __len__(self) -> int:
+        """The number of passages."""
+        return len(self._passages)
+
+    @property
+    def document_count(self) -> int:
+        return len(self._document_ids)
+
+    def add(self, document: Document) -> bool:
+        """Ingest a document, return False if it was already in the store."""
+        digest = hashlib.blake2b(document.content.encode("utf-8"), digest_size=12).hexdigest()
+        if document.id in self._document_ids or digest in self._digests:
+            return False
+        self._document_ids.add(document.id)
+        self._digests.add(digest)
+        new_passages = [
+            Passage(document_id=document.id, title=document.title, text=text) for text in self._split(document.content)
+        ]
+        for passage in new_passages:
+            position = len(self._passages)
+            terms = _terms(f"{passage.title} {passage.text}")
+            for term, count in Counter(terms).items():
+                self._index.setdefault(term, {})[position] = count
+            self._passages.append(passage)
+            self._lengths.append(len(terms))
+        if self._embed is not None and new_passages:
+            import numpy as np
+
+            vectors = self._embed([f"{passage.title} {passage.text}" for passage in new_passages])
+            self._vectors = vectors if self._vectors is None else np.vstack([self._vectors, vectors])
+        return True
+
+    def add_all(self, documents: Sequence[Document]) -> int:
+        """Ingest the documents, return the number of new ones."""
+        return sum(self.add(document) for document in documents)
+
+    def _split(self, text: str) -> List[str]:
+        words = text.split()
+        if not words:
+            return []
+        step = self._passage_words - self._overlap_words
+        return [" ".join(words[start : start + self._passage_words]) for start in range(0, max(len(words) - self._overlap_words, 1), step)]
+
+    def bm25(self, query: str) -> Dict[int, float]:
+        """The BM25 score of every passage that contains a query term."""
+        count = len(self._passages)
+        if not count:
+            return {}
+        average_length = sum(self._lengths) / count
+        scores: Dict[int, float] = {}
+        for term in set(_terms(query)):
+            postings = self._index.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings.items():
+                norm = self._k1 * (1 - self._b + self._b * self._lengths[position] / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (self._k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5, document_ids: Collection[str] | None = None) -> List[Passage]:
+        """
+        The top `k` passages for the query, only of the documents `document_ids` if given. With a
+        vector index, the BM25 and vector rankings are combined by reciprocal rank fusion.
+        """
+        scores = self.bm25(query)
+        if document_ids is not None:
+            scores = {position: score for position, score in scores.items() if self._passages[position].document_id in document_ids}
+        if self._vectors is not None and self._embed is not None:
+            similarities = self._vectors @ self._embed([query])[0]
+            bm25_ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+            vector_ranked = [int(position) for position in similarities.argsort()[::-1]]
+            if document_ids is not None:
+                vector_ranked = [position for position in vector_ranked if self._passages[position].document_id in document_ids]
+            vector_ranked = vector_ranked[: max(k * 4, len(bm25_ranked))]
+            # 60 is the usual rank fusion constant, it damps the influence of the top few ranks
+            scores = {}
+            for ranking in (bm25_ranked, vector_ranked):
+                for rank, position in enumerate(ranking):
+                    scores[position] = scores.get(position, 0.0) + 1 / (60 + rank)
+        best = sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+        return [self._passages[position].model_copy(update={"score": scores[position]}) for position in best]
+
+    def clear(self) -> None:
+        self._passages = []
+        self._lengths = []
+        self._index = {}
+        self._document_ids = set()
+        self._digests = set()
+        self._vectors = None
+
+
+_PASSAGES_HEADER = "\nRelevant research passages:"
+
+
+class DocumentStoreMemory(Memory):
+    """
+    Adds the top-k passages of a document store to an agent's model context, e.g.
+    ``AssistantAgent(..., memory=[DocumentStoreMemory(store)])``. The passages are retrieved
+    for the latest message in the context, the current draft or critique, and replace the
+    passages of the previous round.
+
+    Args:
+        store (DocumentStore): The document store, shared by the agents.
+        k (int): The number of passages per round.
+    """
+
+    def __init__(self, store: DocumentStore, k: int = 5, name: str = "documents") -> None:
+        self._store = store
+        self._k = k
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def store(self) -> DocumentStore:
+        return self._store
+
+    async def update_context(self, model_context: ChatCompletionContext) -> UpdateContextResult:
+        messages = await model_context.get_messages()
+        if not messages or not len(self._store):
+            return UpdateContextResult(memories=MemoryQueryResult(results=[]))
+        result = await self.query(str(messages[-1].content))
+        if not result.results:
+            return UpdateContextResult(memories=result)
+        passages = "\n\n".join(f"[{i}] {memory.content}" for i, memory in enumerate(result.results, 1))
+        passages_message = SystemMessage(content=f"{_PASSAGES_HEADER}\n{passages}\n")
+        # replace the passages of the previous round, also when the context strategy hides them,
+        # so they do not pile up in the stored messages and the saved state
+        await replace_messages(model_context, self._is_passages, passages_message)
+        return UpdateContextResult(memories=result)
+
+    @staticmethod
+    def _is_passages(message: LLMMessage) -> bool:
+        return isinstance(message, SystemMessage) and message.content.startswith(_PASSAGES_HEADER)
+
+    async def query(
+        self,
+        query: str | MemoryContent = "",
+        cancellation_token: CancellationToken | None = None,
+        **kwargs: Any,
+    ) -> MemoryQueryResult:
+        text = query if isinstance(query, str) else str(query.content)
+        return MemoryQueryResult(
+            results=[
+                MemoryContent(
+                    content=f"{passage.title}: {passage.text}",
+                    mime_type=MemoryMimeType.TEXT,
+                    metadata={"document_id": passage.document_id, "score": passage.score},
+                )
+                for passage in self._store.search(text, kwargs.get("k", self._k))
+            ]
+        )
+
+    async def add(self, content: MemoryContent, cancellation_token: CancellationToken | None = None) -> None:
+        metadata = content.metadata or {}
+        text = str(content.content)
+        self._store.add(
+            Document(
+                id=str(metadata.get("id", hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest())),
+                title=str(metadata.get("title", "")),
+                content=text,
+            )
+        )
+
+    async def clear(self) -> None:
+        self._store.clear()
+
+    async def close(self) -> None:
+        pass
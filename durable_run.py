@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+from typing import Any, AsyncGenerator, List, Mapping
+
+# autogen-agentchat
+from autogen_agentchat.base import TaskResult, TerminationCondition
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, ModelClientStreamingChunkEvent
+from autogen_agentchat.teams import BaseGroupChat
+from autogen_agentchat.ui import Console
+
+# local
+from client_pool import ClientPool
+from checkpoint import CheckpointStore
+from team1 import create_team
+from termination import load_termination_state, save_termination_state
+
+
+class DurableTeamRun:
+    """
+    Runs a team turn by turn and checkpoints its state after every finished turn, so a run that
+    is interrupted resumes from the last finished turn instead of paying for those turns again.
+
+    The team should be created with `max_turns=1`, like in team_maxturn.py. Each turn is then a
+    separate `run_stream` call, and the team is idle, with a consistent state, when it is saved.
+    The team resets its termination condition on that turn limit, so the state of the condition,
+    e.g. the previous draft of a DraftConvergenceTermination, is carried over from turn to turn
+    and saved with the checkpoint.
+
+    Args:
+        team (BaseGroupChat): The team to run.
+        checkpoint_path (str): The checkpoint file of this run, see :class:`checkpoint.CheckpointStore`.
+        max_turns (int): The turn limit for the whole run.
+        termination_condition (TerminationCondition | None): The team's termination condition,
+            by default the one the team was created with.
+    """
+
+    def __init__(
+        self,
+        team: BaseGroupChat,
+        checkpoint_path: str,
+        max_turns: int = 50,
+        termination_condition: TerminationCondition | None = None,
+    ) -> None:
+        self._team = team
+        self._store = CheckpointStore(checkpoint_path)
+        self._max_turns = max_turns
+        self._termination = termination_condition or getattr(team, "_termination_condition", None)
+
+    @property
+    def completed_turns(self) -> int:
+        """The number of turns already saved in the checkpoint."""
+        return self._store.metadata()["turn"] if len(self._store) else 0
+
+    async def run_stream(self, task: str) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | TaskResult, None]:
+        """
+        Run the task, or resume it from the checkpoint, and stream the messages like `team.run_stream`.
+        Only the messages of the turns run in this call are streamed.
+        """
+        turn = 0
+        next_task: str | None = task
+        if len(self._store):
+            metadata = self._store.metadata()
+            if metadata["task"] != task:
+                raise ValueError(f"The checkpoint {self._store.path} belongs to another task: {metadata['task']!r}")
+            if metadata["finished"]:
+                yield TaskResult(messages=[], stop_reason=metadata["stop_reason"])
+                return
+            # resume from the last finished turn, the task is already in the restored state
+            await self._store.restore(self._team)
+            turn = metadata["turn"]
+            next_task = None
+            if self._termination is not None and metadata.get("termination") is not None:
+                await load_termination_state(self._termination, metadata["termination"])
+        else:
+            await self._team.reset()
+        # the state of the termination condition at the end of the last finished turn
+        termination_state = await save_termination_state(self._termination) if self._termination is not None else None
+
+        messages: List[BaseAgentEvent | BaseChatMessage] = []
+        while True:
+            result: TaskResult | None = None
+            turn_messages: List[BaseAgentEvent | BaseChatMessage] = []
+            async for message in self._team.run_stream(task=next_task):
+                if isinstance(message, TaskResult):
+                    result = message
+                else:
+                    turn_messages.append(message)
+                    yield message
+            assert result is not None, "The team should have returned a task result."
+            messages.extend(turn_messages)
+            next_task = None
+            turn += 1
+            stop_reason = result.stop_reason or ""
+            # with max_turns=1 every turn ends on the turn limit, anything else ends the run
+            finished = not stop_reason.startswith("Maximum number of turns") or turn >= self._max_turns
+            if not finished and termination_state is not None:
+                stop, termination_state = await self._advance_termination(termination_state, turn_messages)
+                if stop is not None:
+                    finished, stop_reason = True, stop
+            await self._store.checkpoint(
+                self._team,
+                task=task,
+                turn=turn,
+                finished=finished,
+                stop_reason=stop_reason,
+                termination=termination_state,
+            )
+            if finished:
+                yield TaskResult(messages=messages, stop_reason=stop_reason)
+                return
+
+    async def _advance_termination(
+        self, state: List[Mapping[str, Any] | None], turn_messages: List[BaseAgentEvent | BaseChatMessage]
+    ) -> tuple[str | None, List[Mapping[str, Any] | None]]:
+        """
+        Bring the termination condition, reset by the turn limit, to the end of the turn: load its
+        state from before the turn and apply the turn's messages, like the team did. Returns the
+        stop reason if that stops the run, and the new state.
+        """
+        assert self._termination is not None
+        await load_termination_state(self._termination, state)
+        # the team does not apply its condition to the streaming chunks
+        stop = await self._termination(
+            [message for message in turn_messages if not isinstance(message, ModelClientStreamingChunkEvent)]
+        )
+        return (stop.content if stop is not None else None), await save_termination_state(self._termination)
+
+
+# Run the task with a checkpoint, re-running the script after a crash resumes it
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a primary/critic team that resumes from its last finished turn.")
+    parser.add_argument("--task", default="Write a short poem about the sea.")
+    parser.add_argument("--checkpoint", default="durable_run.ckpt", help="checkpoint file of the run")
+    parser.add_argument("--max-turns", type=int, default=20)
+    args = parser.parse_args()
+
+    # create Gemini model client - OpenAIChatCompletionClient API
+    # the pool closes the client when the run ends or fails
+    async with ClientPool() as pool:
+        # one turn per run_stream call, so the state is saved after every turn
+        team = create_team(pool.client(), max_turns=1)
+        run = DurableTeamRun(team, args.checkpoint, max_turns=args.max_turns)
+        if run.completed_turns:
+            print(f"resuming after turn {run.completed_turns}")
+        await Console(run.run_stream(args.task), output_stats=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import time
+from typing import Any, Callable, List, Literal, Sequence, get_args
+
+from pydantic import BaseModel
+
+# autogen_agentchat
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import BaseChatMessage
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.memory import Memory, MemoryContent, MemoryMimeType, MemoryQueryResult, UpdateContextResult
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import ChatCompletionClient, LLMMessage, SystemMessage
+
+# local
+from document_store import DocumentStore
+from model_contexts import replace_messages
+from research import Document
+
+# The long-term memory of the essay writer: the critiques of earlier runs, the style guides and
+# the approved essays, kept in a local JSONL file and indexed in a DocumentStore. At the start of
+# a run the agents get the top-k entries for the task, packed into a hard token budget, so the
+# writer sees the feedback its earlier drafts of similar tasks got before the critic repeats it:
+#
+#   memory = EssayMemory("essay_memory.jsonl")
+#   team = create_team(model_client, memory=[memory])
+#   result = await team.run(task=task)
+#   memory.remember_run(task, result)
+
+MemoryKind = Literal["critique", "style_guide", "essay"]
+
+_MEMORY_HEADER = "\nLessons from earlier essays, address them in this one:"
+
+
+class MemoryRecord(BaseModel):
+    """An entry of the long-term memory."""
+
+    id: str
+    kind: MemoryKind
+    content: str
+    # the task the entry was written for, empty for a style guide
+    task: str = ""
+    created_at: float = 0.0
+
+
+class EssayMemory(Memory):
+    """
+    A local, indexed long-term memory of critiques, style guides and approved essays.
+
+    The entries for the task and the latest message are added to the model context as one system
+    message of at most `token_budget` tokens. It is added once and again only when the context
+    strategy no longer shows it, then replacing the hidden copy, so neither the prompt nor the
+    stored messages and saved state grow by a copy every round.
+
+    Args:
+        path (str | None): The JSONL file the entries are loaded from and appended to, None to keep
+            them in memory only.
+        k (int): The number of entries retrieved per update.
+        token_budget (int): The maximum number of tokens added to the context per update.
+        model_client (ChatCompletionClient | None): Counts the tokens of the entries; without it a
+            token is estimated as four characters.
+        embed (Callable | None): The embedding function of the store's vector index, see
+            :func:`document_store.hashed_embedding`. None for BM25 only.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        k: int = 5,
+        token_budget: int = 400,
+        model_client: ChatCompletionClient | None = None,
+        embed: Callable[[Sequence[str]], Any] | None = None,
+        name: str = "essay_memory",
+    ) -> None:
+        self._path = path
+        self._k = k
+        self._token_budget = token_budget
+        self._model_client = model_client
+        self._name = name
+        self._store = DocumentStore(embed=embed)
+        self._records: dict[str, MemoryRecord] = {}
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as memory_file:
+                for line in memory_file:
+                    if line.strip():
+                        self._index(MemoryRecord.model_validate_json(line))
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def __len__(self) -> int:
+        """The number of entries."""
+        return len(self._records)
+
+    def _index(self, record: MemoryRecord) -> bool:
+        if record.id in self._records:
+            return False
+        self._records[record.id] = record
+        self._store.add(Document(id=record.id, title=record.kind, content=record.content))
+        return True
+
+    def remember(self, kind: MemoryKind, content: str, task: str = "") -> bool:
+        """Add an entry and append it to the file, return False if it was already remembered."""
+        if kind not in get_args(MemoryKind):
+            raise ValueError(f"Unknown memory kind {kind!r}.")
+        digest = hashlib.blake2b(f"{kind}\n{content}".encode("utf-8"), digest_size=12).hexdigest()
+        record = MemoryRecord(id=digest, kind=kind, content=content.strip(), task=task, created_at=time.time())
+        if not record.content or not self._index(record):
+            return False
+        if self._path is not None:
+            with open(self._path, "a", encoding="utf-8") as memory_file:
+                memory_file.write(record.model_dump_json() + "\n")
+        return True
+
+    def remember_run(
+        self,
+        task: str,
+        result: TaskResult,
+        writer: str = "primary",
+        critic: str = "critic",
+        approval: str = "APPROVE",
+    ) -> int:
+        """
+        Remember the critiques of a team run and, when the critic approved it, the final essay.
+        Returns the number of new entries.
+        """
+        messages = [m for m in result.messages if isinstance(m, BaseChatMessage)]
+        added = 0
+        for message in messages:
+            if message.source == critic:
+                # the approval itself teaches nothing, the feedback around it does
+                critique = message.to_text().replace(approval, "").strip()
+                if len(critique.split()) > 3:
+                    added += self.remember("critique", critique, task)
+        drafts = [m for m in messages if m.source == writer]
+        critiques = [m for m in messages if m.source == critic]
+        if drafts and critiques and approval in critiques[-1].to_text():
+            added += self.remember("essay", drafts[-1].to_text(), task)
+        return added
+
+    def _count_tokens(self, text: str) -> int:
+        if self._model_client is not None:
+            return self._model_client.count_tokens([SystemMessage(content=text)])
+        return len(text) // 4 + 1
+
+    async def query(
+        self,
+        query: str | MemoryContent = "",
+        cancellation_token: CancellationToken | None = None,
+        **kwargs: Any,
+    ) -> MemoryQueryResult:
+        """
+        The top-k entries for the query, best first, that fit together in the token budget.
+        An entry that does not fit is skipped in favour of smaller ones further down.
+        """
+        text = query if isinstance(query, str) else str(query.content)
+        budget = kwargs.get("token_budget", self._token_budget)
+        results: List[MemoryContent] = []
+        for passage in self._store.search(text, kwargs.get("k", self._k)):
+            record = self._records[passage.document_id]
+            entry = f"{record.kind.replace('_', ' ')}: {passage.text}"
+            tokens = self._count_tokens(entry)
+            if tokens > budget:
+                continue
+            budget -= tokens
+            results.append(
+                MemoryContent(
+                    content=entry,
+                    mime_type=MemoryMimeType.TEXT,
+                    metadata={"id": record.id, "kind": record.kind, "task": record.task, "score": passage.score, "tokens": tokens},
+                )
+            )
+        return MemoryQueryResult(results=results)
+
+    @staticmethod
+    def _is_memory(message: LLMMessage) -> bool:
+        return isinstance(message, SystemMessage) and message.content.startswith(_MEMORY_HEADER)
+
+    async def update_context(self, model_context: ChatCompletionContext) -> UpdateContextResult:
+        messages = await model_context.get_messages()
+        if not messages or not self._records or any(self._is_memory(message) for message in messages):
+            return UpdateContextResult(memories=MemoryQueryResult(results=[]))
+        # the task finds the lessons of similar essays, the latest critique those of similar feedback
+        task, latest = str(messages[0].content), str(messages[-1].content)
+        result = await self.query(
+            task if latest == task else f"{task}\n{latest}",
+            token_budget=self._token_budget - self._count_tokens(_MEMORY_HEADER),
+        )
+        if result.results:
+            lessons = "\n".join(f"- {memory.content}" for memory in result.results)
+            await replace_messages(model_context, self._is_memory, SystemMessage(content=f"{_MEMORY_HEADER}\n{lessons}\n"))
+        return UpdateContextResult(memories=result)
+
+    async def add(self, content: MemoryContent, cancellation_token: CancellationToken | None = None) -> None:
+        metadata = content.metadata or {}
+        self.remember(metadata.get("kind", "style_guide"), str(content.content), str(metadata.get("task", "")))
+
+    async def clear(self) -> None:
+        """Forget every entry, also in the file."""
+        self._records = {}
+        self._store.clear()
+        if self._path is not None and os.path.exists(self._path):
+            os.remove(self._path)
+
+    async def close(self) -> None:
+        pass
+
+
+def load_style_guides(memory: EssayMemory, paths: Sequence[str]) -> int:
+    """Remember each file as a style guide, one entry per paragraph. Returns the number of new entries."""
+    added = 0
+    for path in paths:
+        with open(path, encoding="utf-8") as guide_file:
+            for paragraph in guide_file.read().split("\n\n"):
+                added += memory.remember("style_guide", paragraph)
+    return added
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import time
+import warnings
+from typing import Any, AsyncGenerator, Dict, List, Literal, Mapping, Optional, Sequence, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelFamily,
+    ModelInfo,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+# words the fake drafts are made of
+_WORDS = (
+    "the sea waves salt wind tide shore blue deep light storm calm foam sail horizon gull "
+    "moon night drift current ocean whisper stone sand morning silver"
+).split()
+
+
+class FakeChatCompletionClient(ChatCompletionClient):
+    """
+    A deterministic, offline stand-in for a chat completion client, used by the benchmarks.
+
+    It sleeps `latency` seconds before the first token and then produces tokens at
+    `tokens_per_second`, so runs have realistic timing without a network or an API key.
+    Tokens are whitespace-separated words. The text of a response only depends on the prompt.
+
+    A request whose system message mentions "APPROVE" is answered as the critic: it gives feedback
+    on the first `approve_after - 1` reviews of a task and replies "APPROVE" on the next one.
+    Reviews are counted per task, the first user message, so bounded model contexts do not
+    change when the critic approves.
+    Any other request is answered with a draft of `response_tokens` words, or with a JSON object
+    of the draft when `json_output` is a Pydantic model, see :meth:`_respond_json`.
+
+    Args:
+        latency (float): Seconds before the first token.
+        tokens_per_second (float | None): Generation throughput, None for instant generation.
+        response_tokens (int): Length of a draft in tokens.
+        approve_after (int): The review of a task on which the critic approves.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: float | None = None,
+        response_tokens: int = 120,
+        approve_after: int = 3,
+    ) -> None:
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.approve_after = approve_after
+        self.calls = 0
+        # total time spent simulating the model, to separate it from framework overhead
+        self.simulated_seconds = 0.0
+        self._sleeping = 0
+        self._sleeping_since = 0.0
+        # task -> number of critic reviews so far
+        self._reviews: Dict[str, int] = {}
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._actual_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    def _respond(self, messages: Sequence[LLMMessage]) -> str:
+        system = " ".join(str(m.content) for m in messages if isinstance(m, SystemMessage))
+        if "APPROVE" in system:
+            task = next((str(m.content) for m in messages if isinstance(m, UserMessage)), "")
+            review = self._reviews.get(task, 0) + 1
+            self._reviews[task] = review
+            if review >= self.approve_after:
+                # start over, so the same task can be run again
+                self._reviews[task] = 0
+                return "APPROVE"
+            return f"Feedback on draft {review}: tighten the imagery and vary the rhythm."
+        seed = hashlib.sha256("".join(str(m.content) for m in messages).encode("utf-8")).digest()
+        return " ".join(_WORDS[seed[i % len(seed)] % len(_WORDS)] for i in range(self.response_tokens))
+
+    def _respond_json(self, messages: Sequence[LLMMessage], output_type: type[BaseModel]) -> str:
+        # the first choice of a literal, zero for numbers and the draft for text fields
+        draft = self._respond(messages)
+        fields: Dict[str, Any] = {}
+        for name, field in output_type.model_fields.items():
+            choices = get_args(field.annotation) if get_origin(field.annotation) is Literal else ()
+            if choices:
+                fields[name] = choices[0]
+            elif field.annotation in (int, float):
+                fields[name] = 0
+            elif field.annotation is bool:
+                fields[name] = False
+            else:
+                fields[name] = draft
+        return json.dumps(fields)
+
+    def _content(self, messages: Sequence[LLMMessage], json_output: Optional[bool | type[BaseModel]]) -> str:
+        if isinstance(json_output, type) and issubclass(json_output, BaseModel):
+            return self._respond_json(messages, json_output)
+        return self._respond(messages)
+
+    async def _sleep(self, seconds: float) -> None:
+        # the measured time, asyncio.sleep overshoots short delays; overlapping
+        # sleeps of concurrent requests are only counted once
+        if not self._sleeping:
+            self._sleeping_since = time.perf_counter()
+        self._sleeping += 1
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._sleeping -= 1
+            if not self._sleeping:
+                self.simulated_seconds += time.perf_counter() - self._sleeping_since
+
+    def _usage(self, messages: Sequence[LLMMessage], content: str) -> RequestUsage:
+        usage = RequestUsage(prompt_tokens=self.count_tokens(messages), completion_tokens=len(content.split()))
+        self._actual_usage = usage
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens,
+        )
+        return usage
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.calls += 1
+        content = self._content(messages, json_output)
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += len(content.split()) / self.tokens_per_second
+        if delay:
+            await self._sleep(delay)
+        return CreateResult(finish_reason="stop", content=content, usage=self._usage(messages, content), cached=False)
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            self.calls += 1
+            content = self._content(messages, json_output)
+            if self.latency:
+                await self._sleep(self.latency)
+            words: List[str] = content.split(" ")
+            for index, word in enumerate(words):
+                if self.tokens_per_second:
+                    await self._sleep(1 / self.tokens_per_second)
+                yield word if index == len(words) - 1 else word + " "
+            yield CreateResult(finish_reason="stop", content=content, usage=self._usage(messages, content), cached=False)
+
+        return _generator()
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._actual_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return sum(len(str(message.content).split()) for message in messages)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return 128_000 - self.count_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return ModelCapabilities(vision=False, function_calling=True, json_output=True)  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return ModelInfo(
+            vision=False,
+            function_calling=True,
+            json_output=True,
+            family=ModelFamily.UNKNOWN,
+            structured_output=True,
+        )
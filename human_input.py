@@ -0,0 +1,219 @@
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+# autogen_core
+from autogen_core import CancellationToken
+
+# Non-blocking human input for UserProxyAgent and stepped runs.
+#
+# The builtin input() blocks the event loop, and with it every other team in the process, until
+# the reviewer answers. An input provider waits for the answer without blocking the loop and
+# falls back to a default response when the reviewer does not answer in time:
+#
+#   reviewer = ExecutorInputProvider(timeout=300, default="APPROVE")
+#   user_proxy = UserProxyAgent("user_proxy", input_func=reviewer.input)
+
+
+class InputProvider(ABC):
+    """
+    An async source of human input. Use its `input` method as the `input_func` of a UserProxyAgent.
+
+    Args:
+        timeout (float | None): Seconds to wait for an answer, None to wait indefinitely.
+        default (str | None): The answer when the timeout expires. None raises TimeoutError instead.
+    """
+
+    def __init__(self, timeout: float | None = None, default: str | None = None) -> None:
+        self.timeout = timeout
+        self.default = default
+
+    async def input(self, prompt: str, cancellation_token: Optional[CancellationToken] = None) -> str:
+        """Ask for input and wait for the answer, the timeout or the cancellation of the run."""
+        read = asyncio.ensure_future(self._read(prompt))
+        if cancellation_token is not None:
+            cancellation_token.link_future(read)
+        try:
+            return await asyncio.wait_for(read, self.timeout)
+        except asyncio.TimeoutError:
+            if self.default is None:
+                raise
+            self._on_default(prompt)
+            return self.default
+
+    def _on_default(self, prompt: str) -> None:
+        print(f"\n(no answer within {self.timeout}s, using {self.default!r})", flush=True)
+
+    @abstractmethod
+    async def _read(self, prompt: str) -> str:
+        """Show the prompt and return the answer."""
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class ExecutorInputProvider(InputProvider):
+    """
+    Reads the console on a background daemon thread.
+
+    A read that timed out keeps waiting on its thread, the line typed next answers the next prompt.
+    The thread reads the file descriptor of stdin directly instead of calling input(): it holds no
+    lock of sys.stdin, so when nobody answers it does not keep the process from exiting.
+    """
+
+    def __init__(self, timeout: float | None = None, default: str | None = None) -> None:
+        super().__init__(timeout, default)
+        # at most one read at a time, so prompts never read the console concurrently
+        self._pending: Future[str] | None = None
+        # the bytes read after the last answered line
+        self._buffer = b""
+
+    def _read_line(self, prompt: str, answer: "Future[str]") -> None:
+        if not answer.set_running_or_notify_cancel():
+            return
+        try:
+            print(prompt, end="", flush=True)
+            while b"\n" not in self._buffer:
+                chunk = os.read(sys.stdin.fileno(), 4096)
+                if not chunk:
+                    if not self._buffer:
+                        raise EOFError("The standard input is closed.")
+                    break
+                self._buffer += chunk
+            line, _, self._buffer = self._buffer.partition(b"\n")
+            answer.set_result(line.decode("utf-8", errors="replace").rstrip("\r"))
+        except BaseException as error:
+            answer.set_exception(error)
+
+    async def _read(self, prompt: str) -> str:
+        if self._pending is None or self._pending.done():
+            self._pending = Future()
+            threading.Thread(
+                target=self._read_line, args=(prompt, self._pending), name="human-input", daemon=True
+            ).start()
+        else:
+            print(prompt, end="", flush=True)
+        pending = self._pending
+        # shield the thread's future, a timeout must not drop the line the reviewer is typing
+        answer = await asyncio.shield(asyncio.wrap_future(pending))
+        self._pending = None
+        return answer
+
+    async def close(self) -> None:
+        # a blocked read cannot be interrupted, its daemon thread ends with the process
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+
+class StreamInputProvider(InputProvider):
+    """
+    Reads lines from an asyncio stream, e.g. stdin or a pipe from another process.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of answers, one per line.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, timeout: float | None = None, default: str | None = None) -> None:
+        super().__init__(timeout, default)
+        self._reader = reader
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def stdin(cls, timeout: float | None = None, default: str | None = None) -> "StreamInputProvider":
+        """A provider reading the standard input without a thread (POSIX only)."""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        return cls(reader, timeout, default)
+
+    async def _read(self, prompt: str) -> str:
+        async with self._lock:
+            print(prompt, end="", flush=True)
+            line = await self._reader.readline()
+        if not line:
+            raise EOFError("The input stream is closed.")
+        return line.decode("utf-8").rstrip("\r\n")
+
+
+class HttpInputProvider(InputProvider):
+    """
+    A local HTTP stand-in for a review UI. Prompts wait on a small server until a reviewer answers:
+
+        curl http://127.0.0.1:8765/                   # the pending prompts, {"id": "prompt"}
+        curl -d 'APPROVE' http://127.0.0.1:8765/3     # answer prompt 3
+        curl -d 'APPROVE' http://127.0.0.1:8765/      # answer the oldest prompt
+
+    The server starts with the first prompt and stops on `close`.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 8765, timeout: float | None = None, default: str | None = None
+    ) -> None:
+        super().__init__(timeout, default)
+        self.host = host
+        self.port = port
+        self._server: asyncio.AbstractServer | None = None
+        self._ids = itertools.count(1)
+        # prompt id -> (prompt, future of the answer), oldest first
+        self._pending: Dict[str, tuple[str, asyncio.Future[str]]] = {}
+
+    async def start(self) -> None:
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            # port 0 picks a free port
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _read(self, prompt: str) -> str:
+        await self.start()
+        prompt_id = str(next(self._ids))
+        answer: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        self._pending[prompt_id] = (prompt, answer)
+        print(f"{prompt} [waiting for an answer on http://{self.host}:{self.port}/{prompt_id}]", flush=True)
+        try:
+            return await answer
+        finally:
+            self._pending.pop(prompt_id, None)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers: Dict[str, str] = {}
+            while (line := (await reader.readline()).decode("latin-1").strip()):
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", "0")))
+            method, path = (request_line + ["", ""])[:2]
+            prompt_id = path.strip("/") or next(iter(self._pending), "")
+            if method == "GET":
+                status, payload = "200 OK", json.dumps({key: prompt for key, (prompt, _) in self._pending.items()})
+            elif method == "POST" and prompt_id in self._pending:
+                _, answer = self._pending[prompt_id]
+                if not answer.done():
+                    answer.set_result(body.decode("utf-8").strip())
+                status, payload = "200 OK", json.dumps({"answered": prompt_id})
+            else:
+                status, payload = "404 Not Found", json.dumps({"error": "no such prompt"})
+            data = payload.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,235 @@
+import json
+import math
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, List, Sequence, Set
+
+from pydantic import BaseModel, Field
+
+# autogen_agentchat
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, ModelClientStreamingChunkEvent
+
+# Per-turn latency and token instrumentation.
+# Agents and the team loop record one TurnRecord per agent turn into a Tracer, which exports
+# the records as OpenTelemetry-style span JSON lines and summarizes them per agent.
+
+# the turn being recorded in the current task, the scheduler adds its queue wait to it
+_current_turn: ContextVar["TurnRecord | None"] = ContextVar("current_turn", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class TurnRecord(BaseModel):
+    """
+    The measurements of one agent turn. Times are in seconds, timestamps in unix nanoseconds.
+    """
+
+    agent: str
+    span_id: str = Field(default_factory=lambda: _new_id(8))
+    message_id: str | None = None
+    start_ns: int = Field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    time_to_first_token: float | None = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # prompt tokens the provider reported as served from its prompt cache, see openai_usage
+    cached_tokens: int = 0
+    # an upper-bound estimate of the prompt tokens a prefix cache could serve, see prompt_prefix.PrefixCacheStats
+    estimated_cached_tokens: int = 0
+    queue_wait: float = 0.0
+    # "agent" when recorded by the agent itself, "team" when measured from the team's message stream
+    recorded_by: str = "agent"
+
+    @property
+    def wall_time(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+
+def record_queue_wait(seconds: float) -> None:
+    """
+    Add time spent waiting for a model request slot to the turn being recorded, if any.
+    """
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.queue_wait += seconds
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """The nearest-rank percentile `q` (0-100) of `values`."""
+    ordered = sorted(values)
+    if not ordered:
+        return math.nan
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Tracer:
+    """
+    Collects the turn records of one or more team runs.
+
+    Example:
+
+        tracer = Tracer()
+        critic = CustomAgent(..., tracer=tracer)
+        await Console(tracer.trace_stream(team.run_stream(task=...)))
+        tracer.export_jsonl("traces.jsonl")
+        tracer.print_summary()
+    """
+
+    def __init__(self, service_name: str = "essay-writer") -> None:
+        self.service_name = service_name
+        self.trace_id = _new_id(16)
+        self.records: List[TurnRecord] = []
+        # runs of the team loop, as (span id, start, end)
+        self._runs: List[tuple[str, int, int]] = []
+        self._run_span_id: str | None = None
+
+    def start_turn(self, agent: str) -> TurnRecord:
+        """
+        Start recording a turn of `agent` in the current task.
+        """
+        turn = TurnRecord(agent=agent)
+        _current_turn.set(turn)
+        return turn
+
+    def end_turn(self, turn: TurnRecord) -> None:
+        turn.end_ns = time.time_ns()
+        if _current_turn.get() is turn:
+            _current_turn.set(None)
+        self.records.append(turn)
+
+    async def trace_stream(
+        self, stream: AsyncGenerator[BaseAgentEvent | BaseChatMessage | TaskResult, None]
+    ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | TaskResult, None]:
+        """
+        Pass a `run_stream` through unchanged and record a turn for every message of an agent
+        that does not record its own turns, e.g. AssistantAgent. The turn of such an agent is
+        measured from the previous message of the stream.
+        """
+        run_span_id = _new_id(8)
+        self._run_span_id = run_span_id
+        run_start = time.time_ns()
+        turn_start = run_start
+        first_chunk: Dict[str, int] = {}
+        recorded: Set[str | None] = {record.message_id for record in self.records}
+        try:
+            async for message in stream:
+                now = time.time_ns()
+                if isinstance(message, ModelClientStreamingChunkEvent):
+                    first_chunk.setdefault(message.source, now)
+                elif isinstance(message, BaseChatMessage) and message.source != "user":
+                    # turns recorded by the agent itself are more precise than the stream timing
+                    recorded.update(record.message_id for record in self.records)
+                    if message.id not in recorded:
+                        usage = message.models_usage
+                        chunk_at = first_chunk.get(message.source)
+                        self.records.append(
+                            TurnRecord(
+                                agent=message.source,
+                                message_id=message.id,
+                                start_ns=turn_start,
+                                end_ns=now,
+                                time_to_first_token=(chunk_at - turn_start) / 1e9 if chunk_at else None,
+                                prompt_tokens=usage.prompt_tokens if usage else 0,
+                                completion_tokens=usage.completion_tokens if usage else 0,
+                                cached_tokens=int(getattr(usage, "cached_tokens", 0) or 0),
+                                recorded_by="team",
+                            )
+                        )
+                    first_chunk.pop(message.source, None)
+                    turn_start = now
+                elif isinstance(message, BaseChatMessage):
+                    turn_start = now
+                yield message
+        finally:
+            self._runs.append((run_span_id, run_start, time.time_ns()))
+            self._run_span_id = None
+
+    def to_spans(self) -> List[Dict[str, Any]]:
+        """
+        The runs and turns as spans in the OpenTelemetry JSON layout.
+        """
+        spans: List[Dict[str, Any]] = []
+        for span_id, start, end in self._runs:
+            spans.append(self._span("team.run", span_id, None, start, end, {}))
+        for record in self.records:
+            attributes = {
+                "agent.name": record.agent,
+                "agent.message_id": record.message_id,
+                "agent.recorded_by": record.recorded_by,
+                "llm.time_to_first_token_s": record.time_to_first_token,
+                "llm.usage.prompt_tokens": record.prompt_tokens,
+                "llm.usage.completion_tokens": record.completion_tokens,
+                "llm.usage.cached_tokens": record.cached_tokens,
+                "llm.usage.estimated_cached_tokens": record.estimated_cached_tokens,
+                "llm.queue_wait_s": record.queue_wait,
+            }
+            parent = self._parent_of(record)
+            spans.append(self._span(f"agent.turn {record.agent}", record.span_id, parent, record.start_ns, record.end_ns, attributes))
+        return spans
+
+    def _parent_of(self, record: TurnRecord) -> str | None:
+        for span_id, start, end in self._runs:
+            if start <= record.start_ns <= end:
+                return span_id
+        return self._run_span_id
+
+    def _span(
+        self, name: str, span_id: str, parent_span_id: str | None, start: int, end: int | None, attributes: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return {
+            "resource": {"service.name": self.service_name},
+            "trace_id": self.trace_id,
+            "span_id": span_id,
+            "parent_span_id": parent_span_id,
+            "name": name,
+            "start_time_unix_nano": start,
+            "end_time_unix_nano": end,
+            "attributes": {key: value for key, value in attributes.items() if value is not None},
+        }
+
+    def export_jsonl(self, path: str) -> None:
+        """Append all spans to a JSONL file, one span per line."""
+        with open(path, "a", encoding="utf-8") as trace_file:
+            for span in self.to_spans():
+                trace_file.write(json.dumps(span) + "\n")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        The p50/p95 wall time, time to first token and queue wait, and the token totals, per agent.
+        """
+        by_agent: Dict[str, List[TurnRecord]] = {}
+        for record in self.records:
+            by_agent.setdefault(record.agent, []).append(record)
+        report: Dict[str, Dict[str, float]] = {}
+        for agent, records in by_agent.items():
+            wall_times = [record.wall_time for record in records]
+            ttfts = [record.time_to_first_token for record in records if record.time_to_first_token is not None]
+            waits = [record.queue_wait for record in records]
+            report[agent] = {
+                "turns": len(records),
+                "wall_p50_s": percentile(wall_times, 50),
+                "wall_p95_s": percentile(wall_times, 95),
+                "ttft_p50_s": percentile(ttfts, 50),
+                "ttft_p95_s": percentile(ttfts, 95),
+                "queue_wait_p95_s": percentile(waits, 95),
+                "prompt_tokens": sum(record.prompt_tokens for record in records),
+                "completion_tokens": sum(record.completion_tokens for record in records),
+                "cached_tokens": sum(record.cached_tokens for record in records),
+                "estimated_cached_tokens": sum(record.estimated_cached_tokens for record in records),
+            }
+        return report
+
+    def print_summary(self) -> None:
+        print(f"{'agent':<16}{'turns':>6}{'wall p50':>10}{'wall p95':>10}{'ttft p50':>10}{'ttft p95':>10}{'wait p95':>10}{'prompt':>9}{'compl.':>8}{'cached':>8}{'est.cached':>11}")
+        for agent, stats in self.summary().items():
+            print(
+                f"{agent:<16}{stats['turns']:>6}{stats['wall_p50_s']:>10.3f}{stats['wall_p95_s']:>10.3f}"
+                f"{stats['ttft_p50_s']:>10.3f}{stats['ttft_p95_s']:>10.3f}{stats['queue_wait_p95_s']:>10.3f}"
+                f"{stats['prompt_tokens']:>9}{stats['completion_tokens']:>8}{stats['cached_tokens']:>8}"
+                f"{stats['estimated_cached_tokens']:>11}"
+            )
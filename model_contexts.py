@@ -0,0 +1,462 @@
+import difflib
+import itertools
+from typing import Any, Callable, List, Mapping, Set
+
+from pydantic import BaseModel, Field
+from typing_extensions import Self
+
+# autogen_core
+from autogen_core import CancellationToken, Component, ComponentModel
+from autogen_core.model_context import ChatCompletionContext, ChatCompletionContextState
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    SystemMessage,
+    UserMessage,
+)
+
+# Bounded model contexts for the writer/critic loop.
+# The system message is held by the agent itself and always sent, so the contexts
+# below only have to decide which of the conversation messages survive. All of them
+# pin the first message (the user task) and the latest draft of the writer, and
+# evict or compress the critique rounds in between, or, in the diff context, the
+# earlier drafts.
+#
+# Memories that refresh a message every round, such as the research passages, replace it
+# with `replace_messages`, so the copies hidden by the context strategy do not pile up.
+
+
+def _pinned_indices(messages: List[LLMMessage], draft_source: str | None) -> Set[int]:
+    """
+    Indices of the messages that are never evicted: the task and the latest draft.
+    """
+    pinned: Set[int] = set()
+    if not messages:
+        return pinned
+    pinned.add(0)
+    if draft_source is None:
+        pinned.add(len(messages) - 1)
+        return pinned
+    for index in range(len(messages) - 1, -1, -1):
+        if getattr(messages[index], "source", None) == draft_source:
+            pinned.add(index)
+            break
+    return pinned
+
+
+def _drop_orphan_tool_results(messages: List[LLMMessage]) -> List[LLMMessage]:
+    """
+    Drop function results whose function call message has been evicted.
+    """
+    kept: List[LLMMessage] = []
+    for message in messages:
+        if isinstance(message, FunctionExecutionResultMessage) and not (
+            kept and isinstance(kept[-1], AssistantMessage) and isinstance(kept[-1].content, list)
+        ):
+            continue
+        kept.append(message)
+    return kept
+
+
+def _render(message: LLMMessage) -> str:
+    source = getattr(message, "source", None) or type(message).__name__
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return f"{source}: {content}"
+
+
+class ReplaceableChatCompletionContext(ChatCompletionContext):
+    """
+    A model context whose stored messages can be replaced without going through its saved state.
+    Contexts that keep state by message index update it in `_on_removed`.
+    """
+
+    async def replace_messages(self, match: Callable[[LLMMessage], bool], message: LLMMessage) -> None:
+        """Remove every stored message that `match`es, hidden ones included, and add `message`."""
+        removed = [index for index, stored in enumerate(self._messages) if match(stored)]
+        if removed:
+            self._messages = [stored for stored in self._messages if not match(stored)]
+            self._on_removed(removed)
+        await self.add_message(message)
+
+    def _on_removed(self, indices: List[int]) -> None:
+        """Called with the former indices of the removed messages."""
+
+
+async def replace_messages(
+    model_context: ChatCompletionContext, match: Callable[[LLMMessage], bool], message: LLMMessage
+) -> None:
+    """
+    Remove the stored messages of `model_context` that `match` and add `message`. Contexts other
+    than :class:`ReplaceableChatCompletionContext`, e.g. the autogen ones, keep only messages in
+    their state and are updated through it.
+    """
+    if isinstance(model_context, ReplaceableChatCompletionContext):
+        await model_context.replace_messages(match, message)
+        return
+    state = dict(await model_context.save_state())
+    stored = ChatCompletionContextState.model_validate(state).messages
+    kept = [message for message in stored if not match(message)]
+    if len(kept) < len(stored):
+        state["messages"] = [message.model_dump() for message in kept]
+        await model_context.load_state(state)
+    await model_context.add_message(message)
+
+
+class DraftBufferedChatCompletionContextConfig(BaseModel):
+    buffer_size: int
+    draft_source: str | None = None
+    initial_messages: List[LLMMessage] | None = None
+
+
+class DraftBufferedChatCompletionContext(
+    ReplaceableChatCompletionContext, Component[DraftBufferedChatCompletionContextConfig]
+):
+    """
+    Keeps the last `buffer_size` messages, plus the task and the latest draft from `draft_source`
+    even when they fall outside the buffer.
+    """
+
+    component_config_schema = DraftBufferedChatCompletionContextConfig
+    component_provider_override = "model_contexts.DraftBufferedChatCompletionContext"
+
+    def __init__(
+        self,
+        buffer_size: int,
+        draft_source: str | None = None,
+        initial_messages: List[LLMMessage] | None = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        if buffer_size <= 0:
+            raise ValueError("buffer_size must be greater than 0.")
+        self._buffer_size = buffer_size
+        self._draft_source = draft_source
+
+    async def get_messages(self) -> List[LLMMessage]:
+        """Get the pinned messages and at most `buffer_size` recent messages, in order."""
+        keep = _pinned_indices(self._messages, self._draft_source)
+        keep.update(range(max(0, len(self._messages) - self._buffer_size), len(self._messages)))
+        return _drop_orphan_tool_results([self._messages[i] for i in sorted(keep)])
+
+    def _to_config(self) -> DraftBufferedChatCompletionContextConfig:
+        return DraftBufferedChatCompletionContextConfig(
+            buffer_size=self._buffer_size,
+            draft_source=self._draft_source,
+            initial_messages=self._initial_messages,
+        )
+
+    @classmethod
+    def _from_config(cls, config: DraftBufferedChatCompletionContextConfig) -> Self:
+        return cls(**config.model_dump())
+
+
+class DraftTokenBudgetChatCompletionContextConfig(BaseModel):
+    model_client: ComponentModel
+    token_limit: int
+    draft_source: str | None = None
+    initial_messages: List[LLMMessage] | None = None
+
+
+class DraftTokenBudgetChatCompletionContext(
+    ReplaceableChatCompletionContext, Component[DraftTokenBudgetChatCompletionContextConfig]
+):
+    """
+    Keeps the context under `token_limit` tokens, counted with the model client.
+    The oldest unpinned messages are evicted first; the task and the latest draft are always kept.
+    """
+
+    component_config_schema = DraftTokenBudgetChatCompletionContextConfig
+    component_provider_override = "model_contexts.DraftTokenBudgetChatCompletionContext"
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        token_limit: int,
+        draft_source: str | None = None,
+        initial_messages: List[LLMMessage] | None = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        if token_limit <= 0:
+            raise ValueError("token_limit must be greater than 0.")
+        self._model_client = model_client
+        self._token_limit = token_limit
+        self._draft_source = draft_source
+
+    async def get_messages(self) -> List[LLMMessage]:
+        """Get the most recent messages that fit in `token_limit`, plus the pinned messages."""
+        pinned = _pinned_indices(self._messages, self._draft_source)
+        keep = list(range(len(self._messages)))
+        evictable = [i for i in keep if i not in pinned]
+        messages = [self._messages[i] for i in keep]
+        while evictable and self._model_client.count_tokens(messages) > self._token_limit:
+            keep.remove(evictable.pop(0))
+            messages = [self._messages[i] for i in keep]
+        return _drop_orphan_tool_results(messages)
+
+    def _to_config(self) -> DraftTokenBudgetChatCompletionContextConfig:
+        return DraftTokenBudgetChatCompletionContextConfig(
+            model_client=self._model_client.dump_component(),
+            token_limit=self._token_limit,
+            draft_source=self._draft_source,
+            initial_messages=self._initial_messages,
+        )
+
+    @classmethod
+    def _from_config(cls, config: DraftTokenBudgetChatCompletionContextConfig) -> Self:
+        return cls(
+            model_client=ChatCompletionClient.load_component(config.model_client),
+            token_limit=config.token_limit,
+            draft_source=config.draft_source,
+            initial_messages=config.initial_messages,
+        )
+
+
+class SummarizingChatCompletionContextState(ChatCompletionContextState):
+    summary: str | None = None
+    summarized_indices: List[int] = Field(default_factory=list)
+
+
+class SummarizingChatCompletionContextConfig(BaseModel):
+    model_client: ComponentModel
+    keep_last: int
+    draft_source: str | None = None
+    summary_prompt: str | None = None
+    initial_messages: List[LLMMessage] | None = None
+
+
+class SummarizingChatCompletionContext(
+    ReplaceableChatCompletionContext, Component[SummarizingChatCompletionContextConfig]
+):
+    """
+    Keeps the last `keep_last` messages verbatim and compresses the older turns into a single
+    summary message produced by the model client. The summary is extended incrementally, so each
+    evicted message is summarized once rather than on every call.
+    The task and the latest draft are always kept verbatim.
+    """
+
+    component_config_schema = SummarizingChatCompletionContextConfig
+    component_provider_override = "model_contexts.SummarizingChatCompletionContext"
+
+    DEFAULT_SUMMARY_PROMPT = (
+        "Summarize the earlier rounds of this writing and critique conversation. "
+        "Keep every piece of feedback that is still relevant and drop anything that was already addressed. "
+        "Be brief."
+    )
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        keep_last: int,
+        draft_source: str | None = None,
+        summary_prompt: str | None = None,
+        initial_messages: List[LLMMessage] | None = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        if keep_last <= 0:
+            raise ValueError("keep_last must be greater than 0.")
+        self._model_client = model_client
+        self._keep_last = keep_last
+        self._draft_source = draft_source
+        self._summary_prompt = summary_prompt
+        self._summary: str | None = None
+        # indices of the messages already folded into the summary, a draft that loses its pin
+        # is summarized then even when later messages were summarized before it
+        self._summarized: Set[int] = set()
+
+    async def get_messages(self) -> List[LLMMessage]:
+        """Get the task, a summary of the older turns and the recent messages."""
+        pinned = _pinned_indices(self._messages, self._draft_source)
+        recent_start = max(1, len(self._messages) - self._keep_last)
+        older = [i for i in range(1, recent_start) if i not in pinned]
+        pending = [i for i in older if i not in self._summarized]
+        if pending:
+            await self._extend_summary([self._messages[i] for i in pending])
+            self._summarized.update(pending)
+
+        messages: List[LLMMessage] = [self._messages[0]] if self._messages else []
+        if self._summary:
+            messages.append(UserMessage(content=f"Summary of earlier rounds:\n{self._summary}", source="summary"))
+        keep = sorted((pinned - {0}) | set(range(recent_start, len(self._messages))))
+        messages.extend(self._messages[i] for i in keep)
+        return _drop_orphan_tool_results(messages)
+
+    async def _extend_summary(self, messages: List[LLMMessage]) -> None:
+        transcript = "\n\n".join(_render(message) for message in messages)
+        if self._summary:
+            transcript = f"Previous summary:\n{self._summary}\n\nNew messages:\n{transcript}"
+        result = await self._model_client.create(
+            [
+                SystemMessage(content=self._summary_prompt or self.DEFAULT_SUMMARY_PROMPT),
+                UserMessage(content=transcript, source="user"),
+            ],
+            cancellation_token=CancellationToken(),
+        )
+        assert isinstance(result.content, str), "The summary should be a text result."
+        self._summary = result.content
+
+    def _on_removed(self, indices: List[int]) -> None:
+        # the summarized messages after a removed one move down
+        removed = set(indices)
+        self._summarized = {
+            index - sum(1 for gone in indices if gone < index) for index in self._summarized if index not in removed
+        }
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._summary = None
+        self._summarized = set()
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return SummarizingChatCompletionContextState(
+            messages=self._messages,
+            summary=self._summary,
+            summarized_indices=sorted(self._summarized),
+        ).model_dump()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        context_state = SummarizingChatCompletionContextState.model_validate(state)
+        self._messages = context_state.messages
+        self._summary = context_state.summary
+        self._summarized = set(context_state.summarized_indices)
+
+    def _to_config(self) -> SummarizingChatCompletionContextConfig:
+        return SummarizingChatCompletionContextConfig(
+            model_client=self._model_client.dump_component(),
+            keep_last=self._keep_last,
+            draft_source=self._draft_source,
+            summary_prompt=self._summary_prompt,
+            initial_messages=self._initial_messages,
+        )
+
+    @classmethod
+    def _from_config(cls, config: SummarizingChatCompletionContextConfig) -> Self:
+        return cls(
+            model_client=ChatCompletionClient.load_component(config.model_client),
+            keep_last=config.keep_last,
+            draft_source=config.draft_source,
+            summary_prompt=config.summary_prompt,
+            initial_messages=config.initial_messages,
+        )
+
+
+def draft_delta(previous: str, current: str, context_lines: int = 1) -> str:
+    """
+    The line changes from `previous` to `current` as a unified diff without the file header.
+    """
+    lines = difflib.unified_diff(previous.splitlines(), current.splitlines(), n=context_lines, lineterm="")
+    return "\n".join(itertools.islice(lines, 2, None))
+
+
+class DraftDiffChatCompletionContextState(ChatCompletionContextState):
+    revision: int = 0
+    latest_delta: LLMMessage | None = None
+
+
+class DraftDiffChatCompletionContextConfig(BaseModel):
+    draft_source: str
+    context_lines: int = 1
+    buffer_size: int | None = None
+    initial_messages: List[LLMMessage] | None = None
+
+
+class DraftDiffChatCompletionContext(ReplaceableChatCompletionContext, Component[DraftDiffChatCompletionContextConfig]):
+    """
+    Keeps the latest draft from `draft_source` in full and each earlier draft as the diff against
+    the draft before it, so the history shows how every critique was addressed without a full copy
+    per round. The first draft is replaced by a short note once it is revised, and a revision that
+    rewrites most of the text is kept in full when its diff would be longer.
+
+    The drafts are compacted when they are added, which shrinks the stored context and the saved
+    team state as well as the prompts.
+
+    Args:
+        draft_source (str): The name of the writer agent.
+        context_lines (int): The unchanged lines kept around each change.
+        buffer_size (int | None): Also keep only the last `buffer_size` messages besides the task
+            and the latest draft, like :class:`DraftBufferedChatCompletionContext`.
+    """
+
+    component_config_schema = DraftDiffChatCompletionContextConfig
+    component_provider_override = "model_contexts.DraftDiffChatCompletionContext"
+
+    def __init__(
+        self,
+        draft_source: str,
+        context_lines: int = 1,
+        buffer_size: int | None = None,
+        initial_messages: List[LLMMessage] | None = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        if buffer_size is not None and buffer_size <= 0:
+            raise ValueError("buffer_size must be greater than 0.")
+        self._draft_source = draft_source
+        self._context_lines = context_lines
+        self._buffer_size = buffer_size
+        self._revision = 0
+        # the compact form of the latest draft, it replaces the draft when the next revision arrives
+        self._latest_delta: LLMMessage | None = None
+
+    def _is_draft(self, message: LLMMessage) -> bool:
+        return getattr(message, "source", None) == self._draft_source and isinstance(message.content, str)
+
+    async def add_message(self, message: LLMMessage) -> None:
+        """Add a message, compacting the previous draft when `message` is a new revision."""
+        if self._is_draft(message):
+            self._revision += 1
+            latest = next((i for i in range(len(self._messages) - 1, -1, -1) if self._is_draft(self._messages[i])), None)
+            assert isinstance(message.content, str)
+            if latest is None:
+                note = f"[draft {self._revision} by {self._draft_source}, superseded by the revisions below]"
+                self._latest_delta = message.model_copy(update={"content": note})
+            else:
+                previous = self._messages[latest]
+                assert isinstance(previous.content, str)
+                delta = draft_delta(previous.content, message.content, self._context_lines)
+                if self._latest_delta is not None:
+                    self._messages[latest] = self._latest_delta
+                header = f"[draft {self._revision} by {self._draft_source}, changes to draft {self._revision - 1}]"
+                compact = f"{header}\n{delta}" if delta else f"{header}\n(no changes)"
+                # a rewrite is kept in full, its diff would be longer than the text
+                self._latest_delta = (
+                    message.model_copy(update={"content": compact}) if len(compact) < len(message.content) else None
+                )
+        await super().add_message(message)
+
+    async def get_messages(self) -> List[LLMMessage]:
+        """Get the messages with the earlier drafts as diffs, the last `buffer_size` when set."""
+        if self._buffer_size is None:
+            return list(self._messages)
+        keep = _pinned_indices(self._messages, self._draft_source)
+        keep.update(range(max(0, len(self._messages) - self._buffer_size), len(self._messages)))
+        return _drop_orphan_tool_results([self._messages[i] for i in sorted(keep)])
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._revision = 0
+        self._latest_delta = None
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return DraftDiffChatCompletionContextState(
+            messages=self._messages,
+            revision=self._revision,
+            latest_delta=self._latest_delta,
+        ).model_dump()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        context_state = DraftDiffChatCompletionContextState.model_validate(state)
+        self._messages = context_state.messages
+        self._revision = context_state.revision
+        self._latest_delta = context_state.latest_delta
+
+    def _to_config(self) -> DraftDiffChatCompletionContextConfig:
+        return DraftDiffChatCompletionContextConfig(
+            draft_source=self._draft_source,
+            context_lines=self._context_lines,
+            buffer_size=self._buffer_size,
+            initial_messages=self._initial_messages,
+        )
+
+    @classmethod
+    def _from_config(cls, config: DraftDiffChatCompletionContextConfig) -> Self:
+        return cls(**config.model_dump())
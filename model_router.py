@@ -0,0 +1,360 @@
+import math
+import os
+import time
+import warnings
+from collections import deque
+from contextvars import ContextVar
+from types import TracebackType
+from typing import Any, AsyncGenerator, Deque, Dict, Literal, Mapping, Optional, Sequence, Union
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+# local
+from client_pool import ClientPool
+
+# Role-based model routing, configured in model_config.yaml.
+#
+# Not every turn needs the strongest model: the critic's feedback and "APPROVE" turns, the plan
+# and the search queries are short and run well on a fast model, while the writer's drafts get
+# the strong one. Each role names a model of the config, and optionally a fallback model that
+# takes over while the p95 latency per completion token of the role's model is above a threshold:
+#
+#   async with ModelRouter.from_yaml("model_config.yaml") as router:
+#       team = create_team(router.client("writer"), critic_client=router.client("critic"))
+
+# the roles of the essay writer's agents
+ROLES = ("planner", "researcher", "writer", "critic", "summarizer")
+
+# the model client that served the latest request of a FallbackChatCompletionClient in the current
+# context, so a caller can tell a fallback response from a primary one
+served_by: ContextVar[ChatCompletionClient | None] = ContextVar("served_by", default=None)
+
+
+class LatencyWindow:
+    """
+    The latencies of the most recent requests, in seconds, or seconds per token.
+
+    Args:
+        size (int): The number of requests kept.
+    """
+
+    def __init__(self, size: int = 20) -> None:
+        self._latencies: Deque[float] = deque(maxlen=size)
+
+    def add(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def clear(self) -> None:
+        self._latencies.clear()
+
+    def percentile(self, percent: float) -> float | None:
+        """The nearest-rank percentile of the window, None when it is empty."""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+
+class FallbackChatCompletionClient(ChatCompletionClient):
+    """
+    A ChatCompletionClient that sends requests to `client` while its p95 latency per completion
+    token stays under `p95_threshold`, and to `fallback` for `cooldown` seconds after it goes over.
+    After the cooldown the window is cleared and `client` is measured again from scratch.
+
+    The latency of a request is divided by its completion tokens, so a long draft is not taken for
+    a slow model; streams and single responses are measured the same way. Responses served from a
+    response cache are not measured.
+
+    Args:
+        client (ChatCompletionClient): The primary model client.
+        fallback (ChatCompletionClient): The model client used while the primary is slow.
+        p95_threshold (float): The p95 latency per completion token of the primary, in seconds, above
+            which the fallback is used.
+        window (int): The number of recent primary requests the p95 is computed on.
+        min_samples (int): The number of primary requests needed before the p95 is trusted.
+        cooldown (float): Seconds on the fallback before the primary is tried again.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        fallback: ChatCompletionClient,
+        p95_threshold: float,
+        window: int = 20,
+        min_samples: int = 5,
+        cooldown: float = 60.0,
+    ) -> None:
+        self.client = client
+        self.fallback = fallback
+        self.p95_threshold = p95_threshold
+        self.latencies = LatencyWindow(window)
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._fallback_until: float | None = None
+        # requests sent to each client, and the number of switches to the fallback
+        self.primary_requests = 0
+        self.fallback_requests = 0
+        self.switches = 0
+
+    @property
+    def on_fallback(self) -> bool:
+        if self._fallback_until is not None and time.monotonic() >= self._fallback_until:
+            # the cooldown is over, measure the primary again
+            self._fallback_until = None
+            self.latencies.clear()
+        return self._fallback_until is not None
+
+    def _select(self) -> ChatCompletionClient:
+        if self.on_fallback:
+            self.fallback_requests += 1
+            return self.fallback
+        self.primary_requests += 1
+        return self.client
+
+    def _record(self, result: CreateResult, elapsed: float, chunks: int = 0) -> None:
+        if result.cached:
+            return
+        # providers that report no usage are measured per streamed chunk, or per four characters
+        tokens = result.usage.completion_tokens or chunks or len(str(result.content)) // 4
+        self.latencies.add(elapsed / max(tokens, 1))
+        p95 = self.latencies.percentile(95)
+        if len(self.latencies) >= self.min_samples and p95 is not None and p95 > self.p95_threshold:
+            self._fallback_until = time.monotonic() + self.cooldown
+            self.switches += 1
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        client = self._select()
+        served_by.set(client)
+        started_at = time.perf_counter()
+        result = await client.create(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        if client is self.client:
+            self._record(result, time.perf_counter() - started_at)
+        return result
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            client = self._select()
+            served_by.set(client)
+            started_at = time.perf_counter()
+            chunks = 0
+            async for chunk in client.create_stream(
+                messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(chunk, CreateResult):
+                    if client is self.client:
+                        self._record(chunk, time.perf_counter() - started_at, chunks)
+                else:
+                    chunks += 1
+                yield chunk
+
+        return _generator()
+
+    async def close(self) -> None:
+        await self.client.close()
+        await self.fallback.close()
+
+    def actual_usage(self) -> RequestUsage:
+        primary, fallback = self.client.actual_usage(), self.fallback.actual_usage()
+        return RequestUsage(
+            prompt_tokens=primary.prompt_tokens + fallback.prompt_tokens,
+            completion_tokens=primary.completion_tokens + fallback.completion_tokens,
+        )
+
+    def total_usage(self) -> RequestUsage:
+        primary, fallback = self.client.total_usage(), self.fallback.total_usage()
+        return RequestUsage(
+            prompt_tokens=primary.prompt_tokens + fallback.prompt_tokens,
+            completion_tokens=primary.completion_tokens + fallback.completion_tokens,
+        )
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        # the smaller of the two windows, the prompt has to fit whichever client gets it
+        return min(
+            self.client.remaining_tokens(messages, tools=tools), self.fallback.remaining_tokens(messages, tools=tools)
+        )
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return self.client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.client.model_info
+
+
+class RoleRoute(BaseModel):
+    """
+    The models of a role in model_config.yaml.
+    """
+
+    model: str
+    """The name of the role's model in `models`."""
+
+    fallback: str | None = None
+    """The model used while the p95 latency per completion token of `model` is above `p95_ms_per_token`."""
+
+    p95_ms_per_token: float | None = None
+    """The p95 threshold of the latency of `model` divided by the completion tokens, in milliseconds."""
+
+    window: int = 20
+    min_samples: int = 5
+    cooldown_s: float = 60.0
+
+
+class ModelRouter:
+    """
+    Maps agent roles to model clients. Clients come from a :class:`client_pool.ClientPool` on first
+    use: roles routed to the same model share one client, and so one response cache.
+
+    Args:
+        models (Mapping[str, Mapping[str, Any]]): Model client component configs by name, each with
+            a `provider` and a `config`.
+        routes (Mapping[str, RoleRoute]): The route of each role. Roles without a route use the
+            `default` model.
+        pool (ClientPool | None): The pool of the clients, shared with other routers and teams.
+            By default the router creates its own and closes it in `close`.
+    """
+
+    def __init__(
+        self, models: Mapping[str, Mapping[str, Any]], routes: Mapping[str, RoleRoute], pool: ClientPool | None = None
+    ) -> None:
+        for route in routes.values():
+            for name in (route.model, route.fallback):
+                if name is not None and name not in models:
+                    raise ValueError(f"Model {name!r} is routed to but not defined in the models.")
+        self._models = dict(models)
+        self._routes = dict(routes)
+        self._owns_pool = pool is None
+        self._pool = pool if pool is not None else ClientPool()
+        self._clients: Dict[str, ChatCompletionClient] = {}
+        self._role_clients: Dict[str, ChatCompletionClient] = {}
+
+    @classmethod
+    def from_yaml(cls, path: str = "model_config.yaml", pool: ClientPool | None = None) -> "ModelRouter":
+        """
+        Load the router from a model config file. The top-level `provider`/`config` is the
+        `default` model; `${VAR}` in a value is replaced with the environment variable.
+        """
+        import yaml
+
+        with open(path, encoding="utf-8") as config_file:
+            config = _expand_env(yaml.safe_load(config_file) or {})
+        models: Dict[str, Mapping[str, Any]] = dict(config.get("models") or {})
+        if "provider" in config:
+            models.setdefault("default", {"provider": config["provider"], "config": config.get("config", {})})
+        routes = {
+            role: RoleRoute(model=route) if isinstance(route, str) else RoleRoute.model_validate(route)
+            for role, route in (config.get("roles") or {}).items()
+        }
+        return cls(models, routes, pool=pool)
+
+    def _model_client(self, name: str) -> ChatCompletionClient:
+        if name not in self._clients:
+            self._clients[name] = self._pool.get(self._models[name])
+        return self._clients[name]
+
+    def client(self, role: str) -> ChatCompletionClient:
+        """The model client of `role`."""
+        if role not in self._role_clients:
+            route = self._routes.get(role)
+            if route is None:
+                if "default" not in self._models:
+                    raise ValueError(f"No route for role {role!r} and no default model.")
+                route = RoleRoute(model="default")
+            client = self._model_client(route.model)
+            if route.fallback is not None and route.p95_ms_per_token is not None:
+                client = FallbackChatCompletionClient(
+                    client,
+                    self._model_client(route.fallback),
+                    p95_threshold=route.p95_ms_per_token / 1000,
+                    window=route.window,
+                    min_samples=route.min_samples,
+                    cooldown=route.cooldown_s,
+                )
+            self._role_clients[role] = client
+        return self._role_clients[role]
+
+    def total_usage(self) -> RequestUsage:
+        """The usage of all model clients."""
+        usages = [client.total_usage() for client in self._clients.values()]
+        return RequestUsage(
+            prompt_tokens=sum(usage.prompt_tokens for usage in usages),
+            completion_tokens=sum(usage.completion_tokens for usage in usages),
+        )
+
+    async def close(self) -> None:
+        """Close the router's own pool; a pool passed in is closed by its owner."""
+        self._clients.clear()
+        self._role_clients.clear()
+        if self._owns_pool:
+            await self._pool.aclose()
+
+    async def __aenter__(self) -> "ModelRouter":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+
+def _expand_env(value: Any) -> Any:
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, dict):
+        return {key: _expand_env(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand_env(item) for item in value]
+    return value
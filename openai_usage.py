@@ -0,0 +1,110 @@
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Awaitable, Callable, List, Sequence
+
+# autogen_core
+from autogen_core.models import CreateResult
+
+# autogen_ext
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient, OpenAIChatCompletionClient
+
+# local
+from prompt_prefix import CachedTokensUsage
+
+# The OpenAI clients with the provider's count of cached prompt tokens. RequestUsage has no field
+# for it and OpenAIChatCompletionClient drops the response's `usage.prompt_tokens_details`, so
+# these subclasses read it from the raw responses and stream chunks and return it in the result's
+# usage as prompt_prefix.CachedTokensUsage.cached_tokens. clients.load_model_client creates them in place of the
+# autogen_ext OpenAI clients, see clients.USAGE_PROVIDERS.
+
+# the cached prompt token counts of the responses of the current create call
+_cached_tokens: ContextVar[List[int] | None] = ContextVar("_cached_tokens", default=None)
+
+
+def _record(usage: Any) -> None:
+    counts = _cached_tokens.get()
+    details = getattr(usage, "prompt_tokens_details", None)
+    if counts is not None and details is not None:
+        counts.append(int(getattr(details, "cached_tokens", 0) or 0))
+
+
+def _recording(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    async def create(*args: Any, **kwargs: Any) -> Any:
+        response = await method(*args, **kwargs)
+        # a stream reports its usage in the last chunk, see _create_stream_chunks
+        if not kwargs.get("stream"):
+            _record(getattr(response, "usage", None))
+        return response
+
+    return create
+
+
+def _with_cached_tokens(result: CreateResult, counts: List[int]) -> CreateResult:
+    if not counts:
+        return result
+    usage = CachedTokensUsage(
+        prompt_tokens=result.usage.prompt_tokens,
+        completion_tokens=result.usage.completion_tokens,
+        cached_tokens=sum(counts),
+    )
+    return result.model_copy(update={"usage": usage})
+
+
+class _CachedTokensMixin:
+    _client: Any
+
+    def _record_cached_tokens(self) -> None:
+        # the SDK resources are cached properties of the client, so the wrapped methods stay in place
+        self._client.chat.completions.create = _recording(self._client.chat.completions.create)
+        self._client.beta.chat.completions.parse = _recording(self._client.beta.chat.completions.parse)
+
+    async def create(self, messages: Sequence[Any], **kwargs: Any) -> CreateResult:
+        counts: List[int] = []
+        token = _cached_tokens.set(counts)
+        try:
+            result = await super().create(messages, **kwargs)  # type: ignore[misc]
+        finally:
+            _cached_tokens.reset(token)
+        return _with_cached_tokens(result, counts)
+
+    async def create_stream(self, messages: Sequence[Any], **kwargs: Any) -> AsyncGenerator[str | CreateResult, None]:
+        counts: List[int] = []
+        _cached_tokens.set(counts)
+        try:
+            async for item in super().create_stream(messages, **kwargs):  # type: ignore[misc]
+                yield _with_cached_tokens(item, counts) if isinstance(item, CreateResult) else item
+        finally:
+            # a generator may be closed in another context, where the token cannot be reset
+            _cached_tokens.set(None)
+
+    async def _create_stream_chunks(self, *args: Any, **kwargs: Any) -> AsyncGenerator[Any, None]:
+        async for chunk in super()._create_stream_chunks(*args, **kwargs):  # type: ignore[misc]
+            if chunk.usage is not None:
+                _record(chunk.usage)
+            yield chunk
+
+    async def _create_stream_chunks_beta_client(self, *args: Any, **kwargs: Any) -> AsyncGenerator[Any, None]:
+        async for chunk in super()._create_stream_chunks_beta_client(*args, **kwargs):  # type: ignore[misc]
+            if chunk.usage is not None:
+                _record(chunk.usage)
+            yield chunk
+
+
+class OpenAIUsageChatCompletionClient(_CachedTokensMixin, OpenAIChatCompletionClient):
+    """An OpenAIChatCompletionClient that reports the cached prompt tokens of each request."""
+
+    component_provider_override = "openai_usage.OpenAIUsageChatCompletionClient"
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._record_cached_tokens()
+
+
+class AzureOpenAIUsageChatCompletionClient(_CachedTokensMixin, AzureOpenAIChatCompletionClient):
+    """An AzureOpenAIChatCompletionClient that reports the cached prompt tokens of each request."""
+
+    component_provider_override = "openai_usage.AzureOpenAIUsageChatCompletionClient"
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._record_cached_tokens()
+
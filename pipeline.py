@@ -0,0 +1,370 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Mapping
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core.models import ChatCompletionClient, UserMessage
+
+# local
+from document_store import DocumentStore
+from model_router import FallbackChatCompletionClient, ModelRouter, served_by
+from prompt_prefix import PromptPrefix
+from research import Document, SearchBackend, format_documents, parse_queries, research_stream
+from response_cache import ResponseCacheClient
+from termination import draft_similarity
+
+# The essay pipeline as explicit stages: plan -> research -> write <-> critique.
+#
+# Every stage output is stored once as a content-addressed artifact, and every stage is memoized on
+# the digests of its inputs. A critique round therefore only runs the write and critique stages,
+# a re-run of the same task runs nothing, and a derivative task ("Convert the poem to a haiku.")
+# references the plan and research of the task it is based on instead of re-sending the conversation.
+
+PLANNER_SYSTEM_MESSAGE = (
+    "You plan essays. Reply with a short outline, then a line 'QUERIES:' followed by up to five "
+    "web search queries for the research, one per line."
+)
+WRITER_SYSTEM_MESSAGE = "You are a helpful assistant. Write the text the task asks for, following the plan and the research."
+CRITIC_SYSTEM_MESSAGE = (
+    "Provide constructive feedback to improve. Respond with 'APPROVE' to only when your feedbacks are addressed."
+)
+
+# the role of the model of each stage that calls one, see :class:`model_router.ModelRouter`
+STAGE_ROLES = {"plan": "planner", "write": "writer", "critique": "critic"}
+
+
+def _digest(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Artifact(BaseModel):
+    """A stage output, addressed by the digest of its content."""
+
+    digest: str
+    kind: str
+    content: str
+
+
+class ArtifactStore:
+    """
+    Content-addressed artifacts and the memo table of the stages, kept in memory and, with a
+    `path`, in a directory so they are reused across runs.
+
+    Layout of the directory: `objects/<digest>.json` for the artifacts and `memo/<key>` for the
+    digest of the output of a stage run.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        self._artifacts: Dict[str, Artifact] = {}
+        self._memo: Dict[str, str] = {}
+        if path is not None:
+            os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+            os.makedirs(os.path.join(path, "memo"), exist_ok=True)
+
+    def put(self, kind: str, content: str) -> Artifact:
+        """Store content, a no-op if the same content is already stored."""
+        digest = _digest(content)
+        artifact = self._artifacts.get(digest) or self._load(digest)
+        if artifact is None:
+            artifact = Artifact(digest=digest, kind=kind, content=content)
+            self._artifacts[digest] = artifact
+            if self.path is not None:
+                with open(os.path.join(self.path, "objects", f"{digest}.json"), "w", encoding="utf-8") as artifact_file:
+                    artifact_file.write(artifact.model_dump_json())
+        return artifact
+
+    def get(self, digest: str) -> Artifact:
+        artifact = self._artifacts.get(digest) or self._load(digest)
+        if artifact is None:
+            raise KeyError(f"No artifact {digest}.")
+        return artifact
+
+    def _load(self, digest: str) -> Artifact | None:
+        if self.path is None:
+            return None
+        try:
+            with open(os.path.join(self.path, "objects", f"{digest}.json"), encoding="utf-8") as artifact_file:
+                artifact = Artifact.model_validate_json(artifact_file.read())
+        except FileNotFoundError:
+            return None
+        self._artifacts[digest] = artifact
+        return artifact
+
+    def memo_get(self, key: str) -> Artifact | None:
+        digest = self._memo.get(key)
+        if digest is None and self.path is not None:
+            try:
+                with open(os.path.join(self.path, "memo", key), encoding="utf-8") as memo_file:
+                    digest = memo_file.read()
+            except FileNotFoundError:
+                return None
+            self._memo[key] = digest
+        if digest is None:
+            return None
+        # a memo whose object file was deleted is a miss, the stage runs again and rewrites it
+        return self._artifacts.get(digest) or self._load(digest)
+
+    def memo_set(self, key: str, artifact: Artifact) -> None:
+        self._memo[key] = artifact.digest
+        if self.path is not None:
+            with open(os.path.join(self.path, "memo", key), "w", encoding="utf-8") as memo_file:
+                memo_file.write(artifact.digest)
+
+
+class PipelineResult(BaseModel):
+    """The artifacts of a pipeline run and which stages actually ran."""
+
+    task: str
+    plan: str
+    research: str
+    draft: str
+    critique: str | None = None
+    rounds: int = 0
+    approved: bool = False
+    # stage runs, e.g. "write#2", that executed and that were taken from the memo table
+    executed: List[str] = []
+    reused: List[str] = []
+
+
+class EssayPipeline:
+    """
+    Runs plan -> research -> write <-> critique with memoized, content-addressed stage outputs.
+
+    Args:
+        model_client (ChatCompletionClient): The model client of the plan, write and critique stages.
+        role_clients (Mapping[str, ChatCompletionClient] | None): Model clients by role ("planner",
+            "writer", "critic"), e.g. from :class:`model_router.ModelRouter`; `model_client` serves
+            the roles not given.
+        artifacts (ArtifactStore | None): Where the stage outputs are kept, in memory by default.
+        search_backend (SearchBackend | None): The backend of the research stage, None to skip research.
+        document_store (DocumentStore | None): Where the research documents are indexed; the writer
+            gets the top-k passages of its task's research for the current critique.
+        max_rounds (int): The maximum number of write/critique rounds.
+        convergence_threshold (float): Stop when a draft is this similar to the previous one,
+            see :func:`termination.draft_similarity`.
+        passages (int): The number of research passages in the writer's prompt.
+    """
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        role_clients: Mapping[str, ChatCompletionClient] | None = None,
+        artifacts: ArtifactStore | None = None,
+        search_backend: SearchBackend | None = None,
+        document_store: DocumentStore | None = None,
+        max_rounds: int = 5,
+        convergence_threshold: float = 0.95,
+        passages: int = 5,
+    ) -> None:
+        self._model_client = model_client
+        self._role_clients = dict(role_clients or {})
+        self.artifacts = artifacts if artifacts is not None else ArtifactStore()
+        self._search_backend = search_backend
+        self._document_store = document_store if document_store is not None else DocumentStore()
+        self._max_rounds = max_rounds
+        self._convergence_threshold = convergence_threshold
+        self._passages = passages
+
+    async def _stage(
+        self,
+        name: str,
+        inputs: Dict[str, Any],
+        run: Callable[[], Awaitable[tuple[str, str | None]]],
+        result: PipelineResult,
+        label: str,
+        system_message: str | None = None,
+    ) -> Artifact:
+        """
+        Run a stage, or reuse its output if it already ran on the same inputs. A stage run on
+        another model or with other instructions is a different stage run. `run` returns the
+        output and the model that served it, which may be a fallback of the role's model.
+        """
+        system = _digest(system_message) if system_message is not None else None
+
+        def memo_key(model: str | None) -> str:
+            return _digest(json.dumps({"stage": name, "model": model, "system": system, "inputs": inputs}, sort_keys=True))
+
+        artifact = self.artifacts.memo_get(memo_key(self._serving_model(name)))
+        if artifact is not None:
+            result.reused.append(label)
+            return artifact
+        content, model = await run()
+        artifact = self.artifacts.put(name, content)
+        self.artifacts.memo_set(memo_key(model), artifact)
+        result.executed.append(label)
+        return artifact
+
+    def _serving_model(self, name: str) -> str | None:
+        """The model that would serve the stage now: the fallback of the role while it is in use."""
+        if name not in STAGE_ROLES:
+            return None
+        client = self._client(STAGE_ROLES[name])
+        if isinstance(client, FallbackChatCompletionClient) and client.on_fallback:
+            client = client.fallback
+        return ResponseCacheClient._model_name(client)
+
+    def _client(self, role: str) -> ChatCompletionClient:
+        return self._role_clients.get(role, self._model_client)
+
+    async def _complete(
+        self, role: str, system_message: str, prompt: str, plan: Artifact | None = None
+    ) -> tuple[str, str]:
+        """The response of the role's model and the name of the model that served it."""
+        # the instructions and the plan form a byte-stable prefix, the round-specific prompt follows it
+        prefix = PromptPrefix(system_message, plan=plan.content if plan else None)
+        client = self._client(role)
+        token = served_by.set(None)
+        try:
+            response = await client.create(prefix.messages + [UserMessage(content=prompt, source="user")])
+            served = served_by.get() or client
+        finally:
+            served_by.reset(token)
+        assert isinstance(response.content, str), "The pipeline stages expect text responses."
+        return response.content, ResponseCacheClient._model_name(served)
+
+    async def _research(self, plan: str) -> tuple[str, None]:
+        if self._search_backend is None:
+            return "[]", None
+        queries = parse_queries(plan.split("QUERIES:", 1)[1]) if "QUERIES:" in plan else []
+        documents: List[Document] = []
+        async for search in research_stream(queries, self._search_backend):
+            documents.extend(search.documents)
+        return json.dumps([document.model_dump() for document in documents]), None
+
+    def _index(self, research: Artifact) -> None:
+        # adding a document twice is a no-op, so a research artifact is indexed once
+        self._document_store.add_all([Document.model_validate(item) for item in json.loads(research.content)])
+
+    async def run(self, task: str, based_on: PipelineResult | None = None) -> PipelineResult:
+        """
+        Run a task. A derivative task `based_on` an earlier result reuses its plan and research and
+        starts from its final draft.
+        """
+        result = PipelineResult(task=task, plan="", research="", draft="")
+        if based_on is not None:
+            plan = self.artifacts.get(based_on.plan)
+            research = self.artifacts.get(based_on.research)
+            source: Artifact | None = self.artifacts.get(based_on.draft)
+            result.reused += ["plan", "research"]
+        else:
+            plan = await self._stage(
+                "plan",
+                {"task": _digest(task)},
+                lambda: self._complete("planner", PLANNER_SYSTEM_MESSAGE, task),
+                result,
+                "plan",
+                system_message=PLANNER_SYSTEM_MESSAGE,
+            )
+            # another backend or corpus finds other documents for the same plan
+            backend = self._search_backend.identity if self._search_backend is not None else None
+            research = await self._stage(
+                "research",
+                {"plan": plan.digest, "backend": backend},
+                lambda: self._research(plan.content),
+                result,
+                "research",
+            )
+            source = None
+        self._index(research)
+        result.plan, result.research = plan.digest, research.digest
+
+        draft: Artifact | None = None
+        critique: Artifact | None = None
+        for round_number in range(1, self._max_rounds + 1):
+            previous = draft
+            # the passages are part of the writer's prompt, and so of the write stage's inputs
+            passages = self._research_passages(research, critique.content if critique else task)
+            draft = await self._stage(
+                "write",
+                {
+                    "task": _digest(task),
+                    "plan": plan.digest,
+                    "research": research.digest,
+                    "passages": _digest(passages),
+                    "source": source.digest if source else None,
+                    "draft": previous.digest if previous else None,
+                    "critique": critique.digest if critique else None,
+                },
+                lambda: self._complete(
+                    "writer",
+                    WRITER_SYSTEM_MESSAGE, self._writer_prompt(task, passages, source, previous, critique), plan
+                ),
+                result,
+                f"write#{round_number}",
+                system_message=WRITER_SYSTEM_MESSAGE,
+            )
+            result.rounds = round_number
+            if previous is not None and draft_similarity(previous.content, draft.content) >= self._convergence_threshold:
+                break
+            current = draft
+            critique = await self._stage(
+                "critique",
+                {"task": _digest(task), "plan": plan.digest, "draft": draft.digest},
+                lambda: self._complete("critic", CRITIC_SYSTEM_MESSAGE, f"Task: {task}\n\nDraft:\n{current.content}", plan),
+                result,
+                f"critique#{round_number}",
+                system_message=CRITIC_SYSTEM_MESSAGE,
+            )
+            if "APPROVE" in critique.content:
+                result.approved = True
+                break
+        assert draft is not None
+        result.draft = draft.digest
+        result.critique = critique.digest if critique else None
+        return result
+
+    def _research_passages(self, research: Artifact, query: str) -> str:
+        """The top passages for the query, only of the documents of this task's research."""
+        document_ids = {item["id"] for item in json.loads(research.content)}
+        passages = self._document_store.search(query, self._passages, document_ids=document_ids)
+        if not passages:
+            return ""
+        return format_documents(
+            [Document(id=passage.document_id, title=passage.title, content=passage.text) for passage in passages]
+        )
+
+    def _writer_prompt(
+        self, task: str, passages: str, source: Artifact | None, draft: Artifact | None, critique: Artifact | None
+    ) -> str:
+        sections = [f"Task: {task}"]
+        if passages:
+            sections.append(f"Research:\n{passages}")
+        if source is not None:
+            sections.append(f"Source text:\n{source.content}")
+        if draft is not None and critique is not None:
+            sections.append(f"Your previous draft:\n{draft.content}")
+            sections.append(f"Critique to address:\n{critique.content}")
+        return "\n\n".join(sections)
+
+
+# Run a task and a derivative task on the pipeline
+async def main() -> None:
+    # the model of each stage's role comes from model_config.yaml: the writer gets the strong
+    # model, the plan and the critiques run on the fast one
+    async with ModelRouter.from_yaml("model_config.yaml") as router:
+        # the artifacts are kept on disk, so re-running the script re-runs no stage
+        pipeline = EssayPipeline(
+            router.client("writer"),
+            role_clients={role: router.client(role) for role in STAGE_ROLES.values()},
+            artifacts=ArtifactStore("pipeline_artifacts"),
+        )
+
+        poem = await pipeline.run("Write a short poem about the sea.")
+        print(pipeline.artifacts.get(poem.draft).content)
+        print(f"rounds: {poem.rounds}, approved: {poem.approved}, executed: {poem.executed}, reused: {poem.reused}")
+
+        # the derivative task reuses the plan and the research of the poem
+        haiku = await pipeline.run("Convert the poem to a haiku.", based_on=poem)
+        print(pipeline.artifacts.get(haiku.draft).content)
+        print(f"rounds: {haiku.rounds}, approved: {haiku.approved}, executed: {haiku.executed}, reused: {haiku.reused}")
+
+
+# Note: If running inside a python script, use asyncio.run(main())
+# await main()
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import hashlib
+from dataclasses import dataclass
+from typing import List, Sequence
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core.models import ChatCompletionClient, RequestUsage, SystemMessage
+
+# A byte-stable prompt prefix, so providers that cache prompt prefixes can reuse it across rounds.
+#
+# The parts of the prompt that rarely change, the system message, the plan and the research
+# digest, are rendered in a fixed order into a single system message that goes first, ahead of
+# the model context whose tail (drafts and critiques) changes every round. Any change to a
+# section changes the digest of the prefix, so an agent can tell whether it sends the same
+# prefix as last time.
+
+
+class PromptPrefix:
+    """
+    The stable head of an agent's prompt.
+
+    Args:
+        system_message (str | None): The agent's instructions.
+        plan (str | None): The essay plan.
+        research (str | None): The research digest, e.g. the formatted top documents.
+    """
+
+    def __init__(self, system_message: str | None, plan: str | None = None, research: str | None = None) -> None:
+        self._system_message = system_message
+        self._plan = plan
+        self._research = research
+        self._render()
+
+    def update(self, plan: str | None = None, research: str | None = None) -> None:
+        """Replace the plan or the research digest, the arguments left as None are kept."""
+        if plan is not None:
+            self._plan = plan
+        if research is not None:
+            self._research = research
+        self._render()
+
+    def _render(self) -> None:
+        sections = [self._system_message]
+        if self._plan:
+            sections.append(f"## Plan\n{self._plan}")
+        if self._research:
+            sections.append(f"## Research\n{self._research}")
+        # normalized line endings and no trailing whitespace, the same sections always give the same bytes
+        text = "\n\n".join(section.replace("\r\n", "\n").rstrip() for section in sections if section)
+        self._messages = [SystemMessage(content=text)] if text else []
+        self.digest = hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+    @property
+    def messages(self) -> List[SystemMessage]:
+        return self._messages
+
+
+@dataclass
+class CachedTokensUsage(RequestUsage):
+    """The usage of a request with the prompt tokens the provider served from its prompt cache."""
+
+    cached_tokens: int = 0
+
+
+class PrefixCacheStats(BaseModel):
+    """
+    How often an agent re-sent the same prefix, and the prompt tokens that the provider reported as
+    cached (`reported_cached_tokens`) or that a prefix cache could serve at most (`expected_cached_tokens`).
+
+    The expected figure is an upper bound: it counts the whole prefix whenever it is re-sent unchanged,
+    while a provider caches only prefixes above its minimum size and evicts them after a while. It is
+    only as large as the prefix, the system message alone unless the plan and research are in it.
+    """
+
+    requests: int = 0
+    prefix_reuses: int = 0
+    prompt_tokens: int = 0
+    expected_cached_tokens: int = 0
+    reported_cached_tokens: int = 0
+
+    @property
+    def expected_hit_rate(self) -> float:
+        return self.expected_cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+class PrefixCacheTracker:
+    """
+    Tracks the prefix an agent sent last and accumulates its :class:`PrefixCacheStats`.
+    """
+
+    def __init__(self) -> None:
+        self.stats = PrefixCacheStats()
+        self.last_digest: str | None = None
+        # digest -> token count, a prefix is counted once
+        self._prefix_tokens: dict[str, int] = {}
+
+    def record(
+        self, prefix: PromptPrefix, model_client: ChatCompletionClient, usage: RequestUsage
+    ) -> tuple[int, int]:
+        """
+        Record a request sent with `prefix` and return its expected and reported cached tokens,
+        the expected count being the upper-bound estimate described in :class:`PrefixCacheStats`.
+        """
+        if prefix.digest not in self._prefix_tokens:
+            self._prefix_tokens[prefix.digest] = model_client.count_tokens(prefix.messages) if prefix.messages else 0
+        expected = self._prefix_tokens[prefix.digest] if prefix.digest == self.last_digest else 0
+        # RequestUsage has no cached token count, the OpenAI clients of openai_usage report it in CachedTokensUsage
+        reported = int(getattr(usage, "cached_tokens", 0) or 0)
+        self.stats.requests += 1
+        self.stats.prefix_reuses += prefix.digest == self.last_digest
+        self.stats.prompt_tokens += usage.prompt_tokens
+        self.stats.expected_cached_tokens += min(expected, usage.prompt_tokens) if usage.prompt_tokens else expected
+        self.stats.reported_cached_tokens += reported
+        self.last_digest = prefix.digest
+        return expected, reported
+
+
+def research_digest(passages: Sequence[str], max_chars: int = 4000) -> str:
+    """
+    The research passages as a numbered digest for the prefix, cut at `max_chars` on a passage boundary.
+    Passages are kept in the given order, so the same passages always give the same digest.
+    """
+    lines: List[str] = []
+    length = 0
+    for index, passage in enumerate(passages, 1):
+        line = f"[{index}] {' '.join(passage.split())}"
+        if length + len(line) > max_chars and lines:
+            break
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, Iterable, List, Sequence
+
+from pydantic import BaseModel
+
+# autogen_agentchat
+from autogen_agentchat.agents import BaseChatAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import (
+    BaseAgentEvent,
+    BaseChatMessage,
+    TextMessage,
+    ToolCallExecutionEvent,
+    ToolCallRequestEvent,
+)
+
+# autogen_core
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import FunctionExecutionResult
+
+if TYPE_CHECKING:
+    from document_store import DocumentStore
+
+# The research stage: the queries of a plan are searched concurrently on a bounded pool of
+# workers, and the documents are streamed to the caller as each search completes, instead of
+# one tool call at a time in the tool loop of an AssistantAgent.
+
+
+class Document(BaseModel):
+    """A document found by a search backend."""
+
+    id: str
+    title: str
+    content: str
+    # the query that found the document
+    query: str = ""
+    score: float = 0.0
+
+
+class SearchResult(BaseModel):
+    """The documents of one query, or the error of its search."""
+
+    query: str
+    documents: List[Document] = []
+    error: str | None = None
+
+
+class SearchBackend(ABC):
+    """
+    A search service the research stage can fan out to, e.g. a web search API.
+    """
+
+    @abstractmethod
+    async def search(self, query: str, max_results: int) -> List[Document]:
+        """The best `max_results` documents for `query`, best first."""
+        ...
+
+    @property
+    def identity(self) -> str:
+        """
+        Identifies the backend and what it searches, so results of another backend or corpus are not
+        reused, e.g. by the pipeline's memo table. Backends with a configurable source extend it.
+        """
+        return f"{type(self).__module__}.{type(self).__qualname__}"
+
+
+def _terms(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class LocalCorpusBackend(SearchBackend):
+    """
+    A stand-in search backend over an in-memory corpus, for testing and offline runs.
+    Documents are ranked by the number of query terms they contain.
+
+    Args:
+        documents (Sequence[Document]): The corpus.
+        latency (float): Simulated seconds per search, to mimic a web search API.
+    """
+
+    def __init__(self, documents: Sequence[Document], latency: float = 0.0) -> None:
+        self._documents = list(documents)
+        self._terms = [set(_terms(f"{document.title} {document.content}")) for document in self._documents]
+        self._latency = latency
+        self.searches = 0
+        corpus = json.dumps([document.model_dump() for document in self._documents], sort_keys=True)
+        self._corpus_digest = hashlib.blake2b(corpus.encode("utf-8"), digest_size=12).hexdigest()
+
+    @property
+    def identity(self) -> str:
+        return f"{super().identity}:{self._corpus_digest}"
+
+    @classmethod
+    def from_directory(cls, path: str, latency: float = 0.0) -> "LocalCorpusBackend":
+        """A corpus of the .txt and .md files in `path`, titled by their file name."""
+        documents: List[Document] = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith((".txt", ".md")):
+                with open(os.path.join(path, name), encoding="utf-8") as document_file:
+                    documents.append(Document(id=name, title=os.path.splitext(name)[0], content=document_file.read()))
+        return cls(documents, latency)
+
+    async def search(self, query: str, max_results: int) -> List[Document]:
+        self.searches += 1
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        query_terms = set(_terms(query))
+        scored = [
+            (len(query_terms & terms) / len(query_terms), document)
+            for document, terms in zip(self._documents, self._terms)
+            if query_terms & terms
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [document.model_copy(update={"query": query, "score": score}) for score, document in scored[:max_results]]
+
+
+def normalize_query(query: str) -> str:
+    """The query lowercased, without punctuation, and with its terms in a canonical order."""
+    return " ".join(sorted(set(_terms(query))))
+
+
+def dedupe_queries(queries: Iterable[str]) -> List[str]:
+    """
+    The queries without duplicates: queries with the same terms, in any order or case, are searched once.
+    """
+    seen: set[str] = set()
+    unique: List[str] = []
+    for query in queries:
+        key = normalize_query(query)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(query.strip())
+    return unique
+
+
+def parse_queries(plan: str) -> List[str]:
+    """
+    The search queries of a plan: a JSON list of strings, or one query per line,
+    with list bullets and numbering stripped.
+    """
+    try:
+        parsed = json.loads(plan)
+        if isinstance(parsed, list):
+            return [str(query) for query in parsed]
+    except json.JSONDecodeError:
+        pass
+    lines = (re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip() for line in plan.splitlines())
+    return [line for line in lines if line]
+
+
+async def research_stream(
+    queries: Iterable[str],
+    backend: SearchBackend,
+    concurrency: int = 4,
+    max_results: int = 5,
+) -> AsyncGenerator[SearchResult, None]:
+    """
+    Search the queries concurrently, at most `concurrency` at a time, and yield the result of
+    each query as soon as its search completes. Duplicate queries are searched once, and a
+    document found by several queries is only yielded with the first of them.
+    A failed search is yielded with its error instead of failing the others.
+    """
+    pending: asyncio.Queue[str] = asyncio.Queue()
+    for query in dedupe_queries(queries):
+        pending.put_nowait(query)
+    total = pending.qsize()
+    results: asyncio.Queue[SearchResult] = asyncio.Queue()
+
+    async def worker() -> None:
+        while not pending.empty():
+            query = pending.get_nowait()
+            try:
+                documents = await backend.search(query, max_results)
+                results.put_nowait(SearchResult(query=query, documents=documents))
+            except Exception as error:
+                results.put_nowait(SearchResult(query=query, error=f"{type(error).__name__}: {error}"))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, total))]
+    seen: set[str] = set()
+    try:
+        for _ in range(total):
+            result = await results.get()
+            result.documents = [document for document in result.documents if document.id not in seen]
+            seen.update(document.id for document in result.documents)
+            yield result
+    finally:
+        # the caller may stop early, do not leave searches running
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def format_documents(documents: Sequence[Document]) -> str:
+    """The documents as a numbered list for the writer's prompt."""
+    return "\n\n".join(f"[{index}] {document.title}\n{document.content}" for index, document in enumerate(documents, 1))
+
+
+class ResearchAgent(BaseChatAgent):
+    """
+    An agent that runs the research stage on the search queries of the latest message, a plan
+    with one query per line or a JSON list. Every search is reported as a tool call, as it
+    completes, and the reply lists all documents found.
+
+    Teammates only receive the reply, after the whole fan-out. With a document store, the documents
+    of each search are ingested into the store as soon as the search completes, so whatever retrieves
+    from the shared store, e.g. a writer running alongside with a
+    :class:`document_store.DocumentStoreMemory`, gets them before the slowest search returns. The
+    reply then only lists the titles of the new documents.
+
+    Args:
+        name (str): The name of the agent.
+        backend (SearchBackend): The search backend.
+        concurrency (int): The maximum number of concurrent searches.
+        max_results (int): The number of documents per query.
+        store (DocumentStore | None): The document store to ingest the documents into.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        backend: SearchBackend,
+        description: str = "A research agent that searches for documents on the queries of a plan.",
+        concurrency: int = 4,
+        max_results: int = 5,
+        store: "DocumentStore | None" = None,
+    ) -> None:
+        super().__init__(name, description)
+        self._backend = backend
+        self._concurrency = concurrency
+        self._max_results = max_results
+        self._store = store
+        self._documents: List[Document] = []
+
+    @property
+    def produced_message_types(self) -> Sequence[type[BaseChatMessage]]:
+        return (TextMessage,)
+
+    @property
+    def documents(self) -> List[Document]:
+        """All documents found so far, in the order they arrived."""
+        return self._documents
+
+    async def on_messages(self, messages: Sequence[BaseChatMessage], cancellation_token: CancellationToken) -> Response:
+        async for message in self.on_messages_stream(messages, cancellation_token):
+            if isinstance(message, Response):
+                return message
+        raise AssertionError("The stream should have returned the final result.")
+
+    async def on_messages_stream(
+        self, messages: Sequence[BaseChatMessage], cancellation_token: CancellationToken
+    ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | Response, None]:
+        queries = dedupe_queries(parse_queries(messages[-1].to_text())) if messages else []
+        calls: Dict[str, FunctionCall] = {
+            query: FunctionCall(id=str(index), name="web_search", arguments=json.dumps({"query": query}))
+            for index, query in enumerate(queries)
+        }
+        request = ToolCallRequestEvent(content=list(calls.values()), source=self.name)
+        yield request
+        inner_messages: List[BaseAgentEvent | BaseChatMessage] = [request]
+        found: List[Document] = []
+        new: List[Document] = []
+        stream = research_stream(queries, self._backend, self._concurrency, self._max_results)
+        try:
+            async for result in stream:
+                if cancellation_token.is_cancelled():
+                    break
+                found.extend(result.documents)
+                self._documents.extend(result.documents)
+                if self._store is not None:
+                    new.extend(document for document in result.documents if self._store.add(document))
+                call = calls[result.query]
+                event = ToolCallExecutionEvent(
+                    content=[
+                        FunctionExecutionResult(
+                            call_id=call.id,
+                            name=call.name,
+                            content=result.error or format_documents(result.documents),
+                            is_error=result.error is not None,
+                        )
+                    ],
+                    source=self.name,
+                )
+                inner_messages.append(event)
+                yield event
+        finally:
+            await stream.aclose()
+        if self._store is not None:
+            titles = "\n".join(f"- {document.title}" for document in new)
+            content = f"New documents in the store:\n{titles}" if new else "No new documents found."
+        else:
+            content = format_documents(found) or "No documents found."
+        yield Response(
+            chat_message=TextMessage(content=content, source=self.name),
+            inner_messages=inner_messages,
+        )
+
+    async def on_reset(self, cancellation_token: CancellationToken) -> None:
+        self._documents = []
@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, TypeVar, Union
+
+from pydantic import BaseModel
+from typing_extensions import Self
+
+# autogen_core
+from autogen_core import CacheStore, Component, ComponentModel
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+
+# autogen_ext
+from autogen_ext.models.cache import CHAT_CACHE_VALUE_TYPE, ChatCompletionCache
+
+T = TypeVar("T")
+
+
+class LRUCacheStoreConfig(BaseModel):
+    max_entries: int = 1024
+    ttl_seconds: float | None = None
+
+
+class LRUCacheStore(CacheStore[T], Component[LRUCacheStoreConfig]):
+    """
+    An in-memory cache store with least-recently-used eviction and an optional time-to-live.
+
+    Args:
+        max_entries (int): The maximum number of entries kept, the least recently used entry is evicted first.
+        ttl_seconds (float | None): Entries older than this are treated as missing. None keeps entries until evicted.
+    """
+
+    component_config_schema = LRUCacheStoreConfig
+    component_provider_override = "response_cache.LRUCacheStore"
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float | None = None) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than 0.")
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        # key -> (stored at, value), ordered from least to most recently used
+        self._entries: OrderedDict[str, Tuple[float, T]] = OrderedDict()
+
+    def get(self, key: str, default: Optional[T] = None) -> Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        stored_at, value = entry
+        if self._ttl_seconds is not None and time.monotonic() - stored_at > self._ttl_seconds:
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: T) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _to_config(self) -> LRUCacheStoreConfig:
+        return LRUCacheStoreConfig(max_entries=self._max_entries, ttl_seconds=self._ttl_seconds)
+
+    @classmethod
+    def _from_config(cls, config: LRUCacheStoreConfig) -> Self:
+        return cls(**config.model_dump())
+
+
+class SqliteCacheStoreConfig(BaseModel):
+    path: str
+    max_entries: int | None = None
+    max_bytes: int | None = None
+    ttl_seconds: float | None = None
+
+
+class SqliteCacheStore(CacheStore[CHAT_CACHE_VALUE_TYPE], Component[SqliteCacheStoreConfig]):
+    """
+    An on-disk cache store for model results backed by sqlite.
+    Values are stored as JSON, so a cached result survives across runs of the scripts.
+    When `max_entries` or `max_bytes` is exceeded the least recently used entries are evicted.
+
+    Args:
+        path (str): The sqlite database file.
+        max_entries (int | None): The maximum number of entries kept.
+        max_bytes (int | None): The maximum total size of the stored values.
+        ttl_seconds (float | None): Entries older than this are treated as missing and removed.
+    """
+
+    component_config_schema = SqliteCacheStoreConfig
+    component_provider_override = "response_cache.SqliteCacheStore"
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        self._path = path
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.commit()
+
+    def get(
+        self, key: str, default: Optional[CHAT_CACHE_VALUE_TYPE] = None
+    ) -> Optional[CHAT_CACHE_VALUE_TYPE]:
+        row = self._connection.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        value, created_at = row
+        now = time.time()
+        if self._ttl_seconds is not None and now - created_at > self._ttl_seconds:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._connection.commit()
+            return default
+        self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._connection.commit()
+        # ChatCompletionCache rebuilds CreateResult instances from the decoded dicts
+        return json.loads(value)
+
+    def set(self, key: str, value: CHAT_CACHE_VALUE_TYPE) -> None:
+        encoded = json.dumps(self._encode(value))
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, encoded, len(encoded), now, now),
+        )
+        self._evict(now)
+        self._connection.commit()
+
+    def _evict(self, now: float) -> None:
+        if self._ttl_seconds is not None:
+            self._connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self._ttl_seconds,))
+        if self._max_entries is not None:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,),
+            )
+        if self._max_bytes is not None:
+            total = 0
+            evicted: List[str] = []
+            for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at DESC"):
+                total += size
+                if total > self._max_bytes:
+                    evicted.append(key)
+            self._connection.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in evicted])
+
+    @staticmethod
+    def _encode(value: CHAT_CACHE_VALUE_TYPE) -> Any:
+        if isinstance(value, CreateResult):
+            return value.model_dump(mode="json")
+        return [item.model_dump(mode="json") if isinstance(item, CreateResult) else item for item in value]
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _to_config(self) -> SqliteCacheStoreConfig:
+        return SqliteCacheStoreConfig(
+            path=self._path,
+            max_entries=self._max_entries,
+            max_bytes=self._max_bytes,
+            ttl_seconds=self._ttl_seconds,
+        )
+
+    @classmethod
+    def _from_config(cls, config: SqliteCacheStoreConfig) -> Self:
+        return cls(**config.model_dump())
+
+
+class ResponseCacheClientConfig(BaseModel):
+    client: ComponentModel
+    store: Optional[ComponentModel] = None
+
+
+class ResponseCacheClient(ChatCompletionCache):
+    """
+    A ChatCompletionClient that caches the results of the wrapped client.
+    Results are keyed on the model, the messages (including the system prompt), the tools,
+    the output format and the extra create arguments. Streamed results are stored chunk by chunk
+    and replayed from the cache.
+
+    Args:
+        client (ChatCompletionClient): The client to wrap.
+        store (CacheStore | None): Where the results are kept. Defaults to an in-memory LRU store.
+        model (str | None): The model name used in the cache key. Defaults to the model of the wrapped client.
+    """
+
+    component_config_schema = ResponseCacheClientConfig
+    component_provider_override = "response_cache.ResponseCacheClient"
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        store: Optional[CacheStore[CHAT_CACHE_VALUE_TYPE]] = None,
+        model: str | None = None,
+    ) -> None:
+        super().__init__(client, store)
+        # the stores define __len__, so an empty one is falsy and would be replaced by the base class
+        self.store = store if store is not None else LRUCacheStore[CHAT_CACHE_VALUE_TYPE]()
+        self._model = model or self._model_name(client)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _model_name(client: ChatCompletionClient) -> str:
+        # wrappers that are not components, such as ScheduledChatCompletionClient, keep the wrapped client in `client`
+        inner: ChatCompletionClient | None = client
+        model = None
+        while inner is not None and model is None:
+            try:
+                model = inner.dump_component().config.get("model")
+            except (AttributeError, NotImplementedError, TypeError):
+                inner = getattr(inner, "client", None)
+        return str(model or client.model_info["family"])
+
+    def _check_cache(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        json_output: Optional[bool | type[BaseModel]],
+        extra_create_args: Mapping[str, Any],
+    ) -> Tuple[Optional[Union[CreateResult, List[Union[str, CreateResult]]]], str]:
+        # the model only takes part in the key, it is not sent to the wrapped client
+        keyed_args: Dict[str, Any] = {**extra_create_args, "__cache_model__": self._model}
+        cached_result, cache_key = super()._check_cache(messages, tools, json_output, keyed_args)
+        if cached_result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached_result, cache_key
+
+    def _to_config(self) -> ResponseCacheClientConfig:  # type: ignore[override]
+        return ResponseCacheClientConfig(client=self.client.dump_component(), store=self.store.dump_component())
+
+    @classmethod
+    def _from_config(cls, config: ResponseCacheClientConfig) -> Self:  # type: ignore[override]
+        store = CacheStore.load_component(config.store) if config.store else None
+        return cls(client=ChatCompletionClient.load_component(config.client), store=store)
+
+
+def cached_client(client: ChatCompletionClient, path: str | None = None) -> ResponseCacheClient:
+    """
+    Wrap a model client with the response cache.
+    The cache is kept on disk when `path` or the RESPONSE_CACHE_PATH environment variable is set,
+    and in memory otherwise. RESPONSE_CACHE_TTL sets the time-to-live in seconds.
+    """
+    path = path or os.getenv("RESPONSE_CACHE_PATH")
+    ttl = os.getenv("RESPONSE_CACHE_TTL")
+    ttl_seconds = float(ttl) if ttl else None
+    if path:
+        return ResponseCacheClient(client, SqliteCacheStore(path, max_entries=10_000, ttl_seconds=ttl_seconds))
+    return ResponseCacheClient(client, LRUCacheStore[CHAT_CACHE_VALUE_TYPE](ttl_seconds=ttl_seconds))
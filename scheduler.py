@@ -0,0 +1,325 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+import warnings
+from enum import IntEnum
+from typing import Any, AsyncGenerator, List, Literal, Mapping, Optional, Sequence, Tuple, Union
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+# local
+from instrumentation import record_queue_wait
+
+# HTTP status codes that are worth retrying after a backoff
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Priority(IntEnum):
+    """
+    Scheduling lanes, a lower value is served first.
+    """
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class TokenBucket:
+    """
+    A bucket that refills continuously up to `per_minute` units per minute.
+    The level may go negative when a request turns out to cost more than estimated.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.level = per_minute
+        self._rate = per_minute / 60.0
+        self._updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available, amounts above capacity only wait for a full bucket."""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self._rate)
+
+
+class RequestScheduler:
+    """
+    Admits model requests under requests-per-minute and tokens-per-minute limits, in priority order,
+    and retries rate-limited or failed requests with exponential backoff and full jitter.
+    One scheduler is shared by every client that draws on the same quota, see :meth:`wrap`.
+
+    Args:
+        requests_per_minute (float | None): The request quota, None for no limit.
+        tokens_per_minute (float | None): The token quota, None for no limit. Prompt tokens are estimated
+            with the model client before the request and corrected with the actual usage afterwards.
+        max_retries (int): How many times a failed request is retried.
+        base_delay (float): The backoff ceiling in seconds for the first retry, doubled on each retry.
+        max_delay (float): The largest backoff in seconds.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ) -> None:
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # (priority, arrival order, estimated tokens, waiter)
+        self._waiters: List[Tuple[int, int, int, asyncio.Future[float]]] = []
+        self._counter = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: asyncio.TimerHandle | None = None
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        """
+        Create a scheduler with the limits set in MODEL_REQUESTS_PER_MINUTE and MODEL_TOKENS_PER_MINUTE.
+        """
+        rpm = os.getenv("MODEL_REQUESTS_PER_MINUTE")
+        tpm = os.getenv("MODEL_TOKENS_PER_MINUTE")
+        return cls(requests_per_minute=float(rpm) if rpm else None, tokens_per_minute=float(tpm) if tpm else None)
+
+    def wrap(self, client: ChatCompletionClient, priority: Priority = Priority.BATCH) -> "ScheduledChatCompletionClient":
+        """
+        A client that sends its requests to `client` through this scheduler, in the given lane.
+        """
+        return ScheduledChatCompletionClient(client, self, priority)
+
+    async def acquire(self, priority: Priority, tokens: int) -> float:
+        """
+        Wait for a slot and return the time spent waiting in seconds.
+        """
+        waiter: asyncio.Future[float] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._counter), tokens, waiter))
+        start = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # a waiter that was granted a slot before being cancelled gives its share back
+            if waiter.done() and not waiter.cancelled():
+                if self._requests is not None:
+                    self._requests.level += 1
+                if self._tokens is not None:
+                    self._tokens.level += tokens
+            self._dispatch()
+            raise
+        return time.monotonic() - start
+
+    def settle(self, estimated_tokens: int, usage: RequestUsage) -> None:
+        """
+        Correct the token bucket with the actual usage of a finished request. A failed attempt,
+        e.g. a 429, a 5xx or a connection error, is settled with zero usage, so retries do not
+        drain the budget with tokens that were never used.
+        """
+        if self._tokens is not None:
+            self._tokens.level -= usage.prompt_tokens + usage.completion_tokens - estimated_tokens
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold back every lane, used when the endpoint reports a rate limit.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _dispatch(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        while self._waiters:
+            _, _, tokens, waiter = self._waiters[0]
+            if waiter.done():
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            wait = self._paused_until - now
+            for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amount))
+            if wait > 0:
+                # the head of the queue keeps its place, lower priority requests wait behind it
+                self._wakeup = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            if self._requests is not None:
+                self._requests.level -= 1
+            if self._tokens is not None:
+                self._tokens.level -= tokens
+            waiter.set_result(0.0)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """
+        The delay before retry number `attempt`, at least what the endpoint asked for in Retry-After.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        response = getattr(error, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass
+        return delay
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        status_code = getattr(error, "status_code", None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "RateLimitError")
+
+
+# the usage a failed attempt is settled with
+_NO_USAGE = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+
+class ScheduledChatCompletionClient(ChatCompletionClient):
+    """
+    A ChatCompletionClient that waits for a :class:`RequestScheduler` slot before every request
+    and retries the request when it fails with a retryable error.
+    Create it with :meth:`RequestScheduler.wrap`.
+    """
+
+    def __init__(self, client: ChatCompletionClient, scheduler: RequestScheduler, priority: Priority) -> None:
+        self.client = client
+        self.scheduler = scheduler
+        self.priority = priority
+        # total time this client's requests spent waiting for a slot
+        self.queue_wait = 0.0
+
+    def _estimate_tokens(
+        self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], extra_create_args: Mapping[str, Any]
+    ) -> int:
+        try:
+            prompt_tokens = self.client.count_tokens(messages, tools=tools)
+        except Exception:
+            prompt_tokens = sum(len(str(message.content)) // 4 for message in messages)
+        return prompt_tokens + int(extra_create_args.get("max_tokens") or 0)
+
+    async def _acquire(self, estimated_tokens: int) -> None:
+        wait = await self.scheduler.acquire(self.priority, estimated_tokens)
+        self.queue_wait += wait
+        record_queue_wait(wait)
+
+    async def _retry_wait(self, attempt: int, error: Exception) -> None:
+        if attempt >= self.scheduler.max_retries or not self.scheduler.is_retryable(error):
+            raise error
+        delay = self.scheduler.backoff(attempt, error)
+        if getattr(error, "status_code", None) == 429:
+            self.scheduler.pause(delay)
+        await asyncio.sleep(delay)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        estimated_tokens = self._estimate_tokens(messages, tools, extra_create_args)
+        for attempt in itertools.count():
+            await self._acquire(estimated_tokens)
+            try:
+                result = await self.client.create(
+                    messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                )
+            except Exception as e:
+                self.scheduler.settle(estimated_tokens, _NO_USAGE)
+                await self._retry_wait(attempt, e)
+                continue
+            self.scheduler.settle(estimated_tokens, result.usage)
+            return result
+        raise AssertionError("unreachable")
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            estimated_tokens = self._estimate_tokens(messages, tools, extra_create_args)
+            for attempt in itertools.count():
+                await self._acquire(estimated_tokens)
+                started = False
+                try:
+                    async for chunk in self.client.create_stream(
+                        messages,
+                        tools=tools,
+                        tool_choice=tool_choice,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token,
+                    ):
+                        started = True
+                        if isinstance(chunk, CreateResult):
+                            self.scheduler.settle(estimated_tokens, chunk.usage)
+                        yield chunk
+                    return
+                except Exception as e:
+                    # a stream that already produced output can not be replayed transparently
+                    if started:
+                        raise
+                    self.scheduler.settle(estimated_tokens, _NO_USAGE)
+                    await self._retry_wait(attempt, e)
+
+        return _generator()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self.client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        warnings.warn("capabilities is deprecated, use model_info instead", DeprecationWarning, stacklevel=2)
+        return self.client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.client.model_info
@@ -0,0 +1,257 @@
+import re
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Sequence
+
+from pydantic import BaseModel
+
+# autogen-agentchat
+from autogen_agentchat.base import TaskResult, Team
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, TextMessage
+
+# local
+from document_store import hashed_embedding
+
+# A semantic cache of finished essays in front of team runs.
+#
+# The response cache only matches byte-identical requests, but users ask for the same essay in
+# many phrasings: "Write a short poem about the sea." and "write a short sea poem". The tasks are
+# embedded, without a network call, as hashed word and character n-gram vectors, and looked up
+# in a NumPy nearest-neighbour index of past tasks:
+#
+#   - at or above `threshold`, for the same content words, the stored final essay is returned and
+#     the team does not run;
+#   - at or above `warm_start_threshold`, the team runs with the stored essay as a starting draft;
+#   - below, the team runs from scratch.
+#
+# The TaskResult of every run the critic approved, or whose drafts converged, is added to the index.
+
+# words that do not change what is asked for
+_STOPWORDS = frozenset(
+    "a an the of on in at about for to and or with that this is are be please me my i us our can you".split()
+)
+
+
+def _words(text: str) -> List[str]:
+    # lower case, no punctuation, stop words dropped and a plural "s" stripped
+    words = re.findall(r"\w+", text.lower())
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+            for word in words if word not in _STOPWORDS]
+
+
+def ngram_embedding(texts: Sequence[str], dim: int = 1024, n: int = 3, char_weight: float = 0.3) -> Any:
+    """
+    :func:`document_store.hashed_embedding` of the content words of the tasks and their character
+    `n`-grams. The words make the ranking, the character n-grams tolerate typos and inflections.
+    """
+    return hashed_embedding(texts, dim=dim, terms=_words, char_ngrams=n, char_weight=char_weight)
+
+
+def finished_essay(result: TaskResult, approval: str = "APPROVE") -> bool:
+    """Whether a team run ended with an essay worth reusing: the critic approved it or the drafts converged."""
+    stop_reason = result.stop_reason or ""
+    return approval in stop_reason or "converged" in stop_reason
+
+
+class CachedEssay(BaseModel):
+    """A finished essay and the task it was written for."""
+
+    task: str
+    essay: str
+    stop_reason: str | None = None
+    created_at: float
+    last_used: float
+    hits: int = 0
+
+
+class SemanticMatch(BaseModel):
+    """The nearest cached essay of a task and its cosine similarity."""
+
+    entry: CachedEssay
+    similarity: float
+    hit: bool = False
+    """Whether the cached essay answers the task as is, otherwise it is a starting draft."""
+
+
+class SemanticCacheStats(BaseModel):
+    """The lookups of a semantic cache by outcome."""
+
+    hits: int = 0
+    warm_starts: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.warm_starts + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SemanticTaskCache:
+    """
+    Finished essays indexed by the embedding of their task.
+
+    A cached essay is only returned as is when the tasks also ask for the same content words, one
+    extra word like "for kids" changes the essay however similar the tasks are otherwise; such a
+    task warm-starts from the cached essay instead.
+
+    Args:
+        threshold (float): The cosine similarity from which a cached essay is returned as is.
+        warm_start_threshold (float | None): The similarity from which the team starts from the
+            cached essay, None to never warm-start.
+        max_entries (int): The maximum number of essays, the least recently used is evicted first.
+        ttl_seconds (float | None): How long an essay is kept, None to keep it until evicted.
+        writer (str): The source of the essay drafts in the team's messages.
+        embed (Callable | None): A function from a list of texts to a NumPy array of L2-normalized
+            row vectors, e.g. a local embedding model; :func:`ngram_embedding` by default.
+        finished (Callable): Whether the essay of a team run is finished and cached, by default
+            when the critic approved it or the drafts converged, see :func:`finished_essay`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        warm_start_threshold: float | None = 0.7,
+        max_entries: int = 1000,
+        ttl_seconds: float | None = None,
+        writer: str = "primary",
+        embed: Callable[[Sequence[str]], Any] | None = None,
+        finished: Callable[[TaskResult], bool] = finished_essay,
+    ) -> None:
+        if warm_start_threshold is not None and warm_start_threshold > threshold:
+            raise ValueError("warm_start_threshold must not be greater than threshold")
+        self.threshold = threshold
+        self.warm_start_threshold = warm_start_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.writer = writer
+        self._embed = embed or ngram_embedding
+        self._finished = finished
+        # row -> entry; the rows of evicted entries are reused
+        self._entries: Dict[int, CachedEssay] = {}
+        self._free_rows: List[int] = []
+        self._vectors: Any = None
+        self._stats = SemanticCacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> SemanticCacheStats:
+        return self._stats.model_copy(update={"entries": len(self._entries)})
+
+    def _evict(self, row: int) -> None:
+        del self._entries[row]
+        self._vectors[row] = 0.0
+        self._free_rows.append(row)
+        self._stats.evictions += 1
+
+    def _expire(self, now: float) -> None:
+        if self.ttl_seconds is None:
+            return
+        for row in [row for row, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]:
+            self._evict(row)
+
+    def nearest(self, task: str) -> SemanticMatch | None:
+        """The most similar cached essay of `task`, without counting a lookup."""
+        self._expire(time.time())
+        if not self._entries:
+            return None
+        similarities = self._vectors @ self._embed([task])[0]
+        row = max(self._entries, key=lambda row: similarities[row])
+        return SemanticMatch(entry=self._entries[row], similarity=float(similarities[row]))
+
+    def lookup(self, task: str) -> SemanticMatch | None:
+        """
+        The most similar cached essay of `task` if it is similar enough to reuse or to warm-start from.
+        """
+        match = self.nearest(task)
+        if match is not None and match.similarity >= self.threshold and set(_words(task)) == set(_words(match.entry.task)):
+            match.hit = True
+            self._stats.hits += 1
+        elif (
+            match is not None
+            and self.warm_start_threshold is not None
+            and match.similarity >= self.warm_start_threshold
+        ):
+            self._stats.warm_starts += 1
+        else:
+            self._stats.misses += 1
+            return None
+        match.entry.hits += 1
+        match.entry.last_used = time.time()
+        return match
+
+    def add(self, task: str, result: TaskResult) -> CachedEssay | None:
+        """
+        Add the final essay of a team run, the last message of the writer. Returns None when the
+        run did not finish its essay, e.g. it stopped on the turn limit. An essay for the same task
+        replaces the cached one.
+        """
+        drafts = [m for m in result.messages if isinstance(m, BaseChatMessage) and m.source == self.writer]
+        if not drafts or not self._finished(result):
+            return None
+        import numpy as np
+
+        now = time.time()
+        entry = CachedEssay(task=task, essay=drafts[-1].to_text(), stop_reason=result.stop_reason, created_at=now, last_used=now)
+        vector = self._embed([task])[0]
+        same = next((row for row, cached in self._entries.items() if cached.task == task), None)
+        if same is not None:
+            self._entries[same] = entry
+            return entry
+        if len(self._entries) >= self.max_entries:
+            self._evict(min(self._entries, key=lambda row: self._entries[row].last_used))
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = 0 if self._vectors is None else len(self._vectors)
+            # grow the index by doubling, so adding is amortized O(1)
+            grown = np.zeros((max(2 * row, 16), len(vector)), dtype=np.float32)
+            if self._vectors is not None:
+                grown[:row] = self._vectors
+            self._free_rows = list(range(len(grown) - 1, row, -1))
+            self._vectors = grown
+        self._vectors[row] = vector
+        self._entries[row] = entry
+        return entry
+
+    def warm_start_task(self, task: str, match: SemanticMatch) -> str:
+        """The task for the team, with the cached essay of a similar task as the starting draft."""
+        return (
+            f"{task}\n\nA finished text for a similar task (\"{match.entry.task}\") follows. "
+            f"Use it as a starting draft and revise it for this task.\n\n{match.entry.essay}"
+        )
+
+    async def run_stream(
+        self, team: Team, task: str
+    ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | TaskResult, None]:
+        """
+        Like `team.run_stream(task=task)`, answered from the cache when a similar task was written before.
+        """
+        match = self.lookup(task)
+        if match is not None and match.hit:
+            messages: List[BaseAgentEvent | BaseChatMessage] = [
+                TextMessage(content=task, source="user"),
+                TextMessage(content=match.entry.essay, source=self.writer),
+            ]
+            for message in messages:
+                yield message
+            yield TaskResult(
+                messages=messages,
+                stop_reason=f"Semantic cache hit: {match.similarity:.2f} similar to {match.entry.task!r}",
+            )
+            return
+        prompt = self.warm_start_task(task, match) if match is not None else task
+        async for message in team.run_stream(task=prompt):
+            if isinstance(message, TaskResult):
+                self.add(task, message)
+            yield message
+
+    async def run(self, team: Team, task: str) -> TaskResult:
+        """Like `team.run(task=task)`, answered from the cache when a similar task was written before."""
+        result: TaskResult | None = None
+        async for message in self.run_stream(team, task):
+            if isinstance(message, TaskResult):
+                result = message
+        assert result is not None, "The team run did not return a result."
+        return result
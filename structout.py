@@ -1,66 +1,78 @@
-from dotenv import load_dotenv
-import os
-
 from typing import Literal
 from pydantic import BaseModel
 
 # autogen_core
 from autogen_core import EVENT_LOGGER_NAME
-from autogen_core.models import UserMessage
+from autogen_core.models import ChatCompletionClient, UserMessage
 from autogen_core import CancellationToken
 
 # autogen_agentchat
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.ui import Console
 from autogen_agentchat.messages import StructuredMessage, TextMessage
-# autogen_ext
-from autogen_ext.models.openai import OpenAIChatCompletionClient
+# local
+from client_pool import ClientPool
+from custom_agent import CustomAgent
+from structured_stream import PartialStructuredEvent
 
 # others
 import asyncio
 
-# load environment variables from .env file
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
 # the response format for the agent as a Pydantic base model
+# the short label comes first, the model generates the fields in this order,
+# so the label can be used while the thoughts are still streaming
 class AgentResponse(BaseModel):
-    thoughts: str
     response: Literal["happy", "sad", "neutral"]
-
-
-# define a model client. You can use other model client that implements the "ChatCompletionClient" interface
-model_client = OpenAIChatCompletionClient(
-    model = "gemini-1.5-flash-8b",
-    api_key = GEMINI_API_KEY
-)
+    thoughts: str
 
 
 # Define as Assistant Agent with the model, tool, system message and reflection enables. 
 # The system message instructs the agent via natural language
-agent = AssistantAgent(
-    name="assistant",
-    model_client=model_client,
-    system_message= "Categorize the input as happy, sad, or neutral following the JSON format",
-    output_content_type=AgentResponse,
-    model_client_stream=True,
-)
+def create_agent(model_client: ChatCompletionClient) -> AssistantAgent:
+    return AssistantAgent(
+        name="assistant",
+        model_client=model_client,
+        system_message= "Categorize the input as happy, sad, or neutral following the JSON format",
+        output_content_type=AgentResponse,
+        model_client_stream=True,
+    )
+
+# the same agent as a CustomAgent, it reports each field of the response as soon as it is complete
+def create_custom_agent(model_client: ChatCompletionClient) -> CustomAgent:
+    return CustomAgent(
+        name="assistant",
+        model_client=model_client,
+        system_message= "Categorize the input as happy, sad, or neutral following the JSON format",
+        output_content_type=AgentResponse,
+        model_client_stream=True,
+    )
 
 
 # Run the agent and stream the meessages to the console
 async def main() -> None:    
-    
-    result = await Console(agent.run_stream(task="I am happy."))
+    # define a model client. You can use other model client that implements the "ChatCompletionClient" interface
+    async with ClientPool(cache=False) as pool:
+        model_client = pool.client()
+        agent = create_agent(model_client)
+        custom_agent = create_custom_agent(model_client)
+
+        result = await Console(agent.run_stream(task="I am happy."))
+
+        # Check the last message in the result, validate its type, and print the thoughts and response.
+        assert isinstance(result.messages[-1], StructuredMessage)
+        assert isinstance(result.messages[-1].content, AgentResponse)
+        print("Thought: ", result.messages[-1].content.thoughts)
+        print("Response: ", result.messages[-1].content.response)
 
-    # Check the last message in the result, validate its type, and print the thoughts and response.
-    assert isinstance(result.messages[-1], StructuredMessage)
-    assert isinstance(result.messages[-1].content, AgentResponse)
-    print("Thought: ", result.messages[-1].content.thoughts)
-    print("Response: ", result.messages[-1].content.response)
-    # close the connection to the model client
-    await model_client.close()
+        # act on the label as soon as it arrives, before the thoughts are complete
+        async for message in custom_agent.run_stream(task="I am sad."):
+            if isinstance(message, PartialStructuredEvent) and "response" in message.new_fields:
+                print("Early response: ", message.fields["response"])
+            elif isinstance(message, StructuredMessage):
+                print("Thought: ", message.content.thoughts)
 
 
 # Note: If running inside a python script, use asyncio.run(main())
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
 # await main()
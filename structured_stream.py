@@ -0,0 +1,149 @@
+import json
+from typing import Any, Dict, List, Literal
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# autogen_agentchat
+from autogen_agentchat.messages import BaseAgentEvent
+
+# Incremental parsing of a streamed JSON object for agents with an `output_content_type`.
+# The fields of the object are validated one by one as soon as their values are complete,
+# so a short classification field is usable before a long text field has finished streaming.
+# The complete reply is parsed with the same leniency, see parse_structured.
+
+
+class PartialStructuredEvent(BaseAgentEvent):
+    """
+    An event with the fields of a structured response that are complete and valid so far.
+    """
+
+    fields: Dict[str, Any]
+    """All complete and validated fields so far, by name."""
+
+    new_fields: List[str]
+    """The fields completed since the previous event."""
+
+    full_message_id: str | None = None
+    """The id of the final StructuredMessage, like the streaming chunk events."""
+
+    type: Literal["PartialStructuredEvent"] = "PartialStructuredEvent"
+
+    def to_text(self) -> str:
+        return json.dumps({name: self.fields[name] for name in self.new_fields}, default=str)
+
+
+class StructuredStreamParser:
+    """
+    Feeds on the chunks of a streamed JSON object and returns the top-level fields of
+    `output_content_type` whose values are complete, each validated against its field type.
+
+    The text is scanned once: a field is parsed when the comma or closing brace after its
+    value arrives, so the cost of a chunk does not grow with the length of the response.
+
+    Args:
+        output_content_type (type[BaseModel]): The model of the structured response.
+    """
+
+    def __init__(self, output_content_type: type[BaseModel]) -> None:
+        self._adapters = {
+            name: TypeAdapter(field.annotation) for name, field in output_content_type.model_fields.items()
+        }
+        # the text of the current top-level "key": value pair
+        self._member: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.fields: Dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> List[str]:
+        """Consume a chunk and return the names of the fields it completed."""
+        completed: List[str] = []
+        for char in chunk:
+            if self._depth == 0:
+                # before the object, e.g. whitespace or a ```json fence
+                if char == "{":
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._member.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if self._depth == 1 and char in ",}":
+                name = self._complete_member()
+                if name is not None:
+                    completed.append(name)
+                if char == "}":
+                    self._depth = 0
+                continue
+            self._member.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+        return completed
+
+    def _complete_member(self) -> str | None:
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return None
+        try:
+            ((name, value),) = json.loads("{" + text + "}").items()
+        except (json.JSONDecodeError, ValueError):
+            return None
+        adapter = self._adapters.get(name)
+        if adapter is None:
+            return None
+        try:
+            self.fields[name] = adapter.validate_python(value)
+        except ValidationError:
+            return None
+        return name
+
+
+def extract_json_object(text: str) -> str | None:
+    """
+    The first top-level JSON object in `text`, skipping what comes before and after it, e.g. a
+    ```json fence or a closing remark, like :class:`StructuredStreamParser`. None if there is none.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start : index + 1]
+    return None
+
+
+def parse_structured(text: str, output_content_type: type[BaseModel]) -> BaseModel | None:
+    """The first JSON object in `text` validated as `output_content_type`, None if it is missing or invalid."""
+    candidate = extract_json_object(text)
+    if candidate is None:
+        return None
+    try:
+        return output_content_type.model_validate_json(candidate)
+    except ValidationError:
+        return None
@@ -1,8 +1,5 @@
-
-from dotenv import load_dotenv
-import os
-
 import asyncio
+from typing import List
 
 # autogen-agentchat
 from autogen_agentchat.agents import AssistantAgent
@@ -13,74 +10,95 @@ from autogen_agentchat.ui import Console
 
 # autogen_core
 from autogen_core  import CancellationToken
+from autogen_core.memory import Memory
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import ChatCompletionClient
+
+# local
+from document_store import DocumentStore, DocumentStoreMemory
+from model_contexts import DraftDiffChatCompletionContext
+from model_router import ModelRouter
+from termination import DraftConvergenceTermination
+
+# create the primary/critic team on the given model client
+def create_team(
+    model_client: ChatCompletionClient,
+    max_turns: int | None = None,
+    document_store: DocumentStore | None = None,
+    critic_client: ChatCompletionClient | None = None,
+    draft_diff: bool = False,
+) -> RoundRobinGroupChat:
+    # with a document store, both agents get the top-k research passages for the latest message
+    # instead of the whole document set
+    memory: List[Memory] | None = [DocumentStoreMemory(document_store, k=5)] if document_store is not None else None
+
+    # in diff mode, both agents keep the latest draft in full and the earlier drafts as diffs
+    def model_context() -> ChatCompletionContext | None:
+        return DraftDiffChatCompletionContext(draft_source="primary") if draft_diff else None
+
+    # create the primary agent
+    primary_agent = AssistantAgent(
+        name="primary",
+        model_client=model_client,
+        system_message="You are a helpful assistant. Please assist the user.",
+        model_context=model_context(),
+        memory=memory,
+        #model_client_stream=True,
+    )
 
-# autogen_ext
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-
-# load environment variables from .env file
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# create Gemini model client - OpenAIChatCompletionClient API
-model_client = OpenAIChatCompletionClient(
-    model = "gemini-1.5-flash-8b",
-    api_key = GEMINI_API_KEY
-)
-
-# create the primary agent
-primary_agent = AssistantAgent(
-    name="primary",
-    model_client=model_client,
-    system_message="You are a helpful assistant. Please assist the user.",
-    #model_client_stream=True,
-)
-
-# create the critic agent
-critic_agent = AssistantAgent(
-    name="critic",
-    model_client=model_client,
-    system_message="Provide constructive feedback to improve. Respond with 'APPROVE' to only when your feedbacks are addressed.",
-    #model_client_stream=True,
-)
+    # create the critic agent
+    # the critique and APPROVE turns can run on a faster model than the drafts
+    critic_agent = AssistantAgent(
+        name="critic",
+        model_client=critic_client or model_client,
+        system_message="Provide constructive feedback to improve. Respond with 'APPROVE' to only when your feedbacks are addressed.",
+        model_context=model_context(),
+        memory=memory,
+        #model_client_stream=True,
+    )
 
-# define a termination condition that stops the task if the critic approves. 
-text_termination = TextMentionTermination("APPROVE")
+    # define a termination condition that stops the task if the critic approves. 
+    text_termination = TextMentionTermination("APPROVE")
 
-# define an external termination condition that stop the team from outside
-external_termination = ExternalTermination()
+    # stop when the drafts of the primary agent barely change between critique rounds
+    convergence_termination = DraftConvergenceTermination("primary", threshold=0.95)
 
+    # define an external termination condition that stop the team from outside
+    external_termination = ExternalTermination()
 
-# create a team with the primary and critic agents
-team = RoundRobinGroupChat(
-    participants=[primary_agent, critic_agent],
-    termination_condition=text_termination | external_termination,
-)
+    # create a team with the primary and critic agents
+    return RoundRobinGroupChat(
+        participants=[primary_agent, critic_agent],
+        termination_condition=text_termination | convergence_termination | external_termination,
+        max_turns=max_turns,
+    )
 
 # Run the agent and stream the meessages to the console
 async def main() -> None:    
-    await team.reset()
-    #  run the groupchat team with the task of writing a poem about the sea
-    #async for message in team.run_stream(task="Write a short poem about the sea."):
-    #   if isinstance(message, TaskResult):
-    #       print("Stop Reason: ", message.stop_reason)
-    #   else:
-    #      print(message)
-    await Console(
-        team.run_stream(task="Write a short poem about the sea."),
-        output_stats=True)
-
-    # continue with a related task without resetting the team
-    await Console(
-        team.run_stream(task="Convert the poem to a haiku."),
-        output_stats=True
-    )
-    # close the connection to the model client
-    await model_client.close()
+    # the writer and critic models come from model_config.yaml,
+    # each wrapped with the response cache, so identical requests are not re-billed on re-runs
+    async with ModelRouter.from_yaml("model_config.yaml") as router:
+        team = create_team(router.client("writer"), critic_client=router.client("critic"))
+
+        await team.reset()
+        #  run the groupchat team with the task of writing a poem about the sea
+        #async for message in team.run_stream(task="Write a short poem about the sea."):
+        #   if isinstance(message, TaskResult):
+        #       print("Stop Reason: ", message.stop_reason)
+        #   else:
+        #      print(message)
+        await Console(
+            team.run_stream(task="Write a short poem about the sea."),
+            output_stats=True)
+
+        # continue with a related task without resetting the team
+        await Console(
+            team.run_stream(task="Convert the poem to a haiku."),
+            output_stats=True
+        )
 
 
 # Note: If running inside a python script, use asyncio.run(main())
 # await main()
-asyncio.run(main())
-
-
-
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+from difflib import SequenceMatcher
+from typing import Any, Iterator, List, Mapping, Sequence
+
+from pydantic import BaseModel
+from typing_extensions import Self
+
+# autogen_agentchat
+from autogen_agentchat.base import TerminatedException, TerminationCondition
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, StopMessage
+
+# autogen_core
+from autogen_core import Component
+
+# Termination conditions for the writer/critic teams, combined with the existing ones via `|`:
+#
+#   termination_condition = TextMentionTermination("APPROVE") | DraftConvergenceTermination("primary")
+
+
+def draft_similarity(previous: str, current: str) -> float:
+    """
+    The similarity of two drafts between 0 and 1, the similarity ratio of their word sequences:
+    twice the number of words in matching blocks over the total number of words in both drafts,
+    see :meth:`difflib.SequenceMatcher.ratio`. It is not an edit distance.
+    """
+    if previous == current:
+        return 1.0
+    return SequenceMatcher(None, previous.split(), current.split(), autojunk=False).ratio()
+
+
+class DraftConvergenceTerminationState(BaseModel):
+    last_draft: str | None = None
+    total_token_count: int = 0
+    type: str = "DraftConvergenceTerminationState"
+
+
+class DraftConvergenceTerminationConfig(BaseModel):
+    source: str
+    threshold: float
+    max_total_token: int | None
+
+
+class DraftConvergenceTermination(TerminationCondition, Component[DraftConvergenceTerminationConfig]):
+    """
+    Terminate the conversation when the drafts of the writer agent stop changing, or when
+    the token budget of the run is used up.
+
+    Every message from `source` is a draft. When a draft is at least `threshold` similar to the
+    previous one (see :func:`draft_similarity`), further critique rounds are not worth their cost
+    and the run stops, even if the critic never replies "APPROVE".
+
+    Args:
+        source (str): The name of the agent writing the drafts.
+        threshold (float): The similarity of two successive drafts at which the drafts have converged.
+        max_total_token (int | None): The token budget of the run, counted over all messages
+            with model usage. None for no budget.
+    """
+
+    component_config_schema = DraftConvergenceTerminationConfig
+    component_provider_override = "termination.DraftConvergenceTermination"
+
+    def __init__(self, source: str, threshold: float = 0.95, max_total_token: int | None = None) -> None:
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self._source = source
+        self._threshold = threshold
+        self._max_total_token = max_total_token
+        self._last_draft: str | None = None
+        self._total_token_count = 0
+        self._terminated = False
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    async def __call__(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> StopMessage | None:
+        if self._terminated:
+            raise TerminatedException("Termination condition has already been reached")
+        for message in messages:
+            if message.models_usage is not None:
+                self._total_token_count += message.models_usage.prompt_tokens + message.models_usage.completion_tokens
+            if not isinstance(message, BaseChatMessage) or message.source != self._source:
+                continue
+            draft = message.to_text()
+            if self._last_draft is not None:
+                similarity = draft_similarity(self._last_draft, draft)
+                if similarity >= self._threshold:
+                    self._terminated = True
+                    return StopMessage(
+                        content=f"Drafts of '{self._source}' converged, similarity {similarity:.3f} >= {self._threshold}.",
+                        source="DraftConvergenceTermination",
+                    )
+            self._last_draft = draft
+        if self._max_total_token is not None and self._total_token_count >= self._max_total_token:
+            self._terminated = True
+            return StopMessage(
+                content=f"Token budget reached, total token count: {self._total_token_count}.",
+                source="DraftConvergenceTermination",
+            )
+        return None
+
+    async def reset(self) -> None:
+        self._last_draft = None
+        self._total_token_count = 0
+        self._terminated = False
+
+    async def save_state(self) -> Mapping[str, Any]:
+        """The previous draft and the token count, see :func:`save_termination_state`."""
+        return DraftConvergenceTerminationState(
+            last_draft=self._last_draft, total_token_count=self._total_token_count
+        ).model_dump()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        loaded = DraftConvergenceTerminationState.model_validate(state)
+        self._last_draft = loaded.last_draft
+        self._total_token_count = loaded.total_token_count
+        self._terminated = False
+
+    def _to_config(self) -> DraftConvergenceTerminationConfig:
+        return DraftConvergenceTerminationConfig(
+            source=self._source,
+            threshold=self._threshold,
+            max_total_token=self._max_total_token,
+        )
+
+    @classmethod
+    def _from_config(cls, config: DraftConvergenceTerminationConfig) -> Self:
+        return cls(
+            source=config.source,
+            threshold=config.threshold,
+            max_total_token=config.max_total_token,
+        )
+
+
+def _leaf_conditions(condition: TerminationCondition) -> Iterator[TerminationCondition]:
+    # the conditions combined with `|` and `&`, in order
+    combined = getattr(condition, "_conditions", None)
+    if combined is None:
+        yield condition
+        return
+    for inner in combined:
+        yield from _leaf_conditions(inner)
+
+
+async def save_termination_state(condition: TerminationCondition) -> List[Mapping[str, Any] | None]:
+    """
+    The state of every condition in `condition` that has one, None for the others.
+
+    A team resets its termination condition whenever it stops, also on its turn limit, so a team
+    stepped with `max_turns=1` has to carry the state of the condition from one step to the next.
+    """
+    return [
+        await leaf.save_state() if hasattr(leaf, "save_state") else None  # type: ignore[attr-defined]
+        for leaf in _leaf_conditions(condition)
+    ]
+
+
+async def load_termination_state(condition: TerminationCondition, states: Sequence[Mapping[str, Any] | None]) -> None:
+    """Load the states saved by :func:`save_termination_state` into the same condition."""
+    for leaf, state in zip(_leaf_conditions(condition), states, strict=True):
+        if state is not None:
+            await leaf.load_state(state)  # type: ignore[attr-defined]
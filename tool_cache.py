@@ -0,0 +1,144 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+# autogen_core
+from autogen_core import CacheStore
+
+# local
+from response_cache import LRUCacheStore
+
+# A shared cache for the results of agent tools.
+#
+#   @cached_tool(ttl_seconds=600)
+#   async def get_weather(city: str) -> str: ...
+#
+# The decorated function keeps its name, signature and docstring, so it is passed to
+# AssistantAgent(tools=[...]) like before. Identical calls from any agent or team in the process
+# share one result, and concurrent identical calls share one execution.
+
+R = TypeVar("R")
+
+
+class ToolCacheStats(BaseModel):
+    """The cache statistics of one tool."""
+
+    hits: int = 0
+    misses: int = 0
+    # calls that waited for an identical call already running instead of running the tool
+    coalesced: int = 0
+    errors: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / calls if calls else 0.0
+
+
+class ToolCache:
+    """
+    Memoizes the results of async tool functions, with an LRU store and a time-to-live per tool,
+    and coalesces concurrent identical calls. Failed calls are not cached.
+
+    Args:
+        store (CacheStore | None): Where results are kept, an :class:`response_cache.LRUCacheStore`
+            of `max_entries` by default.
+        max_entries (int): The size of the default store.
+    """
+
+    def __init__(self, store: CacheStore[Tuple[float, Any]] | None = None, max_entries: int = 1024) -> None:
+        self._store: CacheStore[Tuple[float, Any]] = store if store is not None else LRUCacheStore(max_entries)
+        # tool name -> the cached function
+        self.tools: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._stats: Dict[str, ToolCacheStats] = {}
+        self._in_flight: Dict[str, asyncio.Task[Any]] = {}
+
+    def tool(
+        self,
+        func: Callable[..., Awaitable[R]] | None = None,
+        *,
+        name: str | None = None,
+        ttl_seconds: float | None = None,
+        key: Callable[..., Any] | None = None,
+    ) -> Any:
+        """
+        Decorate an async tool function, with or without arguments.
+
+        Args:
+            name (str | None): The name the results are cached under, the function name by default.
+            ttl_seconds (float | None): How long a result is reused, None until it is evicted.
+            key (Callable | None): Maps the call arguments to the value identifying the call,
+                e.g. to treat near-identical queries as one. All arguments by default.
+        """
+
+        def decorate(func: Callable[..., Awaitable[R]]) -> Callable[..., Awaitable[R]]:
+            if not inspect.iscoroutinefunction(func):
+                raise TypeError(f"{func.__name__} is not an async function.")
+            tool_name = name or func.__name__
+            signature = inspect.signature(func)
+            self._stats.setdefault(tool_name, ToolCacheStats())
+
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> R:
+                if key is not None:
+                    identity = key(*args, **kwargs)
+                else:
+                    bound = signature.bind(*args, **kwargs)
+                    bound.apply_defaults()
+                    identity = bound.arguments
+                cache_key = self._key(tool_name, identity)
+                return await self._call(tool_name, cache_key, ttl_seconds, lambda: func(*args, **kwargs))
+
+            self.tools[tool_name] = wrapper
+            return wrapper
+
+        return decorate(func) if func is not None else decorate
+
+    @staticmethod
+    def _key(tool_name: str, identity: Any) -> str:
+        serialized = json.dumps(identity, sort_keys=True, default=str)
+        return f"{tool_name}:{hashlib.sha256(serialized.encode('utf-8')).hexdigest()}"
+
+    async def _call(self, tool_name: str, cache_key: str, ttl_seconds: float | None, run: Callable[[], Awaitable[R]]) -> R:
+        stats = self._stats[tool_name]
+        entry = self._store.get(cache_key)
+        if entry is not None and (ttl_seconds is None or time.monotonic() - entry[0] <= ttl_seconds):
+            stats.hits += 1
+            return entry[1]
+        task = self._in_flight.get(cache_key)
+        if task is not None:
+            stats.coalesced += 1
+        else:
+            stats.misses += 1
+            task = asyncio.ensure_future(self._run(tool_name, cache_key, run))
+            # retrieve the error of a call that every caller stopped waiting for
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._in_flight[cache_key] = task
+        # a caller that is cancelled does not cancel the call the other callers wait for
+        return await asyncio.shield(task)
+
+    async def _run(self, tool_name: str, cache_key: str, run: Callable[[], Awaitable[R]]) -> R:
+        try:
+            result = await run()
+        except BaseException:
+            self._stats[tool_name].errors += 1
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+        self._store.set(cache_key, (time.monotonic(), result))
+        return result
+
+    def stats(self) -> Dict[str, ToolCacheStats]:
+        """The statistics of every cached tool, by name."""
+        return dict(self._stats)
+
+
+# the cache shared by all tools of the process
+tool_cache = ToolCache()
+cached_tool = tool_cache.tool
@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+# autogen-agentchat
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage
+
+# autogen_core
+from autogen_core.models import ChatCompletionClient
+
+# local
+from batch_runner import create_model_client, read_tasks, summarize_result
+from client_pool import ClientPool
+from clients import DEFAULT_MODEL
+from durable_run import DurableTeamRun
+from fake_client import FakeChatCompletionClient
+from team1 import create_team
+
+# Worker-pool mode: essay jobs go into a sqlite queue, and N worker processes, each with its own
+# event loop, claim and run them, so all cores are used. Results are written back to the queue
+# database and every job checkpoints its team after each turn into a shared directory, so a job
+# stopped by a drain or a crashed worker resumes from its last finished turn on any worker.
+#
+#   python worker_pool.py submit tasks.jsonl
+#   python worker_pool.py run --workers 4
+#   python worker_pool.py results --output results.jsonl
+
+
+class JobQueue:
+    """
+    A job queue in a sqlite database, safe to share between processes.
+
+    A claimed job is leased to its worker for `lease_seconds`; the worker renews the lease while
+    the job runs. A job whose lease expired, because its worker died, can be claimed again.
+
+    Args:
+        path (str): The sqlite database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # autocommit mode, transactions are started explicitly where they are needed
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, task TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued', "
+            "worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def submit(self, job_id: str, task: str) -> bool:
+        """Queue a job, return False if a job with this id already exists."""
+        now = time.time()
+        cursor = self._connection.execute(
+            "INSERT OR IGNORE INTO jobs (id, task, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (job_id, task, now, now),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, worker: str, lease_seconds: float = 120.0) -> Tuple[str, str] | None:
+        """Claim the oldest queued job, or one whose lease expired, and return its id and task."""
+        now = time.time()
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._connection.execute(
+                "SELECT id, task FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_until = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (worker, now + lease_seconds, now, row[0]),
+                )
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        return (row[0], row[1]) if row is not None else None
+
+    def renew(self, job_id: str, worker: str, lease_seconds: float = 120.0) -> bool:
+        """Extend the lease of a running job, return False if the worker lost it."""
+        cursor = self._connection.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        """Record the result of a job, return False if the worker lost its lease and the result is dropped."""
+        return self._finish(job_id, worker, "done", result=json.dumps(result))
+
+    def fail(self, job_id: str, worker: str, error: str, max_attempts: int = 3) -> bool:
+        """
+        Record a failure, the job is queued again until it has been attempted `max_attempts` times.
+        Returns False if the worker lost its lease.
+        """
+        attempts = self._connection.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        return self._finish(job_id, worker, "failed" if attempts >= max_attempts else "queued", error=error)
+
+    def release(self, job_id: str, worker: str) -> bool:
+        """
+        Put a running job back in the queue without counting the attempt, e.g. on drain.
+        Returns False if the worker lost its lease.
+        """
+        cursor = self._connection.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1, "
+            "updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def _finish(
+        self, job_id: str, worker: str, status: str, result: str | None = None, error: str | None = None
+    ) -> bool:
+        # only the worker holding the lease may finish a job, after an expiry another worker may own it
+        cursor = self._connection.execute(
+            "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, lease_until = NULL, "
+            "updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, result, error, time.time(), job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def counts(self) -> Dict[str, int]:
+        """The number of jobs by status."""
+        return dict(self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def pending(self) -> int:
+        """The number of jobs that are queued or running."""
+        counts = self.counts()
+        return counts.get("queued", 0) + counts.get("running", 0)
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """The records of the finished jobs, failed jobs with their error."""
+        for job_id, task, status, result, error in self._connection.execute(
+            "SELECT id, task, status, result, error FROM jobs WHERE status IN ('done', 'failed') ORDER BY created_at"
+        ):
+            yield json.loads(result) if status == "done" else {"id": job_id, "task": task, "error": error}
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+async def run_job(
+    queue: JobQueue,
+    worker: str,
+    job_id: str,
+    task: str,
+    model_client: ChatCompletionClient,
+    checkpoint_dir: str,
+    max_turns: int,
+    lease_seconds: float,
+) -> None:
+    """
+    Run one job on a durable team, renewing its lease, and record its result.
+    If the job is cancelled it is released and later resumes from its checkpoint. If its lease is
+    lost to another worker the job stops and leaves the job to its new owner.
+    """
+    run = DurableTeamRun(
+        create_team(model_client, max_turns=1), os.path.join(checkpoint_dir, f"{job_id}.ckpt"), max_turns=max_turns
+    )
+
+    job = asyncio.current_task()
+    lease_lost = False
+
+    async def keep_lease() -> None:
+        nonlocal lease_lost
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not queue.renew(job_id, worker, lease_seconds):
+                # the lease expired and the job was reclaimed, the new owner runs it
+                lease_lost = True
+                assert job is not None
+                job.cancel()
+                return
+
+    lease = asyncio.create_task(keep_lease())
+    start = time.perf_counter()
+    try:
+        messages: List[BaseAgentEvent | BaseChatMessage] = []
+        result: TaskResult | None = None
+        async for message in run.run_stream(task):
+            if isinstance(message, TaskResult):
+                result = message
+            else:
+                messages.append(message)
+        assert result is not None, "The run should have returned a task result."
+        # a resumed run only streams its own turns, the record counts those
+        record = summarize_result(
+            job_id, task, TaskResult(messages=messages, stop_reason=result.stop_reason), time.perf_counter() - start
+        )
+        record["completed_turns"] = run.completed_turns
+        if not queue.complete(job_id, worker, record):
+            print(f"{worker}: lost the lease of job {job_id}, its result is dropped")
+    except asyncio.CancelledError:
+        if lease_lost:
+            print(f"{worker}: lost the lease of job {job_id}, stopped running it")
+            return
+        queue.release(job_id, worker)
+        raise
+    except Exception as e:
+        if not queue.fail(job_id, worker, f"{type(e).__name__}: {e}"):
+            print(f"{worker}: lost the lease of job {job_id}, its error is dropped")
+    finally:
+        lease.cancel()
+
+
+async def worker_loop(
+    worker: str,
+    queue_path: str,
+    checkpoint_dir: str,
+    drain: Any,
+    model: str,
+    concurrency: int,
+    max_turns: int,
+    lease_seconds: float,
+    drain_timeout: float,
+    fake_latency: float | None,
+) -> None:
+    """
+    Claim and run jobs, up to `concurrency` at a time, until the queue is empty or `drain` is set.
+    On drain, no new jobs are claimed; running jobs get `drain_timeout` seconds to finish and are
+    then cancelled and released to the queue.
+    With `fake_latency`, the offline fake model client with this latency is used instead of the model.
+    """
+    queue = JobQueue(queue_path)
+    # the worker's teams share its pool's connections; create_model_client adds the one response cache
+    pool = ClientPool(cache=False)
+    model_client: ChatCompletionClient
+    if fake_latency is not None:
+        model_client = FakeChatCompletionClient(latency=fake_latency)
+    else:
+        model_client = create_model_client(model, pool=pool)
+    running: set[asyncio.Task[None]] = set()
+    try:
+        while not drain.is_set():
+            while len(running) < concurrency and not drain.is_set():
+                job = queue.claim(worker, lease_seconds)
+                if job is None:
+                    break
+                running.add(asyncio.create_task(
+                    run_job(queue, worker, job[0], job[1], model_client, checkpoint_dir, max_turns, lease_seconds)
+                ))
+            if not running:
+                if not queue.pending():
+                    return
+                # the remaining jobs are leased to other workers, wait for them to finish or expire
+                await asyncio.sleep(1.0)
+                continue
+            done, running = await asyncio.wait(running, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+        if running:
+            _, unfinished = await asyncio.wait(running, timeout=drain_timeout)
+            for job_task in unfinished:
+                job_task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+    finally:
+        await model_client.close()
+        await pool.aclose()
+        queue.close()
+
+
+def _worker_process(worker: str, drain: Any, options: Dict[str, Any]) -> None:
+    # the parent handles Ctrl+C for the whole pool and sets `drain`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_loop(worker, drain=drain, **options))
+
+
+def run_pool(workers: int, **options: Any) -> None:
+    """
+    Run `workers` worker processes until the queue is empty. SIGINT or SIGTERM drains the pool:
+    the workers stop claiming jobs and release the jobs they cannot finish in time.
+    """
+    context = multiprocessing.get_context("spawn")
+    drain = context.Event()
+    os.makedirs(options["checkpoint_dir"], exist_ok=True)
+    processes = [
+        context.Process(target=_worker_process, args=(f"{socket.gethostname()}-{os.getpid()}-{index}", drain, options))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def request_drain(signum: int, frame: Any) -> None:
+        print("draining, waiting for the running jobs ...")
+        drain.set()
+
+    previous = {sig: signal.signal(sig, request_drain) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run essay jobs from a shared sqlite queue on a pool of worker processes.")
+    parser.add_argument("--queue", default="jobs.db", help="sqlite database of the job queue and the results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="queue the tasks of a JSONL file")
+    submit.add_argument("tasks", help="JSONL file with one {\"id\": ..., \"task\": ...} object per line")
+
+    run = commands.add_parser("run", help="run the queued jobs")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    run.add_argument("--concurrency", type=int, default=4, help="jobs running at once in each worker")
+    run.add_argument("--checkpoints", default="checkpoints", help="shared directory of the job checkpoints")
+    run.add_argument("--max-turns", type=int, default=20)
+    run.add_argument("--model", default=DEFAULT_MODEL)
+    run.add_argument("--lease", type=float, default=120.0, help="seconds a job stays leased to a worker without renewal")
+    run.add_argument("--drain-timeout", type=float, default=30.0, help="seconds running jobs get to finish on drain")
+    run.add_argument("--fake", type=float, nargs="?", const=0.0, help="use the offline fake model client with this latency")
+
+    results = commands.add_parser("results", help="export the finished jobs")
+    results.add_argument("--output", default="results.jsonl", help="JSONL file the results are written to")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        queue = JobQueue(args.queue)
+        added = sum(queue.submit(str(entry["id"]), entry["task"]) for entry in read_tasks(args.tasks))
+        print(f"queued {added} jobs, {queue.counts()}")
+    elif args.command == "run":
+        run_pool(
+            args.workers,
+            queue_path=args.queue,
+            checkpoint_dir=args.checkpoints,
+            model=args.model,
+            concurrency=args.concurrency,
+            max_turns=args.max_turns,
+            lease_seconds=args.lease,
+            drain_timeout=args.drain_timeout,
+            fake_latency=args.fake,
+        )
+        print(JobQueue(args.queue).counts())
+    else:
+        queue = JobQueue(args.queue)
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            for record in queue.results():
+                output_file.write(json.dumps(record) + "\n")
+        print(queue.counts())
+
+
+if __name__ == "__main__":
+    main()